@@ -0,0 +1,98 @@
+import os
+
+
+class AsyncSerialTransport:
+    """
+    基于 asyncio 事件循环的串口读写传输。
+    将已打开串口的文件描述符以非阻塞方式注册到事件循环（loop.add_reader / add_writer），
+    数据到达时直接在事件循环线程中回调，不需要额外的读取线程、线程间切换或锁。
+    仅支持提供 fileno() 且事件循环支持 add_reader 的平台（Linux/macOS）。
+    """
+
+    READ_CHUNK = 65536
+
+    def __init__(self, port, loop, on_data, on_error):
+        self._port = port
+        self._loop = loop
+        self._on_data = on_data
+        self._on_error = on_error
+        self._fd = port.fileno()
+        self._write_buffer = bytearray()
+        self._writing = False
+        self._closed = False
+
+    def start(self):
+        """注册读回调，必须在事件循环线程中调用"""
+        os.set_blocking(self._fd, False)
+        self._loop.add_reader(self._fd, self._on_readable)
+
+    def stop(self):
+        """注销读写回调，必须在事件循环线程中调用"""
+        if self._closed:
+            return
+        self._closed = True
+        self._loop.remove_reader(self._fd)
+        if self._writing:
+            self._loop.remove_writer(self._fd)
+            self._writing = False
+        self._write_buffer.clear()
+
+    def write(self, data):
+        """
+        非阻塞写入：能立即写出的部分直接写出，剩余部分缓存并在可写时继续发送。
+        必须在事件循环线程中调用。
+        """
+        if self._closed:
+            return False
+        if self._writing:
+            self._write_buffer += data
+            return True
+        try:
+            written = os.write(self._fd, data)
+        except BlockingIOError:
+            written = 0
+        except OSError as e:
+            self._fail(e)
+            return False
+        if written < len(data):
+            self._write_buffer += data[written:]
+            self._loop.add_writer(self._fd, self._on_writable)
+            self._writing = True
+        return True
+
+    @property
+    def pending_write_bytes(self):
+        """尚未写出的缓存字节数"""
+        return len(self._write_buffer)
+
+    def _on_readable(self):
+        try:
+            data = os.read(self._fd, self.READ_CHUNK)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self._fail(e)
+            return
+        if not data:
+            # 设备被拔出等情况下文件描述符返回 EOF
+            self._fail(EOFError("设备已断开"))
+            return
+        self._on_data(data)
+
+    def _on_writable(self):
+        try:
+            written = os.write(self._fd, self._write_buffer)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self._fail(e)
+            return
+        del self._write_buffer[:written]
+        if not self._write_buffer:
+            self._loop.remove_writer(self._fd)
+            self._writing = False
+
+    def _fail(self, exc):
+        self.stop()
+        # 推迟到下一轮事件循环回调，避免在调用方（例如持有锁的 write）中重入
+        self._loop.call_soon(self._on_error, self, exc)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+日志搜索基准测试: 对比有/无三元组索引时的写入速度和 query_serial_logs 的搜索耗时，
+以及新到达少量行后重复查询（命中增量结果缓存）的耗时
+
+用法:
+    python bench_log_search.py                   # 默认 10 万和 100 万行
+    python bench_log_search.py --lines 100000 --repeat 5
+"""
+
+import argparse
+import random
+import time
+
+from service import SerialService
+
+# 模拟设备日志: 大量周期性输出，少量罕见事件
+_NOISE = [
+    "I (%d) sensor: temp=%d.%d C humidity=%d%%",
+    "D (%d) wifi: rssi=-%d channel=%d",
+    "D (%d) heap: free=%d min=%d",
+    "I (%d) mqtt: publish topic=dev/%d/state len=%d",
+]
+_RARE = [
+    "E (%d) wifi: connect failed reason=%d",
+    "W (%d) ota: checksum mismatch block=%d",
+]
+
+QUERIES = [
+    ("罕见字面量", "checksum mismatch"),
+    ("忽略大小写", "(?i)CONNECT FAILED"),
+    ("分支", "reason=(201|202)"),
+    ("常见字面量", "sensor: temp"),
+    ("无字面量", r"^\w \(\d+\)"),
+]
+
+
+def generate_lines(count, seed=1):
+    rng = random.Random(seed)
+    for i in range(count):
+        if rng.random() < 0.0005:
+            template = rng.choice(_RARE)
+        else:
+            template = rng.choice(_NOISE)
+        args = tuple(rng.randrange(1000) for _ in range(template.count('%d')))
+        yield (template % ((i,) + args[1:])).encode()
+
+
+def run(lines, indexed, repeat):
+    service = SerialService(max_log_lines=lines, log_search_index=indexed)
+    service.show_timestamp = False
+    data = list(generate_lines(lines))
+    start = time.perf_counter()
+    for line in data:
+        service._append_log(line)
+    ingest = time.perf_counter() - start
+
+    results = {}
+    for name, pattern in QUERIES:
+        best = None
+        for _ in range(repeat):
+            service._search_cache.clear()  # 冷查询: 不使用上次的结果
+            start = time.perf_counter()
+            matches = service.search_logs(pattern, max_results=lines)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = (best, len(matches))
+
+    # 增量查询: 每次新到达 100 行后以工具默认的结果数重复所有查询
+    for _name, pattern in QUERIES:
+        service.search_logs(pattern)
+    incremental = 0.0
+    for line in list(generate_lines(100 * repeat, seed=2)):
+        service._append_log(line)
+        if service._log_store.next_seq % 100 == 0:
+            start = time.perf_counter()
+            for _name, pattern in QUERIES:
+                service.search_logs(pattern)
+            incremental += time.perf_counter() - start
+    results["增量重复"] = (incremental / repeat / len(QUERIES), None)
+    return ingest, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="日志搜索基准测试")
+    parser.add_argument("--lines", type=int, nargs="+", default=[100_000, 1_000_000],
+                        help="缓冲区行数（可指定多个）")
+    parser.add_argument("--repeat", type=int, default=3, help="每个查询重复次数（取最快一次）")
+    args = parser.parse_args()
+
+    for lines in args.lines:
+        print(f"\n=== {lines} 行 ===")
+        baseline = None
+        for indexed in (False, True):
+            ingest, results = run(lines, indexed, args.repeat)
+            label = "三元组索引" if indexed else "全量扫描"
+            print(f"[{label}] 写入 {lines / ingest:,.0f} 行/秒")
+            for name, (elapsed, count) in results.items():
+                speedup = ""
+                if baseline is not None:
+                    speedup = f"  加速 {baseline[name][0] / elapsed:.1f}x"
+                matched = "" if count is None else f"  匹配 {count}"
+                print(f"  {name:<8} {elapsed * 1000:9.2f} ms{matched}{speedup}")
+            baseline = results
+
+
+if __name__ == "__main__":
+    main()
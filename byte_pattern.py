@@ -0,0 +1,66 @@
+import re
+
+# 模式中允许出现的分隔符: 空白、逗号、冒号、短横线，以及每个字节前可选的 0x
+_SEPARATORS_RE = re.compile(r'0[xX](?=[0-9a-fA-F?]{2})|[\s,:\-]+')
+
+
+class BytePattern:
+    """
+    以十六进制表示的字节模式，?? 表示任意一个字节，例如 "AA 55 ?? 01" 或 "0xAA,0x55,??,0x01"。
+    直接在原始字节上匹配（不把数据转换为十六进制文本，因此不会出现跨半字节的误匹配），
+    返回所有（可重叠的）匹配起始偏移。
+    """
+
+    def __init__(self, text):
+        self.text = text
+        digits = _SEPARATORS_RE.sub('', text)
+        if not digits or len(digits) % 2:
+            raise ValueError(f"无效的字节模式: {text!r}（需要成对的十六进制数字或 ??）")
+        tokens = []
+        for i in range(0, len(digits), 2):
+            pair = digits[i:i + 2]
+            if pair == '??':
+                tokens.append(None)
+                continue
+            try:
+                tokens.append(int(pair, 16))
+            except ValueError:
+                raise ValueError(f"无效的字节模式: {text!r}（无法解析 {pair!r}）")
+        self.length = len(tokens)
+
+        # 最长的固定片段用于快速排除不可能匹配的行（整个模式都是 ?? 时为空，不排除）
+        runs = []
+        start = None
+        for i, token in enumerate(tokens + [None]):
+            if token is not None and start is None:
+                start = i
+            elif token is None and start is not None:
+                runs.append(bytes(tokens[start:i]))
+                start = None
+        self._anchor = max(runs, key=len, default=b'')
+
+        if None in tokens:
+            # 零宽前瞻包住整个模式，finditer 在每个位置都尝试匹配，因此能找到重叠的匹配；?? 用 DOTALL 的 . 匹配任意字节
+            self._regex = re.compile(
+                b'(?=' + b''.join(b'.' if t is None else re.escape(bytes([t])) for t in tokens) + b')', re.DOTALL)
+        else:
+            self._regex = None
+
+    @property
+    def has_wildcards(self):
+        return self._regex is not None
+
+    def finditer(self, data):
+        """依次返回 data 中所有匹配的起始偏移（允许重叠）"""
+        anchor = self._anchor
+        if self._regex is None:
+            # 无通配符: 直接用 bytes.find 查找
+            pos = data.find(anchor)
+            while pos >= 0:
+                yield pos
+                pos = data.find(anchor, pos + 1)
+            return
+        if anchor and anchor not in data:
+            return
+        for match in self._regex.finditer(data):
+            yield match.start()
@@ -3,6 +3,7 @@ import os
 
 CONFIG_FILE = 'config.json'
 PRESETS_FILE = 'presets.json'
+SCRIPTS_FILE = 'scripts.json'
 
 DEFAULT_CONFIG = {
     "mcp_host": "127.0.0.1",
@@ -10,7 +11,20 @@ DEFAULT_CONFIG = {
     "last_serial_port": "",
     "last_baud_rate": 115200,
     "show_timestamp": True,
-    "language": "English"
+    "language": "English",
+    "line_idle_timeout": 0.2,
+    "max_log_lines": 1000,
+    "log_byte_budget": None,
+    "log_max_age": None,
+    "log_warm_budget": None,
+    "log_warm_codec": "zlib",
+    "log_retention_classes": [],
+    "log_dedup": "off",
+    "log_search_index": False,
+    "search_time_budget": 5.0,
+    "send_queue_size": 256,
+    "write_byte_delay": 0.0,
+    "write_line_delay": 0.0
 }
 
 DEFAULT_PRESETS = [
@@ -20,6 +34,15 @@ DEFAULT_PRESETS = [
     {"name": "Version", "command": "AT+GMR"}
 ]
 
+DEFAULT_SCRIPTS = [
+    {"name": "AT Check", "steps": [{"send": "AT"}, {"expect": "^OK$", "timeout": 2}]},
+    {"name": "Version", "steps": [
+        {"send": "AT+GMR"},
+        {"capture": r"AT version:(\S+)", "var": "version", "timeout": 2},
+        {"expect": "^OK$", "timeout": 2}
+    ]}
+]
+
 def load_config():
     """加载主配置文件，如果文件不存在则创建。"""
     if not os.path.exists(CONFIG_FILE):
@@ -66,6 +89,27 @@ def save_presets(presets_data):
     except IOError as e:
         print(f"Error saving presets file: {e}")
 
+def load_scripts():
+    """加载命令脚本文件，如果文件不存在则创建。"""
+    if not os.path.exists(SCRIPTS_FILE):
+        save_scripts(DEFAULT_SCRIPTS)
+        return DEFAULT_SCRIPTS
+
+    try:
+        with open(SCRIPTS_FILE, 'r') as f:
+            scripts = json.load(f)
+            return scripts
+    except (json.JSONDecodeError, IOError):
+        return DEFAULT_SCRIPTS
+
+def save_scripts(scripts_data):
+    """保存命令脚本文件。"""
+    try:
+        with open(SCRIPTS_FILE, 'w') as f:
+            json.dump(scripts_data, f, indent=4)
+    except IOError as e:
+        print(f"Error saving scripts file: {e}")
+
 if __name__ == '__main__':
     # Initialize config files if they don't exist
     print("Loading initial config...")
@@ -74,4 +118,8 @@ if __name__ == '__main__':
 
     print("\nLoading initial presets...")
     presets = load_presets()
-    print(f"Loaded presets: {presets}") 
\ No newline at end of file
+    print(f"Loaded presets: {presets}")
+
+    print("\nLoading initial scripts...")
+    scripts = load_scripts()
+    print(f"Loaded scripts: {scripts}")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+命令往返延迟分析: 按固定间隔多次发送同一条命令，以响应模式识别每次的响应，
+统计延迟分布（min/p50/p90/p99/max/抖动），结果可导出为 JSON 以便比较不同固件版本
+
+用法:
+    python latency_profiler.py --port /dev/ttyUSB0 --command "AT+GMR" --pattern "^OK$"
+    python latency_profiler.py --port COM3 --command "dbg remind all" --count 50 --interval 0.5 --json gmr.json
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+
+# 单次分析最多发送的次数
+MAX_COUNT = 1000
+
+
+def percentile(sorted_values, fraction):
+    """已排序样本的分位数（相邻样本间线性插值）"""
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(samples_ms):
+    """
+    汇总延迟样本（毫秒，按发送顺序）。
+    jitter 为相邻两次延迟之差的绝对值的平均值，stdev 为标准差；没有样本时各项为 None。
+    """
+    keys = ("min", "p50", "p90", "p99", "max", "mean", "stdev", "jitter")
+    if not samples_ms:
+        return dict.fromkeys(keys)
+    ordered = sorted(samples_ms)
+    diffs = [abs(b - a) for a, b in zip(samples_ms, samples_ms[1:])]
+    values = (ordered[0], percentile(ordered, 0.5), percentile(ordered, 0.9), percentile(ordered, 0.99),
+              ordered[-1], statistics.fmean(samples_ms), statistics.pstdev(samples_ms),
+              statistics.fmean(diffs) if diffs else 0.0)
+    return {key: round(value, 3) for key, value in zip(keys, values)}
+
+
+async def profile_command(service, command, count=10, interval=0.2, response_pattern=None, timeout=2.0,
+                          is_hex=False, add_newline=True):
+    """
+    经 service.send_and_collect 发送 command count 次，相邻两次发送的开始时间间隔 interval 秒。
+    给出 response_pattern 时延迟为写入到匹配行到达的时间，否则为写入到首行到达的时间（以空闲间隔判定响应结束）。
+    超时或写入失败的次数分别记入 timeouts / send_failures，不计入延迟分布。
+    """
+    if not 0 < count <= MAX_COUNT:
+        raise ValueError(f"发送次数必须在 1 到 {MAX_COUNT} 之间")
+    if interval < 0 or timeout <= 0:
+        raise ValueError("发送间隔不能为负数，超时时间必须为正数")
+    samples = []
+    timeouts = failures = 0
+    started = time.time()
+    loop = asyncio.get_running_loop()
+    next_send = loop.time()
+    for _ in range(count):
+        await asyncio.sleep(max(0.0, next_send - loop.time()))
+        next_send = loop.time() + interval
+        response = await service.send_and_collect(command, is_hex, add_newline, timeout,
+                                                  end_pattern=response_pattern, max_lines=0)
+        if not response.sent:
+            failures += 1
+        elif response_pattern is not None:
+            if response.completed_by == "end_pattern":
+                samples.append(response.completion * 1000)
+            else:
+                timeouts += 1
+        elif response.ttfb is not None:
+            samples.append(response.ttfb * 1000)
+        else:
+            timeouts += 1
+    return {
+        "command": command,
+        "response_pattern": response_pattern,
+        "count": count,
+        "interval": interval,
+        "timeout": timeout,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+        "responses": len(samples),
+        "timeouts": timeouts,
+        "send_failures": failures,
+        "latency_ms": summarize(samples),
+        "samples_ms": [round(sample, 3) for sample in samples],
+    }
+
+
+def format_report(result):
+    """将分析结果格式化为可读的文本"""
+    stats = result["latency_ms"]
+    lines = [f"命令: {result['command']!r}  发送 {result['count']} 次，响应 {result['responses']} 次，"
+             f"超时 {result['timeouts']} 次，发送失败 {result['send_failures']} 次"]
+    if stats["min"] is not None:
+        lines.append("延迟 (ms): " + "  ".join(f"{key}={stats[key]:.3f}" for key in
+                                               ("min", "p50", "p90", "p99", "max", "jitter")))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="命令往返延迟分析")
+    parser.add_argument("--port", required=True, help="串口名称，如 /dev/ttyUSB0 或 COM3")
+    parser.add_argument("--baud", type=int, default=115200, help="波特率")
+    parser.add_argument("--command", required=True, help="要发送的命令")
+    parser.add_argument("--pattern", help="响应的正则表达式（匹配行视为响应完成）；省略时以首行到达计")
+    parser.add_argument("--count", type=int, default=20, help="发送次数")
+    parser.add_argument("--interval", type=float, default=0.2, help="相邻两次发送的间隔（秒）")
+    parser.add_argument("--timeout", type=float, default=2.0, help="每次等待响应的超时时间（秒）")
+    parser.add_argument("--no-newline", action="store_true", help="不在命令后添加 \\r\\n")
+    parser.add_argument("--json", help="将结果写入该 JSON 文件")
+    args = parser.parse_args()
+
+    from service import SerialService
+
+    async def run():
+        service = SerialService(backend="asyncio")
+        service.attach_loop(asyncio.get_running_loop())
+        if not service.connect(args.port, args.baud):
+            sys.exit(f"无法打开串口 {args.port}")
+        try:
+            return await profile_command(service, args.command, args.count, args.interval, args.pattern,
+                                         args.timeout, add_newline=not args.no_newline)
+        finally:
+            service.disconnect()
+
+    result = asyncio.run(run())
+    print(format_report(result))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"结果已写入 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
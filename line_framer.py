@@ -0,0 +1,73 @@
+import time
+
+
+class LineFramer:
+    """
+    增量式行分帧器。
+    将任意切分的字节块拼接并按 '\\n' 切分成完整行，跨多次读取保留不完整的行尾；
+    对于没有换行结尾的数据（例如 shell 提示符 "> "），在空闲超过 idle_timeout 秒后整体冲刷输出。
+    """
+
+    def __init__(self, idle_timeout=0.2, max_line_bytes=65536):
+        self.idle_timeout = idle_timeout
+        self.max_line_bytes = max_line_bytes
+        self._pending = bytearray()
+        self._last_data_time = 0.0
+
+    @property
+    def pending(self):
+        """当前缓存的不完整行字节数"""
+        return len(self._pending)
+
+    def feed(self, data, now=None):
+        """
+        喂入新读到的字节，返回本次得到的完整行列表（不含行结束符）。
+        """
+        if not data:
+            return []
+        self._last_data_time = time.monotonic() if now is None else now
+
+        if b'\n' not in data:
+            self._pending += data
+            if len(self._pending) >= self.max_line_bytes:
+                # 超长且无换行的数据强制切分，避免无限增长
+                return [self._take_pending()]
+            return []
+
+        parts = data.split(b'\n')
+        if self._pending:
+            parts[0] = bytes(self._pending) + parts[0]
+            self._pending.clear()
+        tail = parts.pop()
+        if tail:
+            self._pending += tail
+        return [part[:-1] if part.endswith(b'\r') else part for part in parts]
+
+    def flush_idle(self, now=None):
+        """
+        如果缓存的不完整行已空闲超过 idle_timeout，则将其作为一行返回，否则返回 None。
+        idle_timeout 为 None 时从不冲刷。
+        """
+        if not self._pending or self.idle_timeout is None:
+            return None
+        now = time.monotonic() if now is None else now
+        if now - self._last_data_time < self.idle_timeout:
+            return None
+        return self._take_pending()
+
+    def flush(self):
+        """无条件返回并清空缓存的不完整行（没有时返回 None）"""
+        if not self._pending:
+            return None
+        return self._take_pending()
+
+    def reset(self):
+        """丢弃缓存的不完整行"""
+        self._pending.clear()
+
+    def _take_pending(self):
+        line = bytes(self._pending)
+        self._pending.clear()
+        if line.endswith(b'\r'):
+            line = line[:-1]
+        return line
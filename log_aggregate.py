@@ -0,0 +1,84 @@
+from collections import Counter
+
+from log_response import shape_line
+from log_store import FLAG_VARIANT, entry_text, format_timestamp, wall_time_ns
+
+# 直方图最多的桶数，时间跨度过大时自动加宽桶
+MAX_BUCKETS = 240
+
+
+def aggregate_entries(entries, regex=None, bucket_seconds=60, group=None, top_n=10, show_timestamp=True,
+                      budget=None):
+    """
+    一次遍历已匹配的条目（从旧到新）计算聚合结果:
+    匹配总数（折叠的重复行按重复次数计）、首次和最后一次出现、按墙上时间对齐的时间直方图、
+    平均每分钟次数，以及指定 group 时该捕获组出现最多的 top_n 个取值。
+    template 去重折叠了文本不同的行时（FLAG_VARIANT）只有第一次的取值可知，其余重复计入 unknown_values。
+    首次/最后一次出现的行按 budget（ResponseBudget）格式化。
+    """
+    count = 0
+    first = last = None
+    buckets = Counter()
+    values = Counter()
+    unknown = 0
+    bucket_ns = max(int(bucket_seconds * 1e9), 1)
+    for entry in entries:
+        occurrences = entry.count
+        last_ns = entry.last_timestamp_ns if occurrences > 1 else entry.timestamp_ns
+        count += occurrences
+        if first is None:
+            first = entry
+        last = entry
+        buckets[wall_time_ns(entry.timestamp_ns) // bucket_ns] += occurrences - 1
+        buckets[wall_time_ns(last_ns) // bucket_ns] += 1
+        if group is not None:
+            match = regex.search(entry_text(entry))
+            value = match.group(group) if match else None
+            known = 1 if entry.flags & FLAG_VARIANT else occurrences
+            if value is not None:
+                values[value] += known
+            unknown += occurrences - known
+
+    result = {
+        "count": count,
+        "first": _occurrence(first, first.timestamp_ns, show_timestamp, budget) if first else None,
+        "last": _occurrence(last, _last_ns(last), show_timestamp, budget) if last else None,
+        "rate_per_minute": None,
+        "bucket_seconds": bucket_seconds,
+        "histogram": [],
+    }
+    if first is not None:
+        span_ns = _last_ns(last) - first.timestamp_ns
+        if span_ns > 0:
+            result["rate_per_minute"] = round(count * 60e9 / span_ns, 3)
+        lo, hi = min(buckets), max(buckets)
+        if hi - lo + 1 > MAX_BUCKETS:
+            # 合并相邻的桶，使桶数不超过 MAX_BUCKETS
+            factor = -(-(hi - lo + 1) // MAX_BUCKETS)
+            merged = Counter()
+            for key, value in buckets.items():
+                merged[key // factor] += value
+            buckets, bucket_ns = merged, bucket_ns * factor
+            lo, hi = lo // factor, hi // factor
+            result["bucket_seconds"] = bucket_ns / 1e9
+        result["histogram"] = [
+            {"start": format_timestamp(key * bucket_ns), "count": buckets.get(key, 0)}
+            for key in range(lo, hi + 1)
+        ]
+    if group is not None:
+        result["top_values"] = [{"value": value, "count": n} for value, n in values.most_common(top_n)]
+        result["distinct_values"] = len(values)
+        result["unknown_values"] = unknown
+    return result
+
+
+def _last_ns(entry):
+    return entry.last_timestamp_ns if entry.count > 1 else entry.timestamp_ns
+
+
+def _occurrence(entry, timestamp_ns, show_timestamp, budget):
+    return {
+        "seq": entry.seq,
+        "timestamp": format_timestamp(wall_time_ns(timestamp_ns)),
+        "line": shape_line(entry, show_timestamp, budget),
+    }
@@ -0,0 +1,279 @@
+import re
+from array import array
+from bisect import bisect_left
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+# 每个索引块包含的行数: 倒排表记录的是块号而不是行号，内存约为逐行索引的几十分之一，
+# 查询时只对候选块中的行运行完整正则
+BLOCK_LINES = 32
+# 至少淘汰这么多块后才清理倒排表中已失效的前缀
+SWEEP_BLOCKS = 64
+# 忽略大小写时，这些 ASCII 字母还能匹配非 ASCII 字符（如 K 与开尔文符号），不能用于索引
+_UNSAFE_ICASE = frozenset(b'iksIKS')
+
+_LITERAL = sre_constants.LITERAL
+_SUBPATTERN = sre_constants.SUBPATTERN
+_BRANCH = sre_constants.BRANCH
+_REPEATS = tuple(getattr(sre_constants, name) for name in
+                 ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT') if hasattr(sre_constants, name))
+_ATOMIC_GROUP = getattr(sre_constants, 'ATOMIC_GROUP', None)
+
+
+def line_trigrams(data):
+    """返回一行原始字节（按 ASCII 转小写后）包含的所有三元组"""
+    data = data.lower()
+    return {data[i:i + 3] for i in range(len(data) - 2)}
+
+
+def plan_query(regex):
+    """
+    从已编译的正则表达式中提取匹配必须包含的字面量，生成索引查询计划。
+    计划为三元组（bytes）或 ("and", [子计划...]) / ("or", [子计划...]) 的嵌套；
+    返回 None 表示无法用索引缩小范围（需要全量扫描）。
+    """
+    if isinstance(regex.pattern, bytes):
+        return None
+    try:
+        parsed = sre_parse.parse(regex.pattern, regex.flags)
+    except Exception:
+        return None
+    icase = bool(parsed.state.flags & re.IGNORECASE)
+    return _plan_sequence(parsed.data, icase)
+
+
+def _plan_sequence(items, icase):
+    nodes = []
+    run = bytearray()
+
+    def flush():
+        if len(run) >= 3:
+            nodes.extend({bytes(run[i:i + 3]) for i in range(len(run) - 2)})
+        run.clear()
+
+    for op, av in items:
+        if op is _LITERAL:
+            encoded = chr(av).encode('utf-8')
+            if icase and (av > 127 or encoded[0] in _UNSAFE_ICASE):
+                flush()
+            else:
+                run += encoded.lower()
+            continue
+        flush()
+        node = None
+        if op is _SUBPATTERN:
+            add_flags, del_flags, sub = av[1], av[2], av[3]
+            sub_icase = (icase or bool(add_flags & re.IGNORECASE)) and not del_flags & re.IGNORECASE
+            node = _plan_sequence(sub.data, sub_icase)
+        elif op in _REPEATS:
+            low, _high, sub = av
+            if low >= 1:
+                node = _plan_sequence(sub.data, icase)
+        elif op is _ATOMIC_GROUP:
+            node = _plan_sequence(av.data, icase)
+        elif op is _BRANCH:
+            branches = [_plan_sequence(sub.data, icase) for sub in av[1]]
+            if all(branch is not None for branch in branches):
+                node = ("or", branches)
+        if node is not None:
+            nodes.append(node)
+    flush()
+    if not nodes:
+        return None
+    if len(nodes) == 1:
+        return nodes[0]
+    return ("and", nodes)
+
+
+def plan_matches(plan, contains):
+    """用 contains(trigram) 判断计划是否可能满足（用于块级 Bloom 过滤）"""
+    if isinstance(plan, bytes):
+        return contains(plan)
+    kind, children = plan
+    if kind == "and":
+        return all(plan_matches(child, contains) for child in children)
+    return any(plan_matches(child, contains) for child in children)
+
+
+class TrigramBloom:
+    """温层压缩块的三元组 Bloom 过滤器，查询时跳过肯定不包含所需字面量的块"""
+
+    __slots__ = ('bits', 'size', 'has_binary')
+
+    def __init__(self, entries_trigrams, has_binary=False, bits_per_trigram=8):
+        trigrams = set()
+        for line in entries_trigrams:
+            trigrams |= line
+        self.size = max(64, len(trigrams) * bits_per_trigram)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.has_binary = has_binary
+        size, bits = self.size, self.bits
+        for trigram in trigrams:
+            h = hash(trigram)
+            for pos in (h % size, (h >> 32) % size):
+                bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, trigram):
+        h = hash(trigram)
+        size, bits = self.size, self.bits
+        for pos in (h % size, (h >> 32) % size):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def may_match(self, plan):
+        return self.has_binary or plan_matches(plan, self.__contains__)
+
+
+class _Blocks:
+    """块号到块内首条目序号的映射，清理时整体替换"""
+
+    __slots__ = ('base', 'first_seqs')
+
+    def __init__(self, base, first_seqs):
+        self.base = base
+        self.first_seqs = first_seqs
+
+
+class TrigramIndex:
+    """
+    LogStore 热层的增量三元组倒排索引。
+    每行按写入顺序获得一个序数，每 BLOCK_LINES 行为一块；倒排表记录包含该三元组的块号（递增）。
+    淘汰只推进“已淘汰行数”，失效的块号在查询时跳过，积累到一定数量后批量清理。
+    二进制行在搜索时以 [HEX] 文本表示，不进入三元组索引，所在的块总是候选块。
+
+    并发: 与 LogStore 一致，add/evict 由唯一的写入方调用（在条目发布之前），lookup 不加锁。
+    写入方只追加倒排表或整体替换它们，读取方看到的候选集合只会偏大，不会遗漏已发布的行。
+    """
+
+    def __init__(self):
+        self._postings = {}        # 三元组 -> array('q') 块号
+        self._binary = array('q')  # 含二进制行的块号
+        self._blocks = _Blocks(0, array('q'))
+        self._added = 0            # 已加入的行数（下一行的序数）
+        self._evicted = 0          # 已淘汰的行数（序数小于它的行已失效）
+        self._swept_block = 0
+
+    @property
+    def trigram_count(self):
+        return len(self._postings)
+
+    def posting_entries(self):
+        """倒排表中的块号总数（含尚未清理的失效部分）"""
+        return sum(len(p) for p in list(self._postings.values())) + len(self._binary)
+
+    def add(self, seq, data, binary=False):
+        """索引一行（须在条目对读取方可见之前调用）"""
+        ordinal = self._added
+        block = ordinal // BLOCK_LINES
+        if ordinal % BLOCK_LINES == 0:
+            self._blocks.first_seqs.append(seq)
+        if binary:
+            if not self._binary or self._binary[-1] != block:
+                self._binary.append(block)
+        else:
+            postings = self._postings
+            for trigram in line_trigrams(data):
+                posting = postings.get(trigram)
+                if posting is None:
+                    postings[trigram] = array('q', (block,))
+                elif posting[-1] != block:
+                    posting.append(block)
+        self._added = ordinal + 1
+
+    def evict(self, count=1):
+        """最旧的 count 行被淘汰"""
+        self._evicted += count
+        dead = self._evicted // BLOCK_LINES - self._swept_block
+        # 失效部分超过 SWEEP_BLOCKS 块且占有效块的 1/4 以上时清理，摊销到每行的开销为常数
+        if dead >= SWEEP_BLOCKS and dead * 4 >= (self._added - self._evicted) // BLOCK_LINES:
+            self._sweep()
+
+    def _sweep(self):
+        """清理倒排表和块表中已失效的前缀（整体替换，不修改读取方可能持有的数组）"""
+        live = self._evicted // BLOCK_LINES
+        postings = self._postings
+        for trigram, posting in list(postings.items()):
+            cut = bisect_left(posting, live)
+            if cut == len(posting):
+                del postings[trigram]
+            elif cut:
+                postings[trigram] = posting[cut:]
+        cut = bisect_left(self._binary, live)
+        if cut:
+            self._binary = self._binary[cut:]
+        blocks = self._blocks
+        self._blocks = _Blocks(live, blocks.first_seqs[live - blocks.base:])
+        self._swept_block = live
+
+    def lookup(self, plan):
+        """
+        返回可能匹配计划的序号区间列表 [(start, end), ...]（end 为 None 表示直到最新），
+        区间按序号递增且互不重叠。
+        """
+        blocks = self._blocks
+        live = max(self._evicted // BLOCK_LINES, blocks.base)
+        matched = self._evaluate(plan, live)
+        binary = self._binary
+        binary = list(binary[bisect_left(binary, live):])
+        if binary:
+            matched = sorted(set(matched).union(binary))
+        first_seqs = blocks.first_seqs
+        last_block = blocks.base + len(first_seqs) - 1
+        ranges = []
+        for block in matched:
+            if block > last_block:
+                break
+            start = first_seqs[block - blocks.base]
+            end = first_seqs[block + 1 - blocks.base] if block < last_block else None
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+        return ranges
+
+    def _posting(self, trigram, live):
+        """返回 (倒排表, 第一个有效块号的位置)，不复制数组"""
+        posting = self._postings.get(trigram)
+        if posting is None:
+            return _EMPTY, 0
+        return posting, bisect_left(posting, live)
+
+    def _evaluate(self, plan, live):
+        """返回满足计划的有效块号（递增列表）"""
+        if isinstance(plan, bytes):
+            posting, lo = self._posting(plan, live)
+            return list(posting[lo:])
+        kind, children = plan
+        if kind == "or":
+            merged = set()
+            for child in children:
+                merged.update(self._evaluate(child, live))
+            return sorted(merged)
+        # and: 先取最短的倒排表作为候选，其余三元组用二分查找验证，复杂度取决于最短的倒排表
+        leaves = sorted((self._posting(child, live) for child in children if isinstance(child, bytes)),
+                        key=lambda leaf: len(leaf[0]) - leaf[1])
+        others = [child for child in children if not isinstance(child, bytes)]
+        candidates = None
+        if leaves:
+            posting, lo = leaves[0]
+            candidates = list(posting[lo:])
+            for posting, lo in leaves[1:]:
+                if not candidates:
+                    break
+                n = len(posting)
+                candidates = [b for b in candidates
+                              if (i := bisect_left(posting, b, lo)) < n and posting[i] == b]
+        for child in others:
+            if candidates is not None and not candidates:
+                break
+            blocks = self._evaluate(child, live)
+            candidates = blocks if candidates is None else sorted(set(candidates).intersection(blocks))
+        return candidates or []
+
+
+_EMPTY = array('q')
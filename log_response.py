@@ -0,0 +1,97 @@
+import base64
+import json
+from collections import namedtuple
+
+from log_store import expand_entry, format_entry, format_timestamp, wall_time_ns
+
+# 估算 token 数时每个 token 对应的字节数
+BYTES_PER_TOKEN = 4
+# 每行在 JSON 中除文本外的开销（引号、逗号和序号等）的估计值
+ROW_OVERHEAD = 4
+
+# 响应的大小限制: max_bytes 为日志部分的近似字节上限，max_line_chars 为单行文本的字符上限，
+# compact 为 True 时以列的形式返回 {"seq": [...], "timestamp": [...], "text": [...]}
+ResponseBudget = namedtuple('ResponseBudget', 'max_bytes max_line_chars compact', defaults=(None, None, False))
+
+# shape_entries 的结果: lines 为普通模式的行（compact 时为 None），columns 为紧凑模式的列（否则为 None），
+# seqs 为每行对应的条目序号，entries 为实际返回的条目，truncated 表示因大小或行数限制省略了部分条目，
+# size 为计入大小上限的字节数（含 extra_cost）
+ShapedLogs = namedtuple('ShapedLogs', 'lines columns seqs entries truncated size', defaults=(0,))
+
+
+def make_budget(max_bytes=None, max_tokens=None, max_line_chars=None, compact=False):
+    """根据工具参数创建 ResponseBudget，max_tokens 按每 token 约 4 字节换算，与 max_bytes 取较小者"""
+    for name, value in (("max_bytes", max_bytes), ("max_tokens", max_tokens), ("max_line_chars", max_line_chars)):
+        if value is not None and value <= 0:
+            raise ValueError(f"{name} 必须为正数")
+    limits = [value for value in (max_bytes, max_tokens and max_tokens * BYTES_PER_TOKEN) if value]
+    return ResponseBudget(min(limits) if limits else None, max_line_chars, compact)
+
+
+def shape_line(entry, show_timestamp=True, budget=None):
+    """按 budget 格式化单个条目: 紧凑模式不带时间戳（时间戳单独成列），超过 max_line_chars 时截断"""
+    budget = budget or ResponseBudget()
+    return format_entry(entry, show_timestamp and not budget.compact, budget.max_line_chars)
+
+
+def line_cost(text):
+    """一行文本计入响应大小的字节数"""
+    return len(text.encode()) + ROW_OVERHEAD
+
+
+def shape_entries(entries, show_timestamp=True, expand=False, budget=None, max_lines=None, from_end=False,
+                  extra_cost=None):
+    """
+    按 budget 格式化条目（从旧到新）。以条目为单位截断，折叠的重复行展开后不会被拆开，
+    且至少返回一个条目，保证分页总能前进。
+    from_end 为 True 时优先保留最新的条目（用于最近日志），否则保留最旧的条目（用于搜索和增量读取）。
+    max_lines 限制返回的行数（展开后的行）。
+    extra_cost(entry) 为保留该条目时随之返回的其他内容（如搜索上下文）的字节数，按遍历顺序调用，一并计入 max_bytes。
+    """
+    budget = budget or ResponseBudget()
+    groups = []
+    size = lines = 0
+    truncated = False
+    for entry in (reversed(entries) if from_end else entries):
+        rows = [(e.seq, e.timestamp_ns, shape_line(e, show_timestamp, budget))
+                for e in (expand_entry(entry) if expand else (entry,))]
+        cost = sum(line_cost(text) + (16 if budget.compact else 0) for _seq, _ts, text in rows)
+        if extra_cost is not None:
+            cost += extra_cost(entry)
+        if groups and ((budget.max_bytes is not None and size + cost > budget.max_bytes) or
+                       (max_lines is not None and lines + len(rows) > max_lines)):
+            truncated = True
+            break
+        groups.append((entry, rows))
+        size += cost
+        lines += len(rows)
+    if from_end:
+        groups.reverse()
+    rows = [row for _entry, entry_rows in groups for row in entry_rows]
+    seqs = [seq for seq, _ts, _text in rows]
+    kept = [entry for entry, _rows in groups]
+    if budget.compact:
+        columns = {
+            "seq": seqs,
+            "timestamp": [format_timestamp(wall_time_ns(ts)) for _seq, ts, _text in rows],
+            "text": [text for _seq, _ts, text in rows],
+        }
+        return ShapedLogs(None, columns, seqs, kept, truncated, size)
+    return ShapedLogs([text for _seq, _ts, text in rows], None, seqs, kept, truncated, size)
+
+
+def encode_page_token(kind, **state):
+    """将分页状态编码为不透明的令牌"""
+    raw = json.dumps({"k": kind, **state}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_page_token(token, kind):
+    """解码 encode_page_token 生成的令牌，令牌无效或不属于 kind 类工具时抛出 ValueError"""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError(f"无效的分页令牌: {token!r}")
+    if not isinstance(state, dict) or state.pop("k", None) != kind:
+        raise ValueError(f"分页令牌不属于此工具: {token!r}")
+    return state
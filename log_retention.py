@@ -0,0 +1,250 @@
+import heapq
+import re
+import time
+
+from log_store import LogStore, TieredLogStore
+
+# 日志级别识别: ESP-IDF 风格 "E (1234) tag: ..."，以及行首附近的 [ERROR] / WARN: / <I> 等标记
+_IDF_LEVEL_RE = re.compile(rb'^\s*([EWIDV]) \(\d+\)')
+_LEVEL_TOKEN_RE = re.compile(
+    rb'\b(fatal|panic|crit(?:ical)?|err(?:or)?|warn(?:ing)?|info|debug|trace|verbose)\b',
+    re.IGNORECASE)
+_LEVEL_SCAN_BYTES = 48
+
+_LEVEL_NAMES = {
+    b'fatal': 'error', b'panic': 'error', b'crit': 'error', b'critical': 'error',
+    b'err': 'error', b'error': 'error',
+    b'warn': 'warning', b'warning': 'warning',
+    b'info': 'info',
+    b'debug': 'debug', b'trace': 'debug', b'verbose': 'debug',
+}
+_IDF_LEVELS = {b'E': 'error', b'W': 'warning', b'I': 'info', b'D': 'debug', b'V': 'debug'}
+
+DEFAULT_CLASS = "default"
+
+# 模板化去重时忽略的数字部分（十进制数和 0x 开头的十六进制数）
+_NUMBER_RE = re.compile(rb'0[xX][0-9a-fA-F]+|\d+')
+
+DEDUP_MODES = ("off", "exact", "template")
+
+
+def line_template(data):
+    """返回忽略数字后的行模板，用于判断两行是否为同一条重复输出"""
+    return _NUMBER_RE.sub(b'#', data)
+
+
+def detect_level(data):
+    """
+    从一行原始字节的开头识别日志级别，返回 'error'/'warning'/'info'/'debug'，无法识别时返回 None。
+    """
+    match = _IDF_LEVEL_RE.match(data)
+    if match:
+        return _IDF_LEVELS[match.group(1)]
+    match = _LEVEL_TOKEN_RE.search(data, 0, _LEVEL_SCAN_BYTES)
+    if match:
+        return _LEVEL_NAMES[match.group(1).lower()]
+    return None
+
+
+class RetentionClass:
+    """
+    一个保留类别: 按正则或识别到的日志级别匹配日志行，拥有独立的配额和淘汰。
+    配置示例:
+        {"name": "errors", "pattern": "Error:|panic", "levels": ["error"],
+         "max_lines": 5000, "byte_budget": null, "max_age": null, "warm_budget": null}
+    """
+
+    def __init__(self, name, pattern=None, levels=None, max_lines=None, byte_budget=None,
+                 max_age=None, warm_budget=None, codec='zlib', indexed=False):
+        if not pattern and not levels:
+            raise ValueError(f"保留类别 {name} 需要指定 pattern 或 levels")
+        self.name = name
+        self.pattern = pattern
+        self.levels = frozenset(levels or ())
+        try:
+            self._regex = re.compile(pattern.encode('utf-8')) if pattern else None
+        except re.error as e:
+            raise ValueError(f"保留类别 {name} 的正则表达式无效: {e}")
+        hot = LogStore(max_lines if byte_budget else (max_lines or 1000), byte_budget=byte_budget,
+                       max_age=max_age, indexed=indexed)
+        self.store = TieredLogStore(hot, warm_budget=warm_budget, codec=codec)
+
+    @classmethod
+    def from_config(cls, item, codec='zlib', indexed=False):
+        return cls(item["name"], item.get("pattern"), item.get("levels"),
+                   item.get("max_lines"), item.get("byte_budget"), item.get("max_age"),
+                   item.get("warm_budget"), codec, indexed)
+
+    def matches(self, data, level):
+        if level is not None and level in self.levels:
+            return True
+        return self._regex is not None and self._regex.search(data) is not None
+
+
+class ClassifiedLogStore:
+    """
+    按保留类别分区的日志缓冲区。
+    每行在写入时按类别顺序匹配（先匹配者优先），未匹配的行进入默认类别；
+    每个类别各自是一个 TieredLogStore，按自己的配额淘汰，因此高优先级的行不会被大量噪声挤出。
+    所有类别共享一个全局序号，查询时按序号归并，保持全局到达顺序。
+    写入方在条目写入所属类别后才发布全局序号，读取方（不加锁）只读取已发布序号之前的条目，
+    因此各类别的快照拼起来仍是一段没有空缺的连续序号。
+
+    dedup 为 "exact" 或 "template" 时，与上一行相同（template 模式下忽略其中的数字）的
+    连续重复行在写入时折叠进上一条目，只累加重复次数并记录最后一次的时间戳，
+    template 模式下条目保留第一次出现时的文本，折叠了文本不同的行时条目带 FLAG_VARIANT 标志。
+    """
+
+    def __init__(self, default_store, classes=(), dedup="off"):
+        self.default = default_store
+        self.classes = list(classes)
+        self._stores = [c.store for c in self.classes] + [default_store]
+        self._names = [c.name for c in self.classes] + [DEFAULT_CLASS]
+        self._needs_level = any(c.levels for c in self.classes)
+        self._next_seq = 0
+        self.dedup = "off"
+        self.set_dedup(dedup)
+        self.deduplicated_lines = 0
+
+    def set_dedup(self, mode):
+        """设置连续重复行折叠模式: off / exact / template"""
+        if mode not in DEDUP_MODES:
+            raise ValueError(f"不支持的去重模式: {mode}")
+        self.dedup = mode
+        self._last_key = None
+        self._last_flags = 0
+        self._last_data = None
+        self._last_store = None
+        self._last_seq = -1
+
+    @property
+    def max_lines(self):
+        return self.default.max_lines
+
+    @property
+    def first_seq(self):
+        firsts = [store.first_seq for store in self._stores if len(store)]
+        return min(firsts) if firsts else self._next_seq
+
+    @property
+    def next_seq(self):
+        return self._next_seq
+
+    def __len__(self):
+        return sum(len(store) for store in self._stores)
+
+    def classify(self, data):
+        """返回该行所属类别的存储"""
+        if self.classes:
+            level = detect_level(data) if self._needs_level else None
+            for retention_class in self.classes:
+                if retention_class.matches(data, level):
+                    return retention_class.store
+        return self.default
+
+    def append(self, data, timestamp_ns=None, flags=0):
+        """按类别写入一行，返回全局序号（被折叠的重复行返回所折叠进的条目序号）"""
+        if self.dedup != "off":
+            key = data if self.dedup == "exact" else line_template(data)
+            if key == self._last_key and flags == self._last_flags:
+                if timestamp_ns is None:
+                    timestamp_ns = time.monotonic_ns()
+                if self._last_store.repeat_last(self._last_seq, timestamp_ns, data != self._last_data):
+                    self.deduplicated_lines += 1
+                    return self._last_seq
+            self._last_key = key
+            self._last_flags = flags
+            self._last_data = data
+        seq = self._next_seq
+        store = self.classify(data)
+        store.append(data, timestamp_ns, flags, seq)
+        self._last_store = store
+        self._last_seq = seq
+        self._next_seq = seq + 1
+        return seq
+
+    def end_repeat_run(self):
+        """结束当前的重复行折叠: 之后写入的行不再折叠进已有的条目"""
+        self._last_key = None
+
+    def expire(self, now_ns=None):
+        return sum(store.expire(now_ns) for store in self._stores)
+
+    def clear(self):
+        for store in self._stores:
+            store.clear()
+        self._last_key = None
+
+    def set_retention(self, max_lines=None, byte_budget=None, max_age=None, warm_budget=...):
+        """修改默认类别的保留策略（其它类别使用各自配置的配额）"""
+        self.default.set_retention(max_lines, byte_budget, max_age, warm_budget)
+
+    def stats(self):
+        """返回整体统计以及每个类别持有和淘汰的行数"""
+        stats = self.default.stats()
+        per_class = {}
+        for name, store in zip(self._names, self._stores):
+            class_stats = store.stats()
+            per_class[name] = {
+                "lines": class_stats["lines"],
+                "bytes": class_stats["bytes"],
+                "evicted_lines": class_stats["evicted_lines"],
+                "evicted_bytes": class_stats["evicted_bytes"],
+            }
+        if self.classes:
+            for key in ("lines", "bytes", "evicted_lines", "evicted_bytes"):
+                stats[key] = sum(c[key] for c in per_class.values())
+        stats["classes"] = per_class
+        stats["dedup"] = self.dedup
+        stats["deduplicated_lines"] = self.deduplicated_lines
+        return stats
+
+    def entry(self, seq):
+        for store in self._stores:
+            try:
+                return store.entry(seq)
+            except IndexError:
+                continue
+        raise IndexError(f"条目 {seq} 不在缓冲区中")
+
+    def iter_entries(self, start=None, end=None):
+        """按全局序号从旧到新遍历所有类别的条目"""
+        if not self.classes:
+            return self.default.iter_entries(start, end)
+        published = self._next_seq
+        end = published if end is None else min(end, published)
+        return heapq.merge(*(store.iter_entries(start, end) for store in self._stores),
+                           key=lambda e: e.seq)
+
+    def candidate_entries(self, plan, end=None):
+        """按全局序号从旧到新返回所有类别中可能匹配查询计划的条目"""
+        if not self.classes:
+            return self.default.candidate_entries(plan, end)
+        published = self._next_seq if end is None else min(end, self._next_seq)
+        return list(heapq.merge(*(store.candidate_entries(plan, published) for store in self._stores),
+                                key=lambda e: e.seq))
+
+    def seq_at_time(self, timestamp_ns):
+        """返回所有类别中第一条时间戳不早于 timestamp_ns 的条目序号，没有时返回 None"""
+        seqs = [seq for seq in (store.seq_at_time(timestamp_ns) for store in self._stores) if seq is not None]
+        return min(seqs) if seqs else None
+
+    def head(self, count):
+        """返回全局最旧的 count 条条目（从旧到新）"""
+        if not self.classes:
+            return self.default.head(count)
+        if count <= 0:
+            return []
+        published = self._next_seq
+        heads = ([e for e in store.head(count) if e.seq < published] for store in self._stores)
+        return list(heapq.merge(*heads, key=lambda e: e.seq))[:count]
+
+    def tail(self, count):
+        """返回全局最新的 count 条条目（从旧到新）"""
+        if not self.classes:
+            return self.default.tail(count)
+        if count <= 0:
+            return []
+        published = self._next_seq
+        tails = ([e for e in store.tail(count) if e.seq < published] for store in self._stores)
+        return list(heapq.merge(*tails, key=lambda e: e.seq))[-count:]
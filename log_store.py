@@ -0,0 +1,994 @@
+import lzma
+import struct
+import time
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from itertools import islice
+
+from log_index import TrigramBloom, TrigramIndex, line_trigrams
+
+# 每行的平均字节数估计，用于在未指定 arena 大小时按行数预分配（写不下时 arena 再按需扩大）
+DEFAULT_AVG_LINE_BYTES = 128
+# 按字节预算保留时的行数后备上限: 平均每行不足该字节数时才按行数淘汰
+MIN_AVG_LINE_BYTES = 8
+
+# 条目标志位
+FLAG_BINARY = 0x01  # 无法按 UTF-8 解码的原始字节行
+FLAG_VARIANT = 0x02  # template 去重折叠了文本不同（数字不同）的重复行，条目只保留第一次的文本
+
+# 单调时钟到墙上时间的换算偏移，仅用于显示
+_WALL_OFFSET_NS = time.time_ns() - time.monotonic_ns()
+
+# 一条日志: 序号、单调时钟时间戳（纳秒）、标志位、原始字节，
+# 以及被折叠的连续重复次数和最后一次重复的时间戳
+LogEntry = namedtuple('LogEntry', 'seq timestamp_ns flags data count last_timestamp_ns',
+                      defaults=(1, None))
+
+
+def format_timestamp(wall_ns):
+    """将墙上时间（纳秒）格式化为 HH:MM:SS.mmm"""
+    return datetime.fromtimestamp(wall_ns / 1e9).strftime('%H:%M:%S.%f')[:-3]
+
+
+def wall_time_ns(timestamp_ns):
+    """将单调时钟时间戳换算为墙上时间（纳秒）"""
+    return timestamp_ns + _WALL_OFFSET_NS
+
+
+def monotonic_time_ns(wall_ns):
+    """将墙上时间（纳秒）换算为单调时钟时间戳，用于按时间范围查询"""
+    return wall_ns - _WALL_OFFSET_NS
+
+
+def entry_text(entry):
+    """返回条目解码后的文本（二进制行以 [HEX] 表示）"""
+    if entry.flags & FLAG_BINARY:
+        return f"[HEX] {entry.data.hex().upper()}"
+    return entry.data.decode('utf-8', errors='replace')
+
+
+def format_entry(entry, show_timestamp=True, max_chars=None):
+    """
+    按显示设置格式化条目，折叠的重复行附带重复次数和最后一次出现的时间。
+    max_chars 限制行文本的字符数，超出部分替换为 "…[截断 N 字符]"。
+    """
+    text = entry_text(entry)
+    if max_chars is not None and len(text) > max_chars:
+        text = f"{text[:max_chars]}…[截断 {len(text) - max_chars} 字符]"
+    if entry.count > 1:
+        last = format_timestamp(wall_time_ns(entry.last_timestamp_ns))
+        text = f"{text} [重复 {entry.count} 次，最后一次 {last}]"
+    if show_timestamp:
+        return f"[{format_timestamp(wall_time_ns(entry.timestamp_ns))}] {text}"
+    return text
+
+
+def expand_entry(entry):
+    """
+    将折叠的重复条目展开为 count 条单独的条目（最后一条使用最后一次的时间戳）。
+    带 FLAG_VARIANT 的条目（template 去重折叠了文本不同的行）没有保存各次的文本，不展开，
+    仍以重复次数和最后一次的时间戳表示，而不是编造第一次文本的副本。
+    """
+    if entry.count <= 1 or entry.flags & FLAG_VARIANT:
+        return [entry]
+    single = entry._replace(count=1, last_timestamp_ns=entry.timestamp_ns)
+    last = entry._replace(count=1, timestamp_ns=entry.last_timestamp_ns)
+    return [single] * (entry.count - 1) + [last]
+
+
+class _Ring:
+    """
+    LogStore 的一组固定容量的槽位及 arena。
+    本地下标 head/tail 只在同一个 ring 内有意义；调整容量时写入方构造新的 ring 后整体替换，
+    读取方持有的旧 ring 不再被修改，因此仍是一致的快照。
+    """
+
+    __slots__ = ('max_lines', 'arena', 'offsets', 'lengths', 'timestamps', 'flags', 'seqs',
+                 'counts', 'last_timestamps', 'write_pos', 'head', 'tail')
+
+    def __init__(self, max_lines, arena_bytes):
+        self.max_lines = max_lines
+        self.arena = bytearray(arena_bytes)
+        self.offsets = array('Q', [0]) * max_lines
+        self.lengths = array('I', [0]) * max_lines
+        self.timestamps = array('q', [0]) * max_lines
+        self.flags = array('B', [0]) * max_lines
+        self.seqs = array('q', [0]) * max_lines
+        self.counts = array('I', [0]) * max_lines
+        self.last_timestamps = array('q', [0]) * max_lines
+        self.write_pos = 0  # arena 写指针
+        self.head = 0       # 下一个写入条目的本地下标（写入方在条目写完后才推进，即发布）
+        self.tail = 0       # 最旧的有效条目的本地下标（写入方在覆盖槽位和 arena 之前推进）
+
+    def entry_at(self, index):
+        slot = index % self.max_lines
+        offset = self.offsets[slot]
+        return LogEntry(self.seqs[slot], self.timestamps[slot], self.flags[slot],
+                        bytes(self.arena[offset:offset + self.lengths[slot]]),
+                        self.counts[slot], self.last_timestamps[slot])
+
+    def index_of(self, seq, lo, hi):
+        """返回 [lo, hi) 中序号不小于 seq 的第一个条目的本地下标（二分查找）"""
+        if lo >= hi:
+            return lo
+        seqs, m = self.seqs, self.max_lines
+        # 序号连续时直接定位
+        guess = lo + seq - seqs[lo % m]
+        if lo <= guess < hi and seqs[guess % m] == seq:
+            return guess
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if seqs[mid % m] < seq:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+
+class LogStore:
+    """
+    紧凑的列式环形日志缓冲区。
+    每行的原始字节写入预分配的 bytearray arena，偏移、长度、单调时钟时间戳（纳秒）、
+    标志位和序号保存在与槽位一一对应的 array 中。条目按写入顺序占用槽位（本地下标 % max_lines），
+    序号 seq 单调递增，默认与本地下标一致，也可以由调用方指定（多个缓冲区共享全局序号时）。
+    解码和时间戳格式化只在读取时进行。
+
+    保留策略: 行数超过 max_lines、总字节数超过 byte_budget 或条目早于 max_age 秒时，
+    从最旧的条目开始整行淘汰。指定 byte_budget 时 arena 大小即为预算，
+    max_lines 缺省为 byte_budget / MIN_AVG_LINE_BYTES 的宽松后备上限，槽位从 byte_budget / DEFAULT_AVG_LINE_BYTES
+    开始、写满时成倍增长到该上限，因此槽位占用的内存与实际行数成比例，短行不会先于字节预算被按行数淘汰。
+    只按行数保留（未指定 byte_budget）时 arena 只是初始大小，写不下时成倍扩大，不会因空间不足淘汰或截断行。
+    设置了 evict_sink 时，因容量被挤出的条目交给 evict_sink(entry) 继续保存（例如压缩温层），
+    不计入淘汰统计；因超龄或清空而移除的条目不会交给 evict_sink。
+
+    并发: 单写多读。写入类方法（append、repeat_last、expire、clear、set_retention）
+    须由调用方串行化；读取类方法不加锁，可以与写入并发执行。
+    写入方先写完槽位再推进 head 发布条目，淘汰时先推进 tail 再覆盖槽位；
+    读取方复制条目后重新检查 tail，丢弃复制期间被淘汰（可能已被覆盖）的条目，
+    得到的是一段序号连续的一致快照。清空只推进 tail，调整容量时整体替换 ring。
+
+    indexed 为 True 时同时维护一个三元组倒排索引（TrigramIndex），
+    candidate_entries() 只返回可能匹配查询计划的条目，供正则搜索缩小范围。
+    """
+
+    def __init__(self, max_lines=None, arena_bytes=None, byte_budget=None, max_age=None,
+                 indexed=False):
+        self.byte_budget = byte_budget
+        self.max_age = max_age
+        self.evict_sink = None
+        self.index = TrigramIndex() if indexed else None
+        self._next_seq = 0   # 下一个条目的默认序号
+        self._bytes = 0      # 有效条目的总字节数
+        self.evicted_lines = 0
+        self.evicted_bytes = 0
+        self.line_limit = max_lines  # 显式指定的行数上限（None 表示按预算推算）
+        self._line_cap, slots, arena_bytes = self._geometry(max_lines, arena_bytes, byte_budget)
+        self._ring = _Ring(slots, arena_bytes)
+
+    @staticmethod
+    def _geometry(max_lines, arena_bytes, byte_budget):
+        """根据保留参数计算 (行数上限, 初始槽位数, arena 大小)"""
+        if byte_budget is not None:
+            if byte_budget <= 0:
+                raise ValueError("byte_budget 必须为正数")
+            if max_lines is None:
+                max_lines = max(1, byte_budget // MIN_AVG_LINE_BYTES)
+            if max_lines <= 0:
+                raise ValueError("max_lines 必须为正数")
+            return max_lines, min(max_lines, max(1, byte_budget // DEFAULT_AVG_LINE_BYTES)), byte_budget
+        if max_lines is None:
+            max_lines = 1000
+        if max_lines <= 0:
+            raise ValueError("max_lines 必须为正数")
+        return max_lines, max_lines, arena_bytes or max_lines * DEFAULT_AVG_LINE_BYTES
+
+    def __len__(self):
+        ring = self._ring
+        return ring.head - ring.tail
+
+    @property
+    def max_lines(self):
+        """行数上限（按字节预算保留时为后备上限，当前槽位数可能更少）"""
+        return self._line_cap
+
+    @property
+    def total_bytes(self):
+        """有效条目的原始字节总数"""
+        return self._bytes
+
+    @property
+    def first_seq(self):
+        """最旧的有效条目序号（为空时等于 next_seq）"""
+        ring = self._ring
+        while True:
+            tail = ring.tail
+            if tail >= ring.head:
+                return self._next_seq
+            seq = ring.seqs[tail % ring.max_lines]
+            if ring.tail == tail:
+                return seq
+
+    @property
+    def next_seq(self):
+        """下一个写入条目将获得的默认序号"""
+        return self._next_seq
+
+    @property
+    def arena_bytes(self):
+        return len(self._ring.arena)
+
+    def append(self, data, timestamp_ns=None, flags=0, seq=None):
+        """追加一行原始字节，返回该条目的序号（seq 须不小于 next_seq）"""
+        ring = self._ring
+        if self.byte_budget is not None and len(data) > self.byte_budget:
+            data = data[:self.byte_budget]
+        n = len(data)
+        if timestamp_ns is None:
+            timestamp_ns = time.monotonic_ns()
+        if self.max_age is not None:
+            self.expire(timestamp_ns)
+        if ring.head - ring.tail >= ring.max_lines:
+            if ring.max_lines < self._line_cap:
+                # 槽位写满但未达到行数上限: 成倍扩大槽位而不淘汰
+                self._ring = ring = self._relayout(self._entries(), min(ring.max_lines * 2, self._line_cap),
+                                                   len(ring.arena))
+            else:
+                self._evict_oldest()
+        if self.byte_budget is not None:
+            while ring.tail < ring.head and self._bytes + n > self.byte_budget:
+                self._evict_oldest()
+        pos = self._reserve(n)
+        ring = self._ring
+
+        slot = ring.head % ring.max_lines
+        ring.arena[pos:pos + n] = data
+        ring.offsets[slot] = pos
+        ring.lengths[slot] = n
+        ring.timestamps[slot] = timestamp_ns
+        ring.flags[slot] = flags
+        if seq is None:
+            seq = self._next_seq
+        ring.seqs[slot] = seq
+        ring.counts[slot] = 1
+        ring.last_timestamps[slot] = timestamp_ns
+        ring.write_pos = pos + n
+        self._bytes += n
+        self._next_seq = seq + 1
+        if self.index is not None:
+            self.index.add(seq, data, flags & FLAG_BINARY)
+        ring.head += 1
+        return seq
+
+    def repeat_last(self, seq, timestamp_ns, variant=False):
+        """
+        将一次重复计入最新的条目（连续重复行折叠），该条目必须是序号为 seq 的最新条目。
+        variant 为 True 表示这次重复的文本与条目不同（template 去重），条目标记为 FLAG_VARIANT。
+        返回是否成功。
+        """
+        ring = self._ring
+        if ring.head == ring.tail:
+            return False
+        slot = (ring.head - 1) % ring.max_lines
+        if ring.seqs[slot] != seq:
+            return False
+        ring.last_timestamps[slot] = timestamp_ns
+        ring.counts[slot] += 1
+        if variant:
+            ring.flags[slot] |= FLAG_VARIANT
+        return True
+
+    def expire(self, now_ns=None):
+        """淘汰早于 max_age 秒的条目，返回淘汰的行数"""
+        if self.max_age is None:
+            return 0
+        cutoff = (time.monotonic_ns() if now_ns is None else now_ns) - int(self.max_age * 1e9)
+        ring = self._ring
+        count = 0
+        while ring.tail < ring.head and ring.timestamps[ring.tail % ring.max_lines] < cutoff:
+            self._evict_oldest(spill=False)
+            count += 1
+        return count
+
+    def clear(self):
+        """清空所有条目（序号继续递增）。只推进 tail，正在读取的快照会在校验时发现条目已失效"""
+        ring = self._ring
+        ring.tail = ring.head
+        ring.write_pos = 0
+        self._bytes = 0
+        if self.index is not None:
+            self.index = TrigramIndex()
+
+    def set_retention(self, max_lines=None, byte_budget=None, max_age=None):
+        """
+        运行时修改保留策略而不丢弃缓冲区: 按新的容量把现有条目排布到新的 ring 后整体替换，
+        放不下的最旧条目按容量淘汰处理。
+        """
+        if max_lines is None and byte_budget is None:
+            max_lines = self.line_limit
+        line_cap, slots, arena_bytes = self._geometry(max_lines, None, byte_budget)
+        kept = []
+        kept_bytes = 0
+        for entry in reversed(self._entries()):
+            n = len(entry.data)
+            if len(kept) >= line_cap:
+                break
+            if byte_budget is not None and kept_bytes + n > byte_budget:
+                break
+            kept.append(entry)
+            kept_bytes += n
+        kept.reverse()
+
+        while len(self) > len(kept):
+            self._evict_oldest()
+
+        while slots < len(kept):
+            slots = min(slots * 2, line_cap)
+        if byte_budget is None:
+            arena_bytes = max(arena_bytes, kept_bytes)
+        self.line_limit = max_lines
+        self._line_cap = line_cap
+        self.byte_budget = byte_budget
+        self.max_age = max_age
+        self._bytes = kept_bytes
+        self._ring = self._relayout(kept, slots, arena_bytes)
+        self.expire()
+
+    def _entries(self):
+        """当前 ring 中的全部条目（从旧到新），只由写入方调用"""
+        ring = self._ring
+        return [ring.entry_at(index) for index in range(ring.tail, ring.head)]
+
+    @staticmethod
+    def _relayout(entries, slots, arena_bytes):
+        """把条目（从旧到新）依次排布到一个新的 ring 中，由调用方整体替换"""
+        new_ring = _Ring(slots, arena_bytes)
+        for index, entry in enumerate(entries):
+            slot = index % slots
+            pos = new_ring.write_pos
+            n = len(entry.data)
+            new_ring.arena[pos:pos + n] = entry.data
+            new_ring.offsets[slot] = pos
+            new_ring.lengths[slot] = n
+            new_ring.timestamps[slot] = entry.timestamp_ns
+            new_ring.flags[slot] = entry.flags
+            new_ring.seqs[slot] = entry.seq
+            new_ring.counts[slot] = entry.count
+            new_ring.last_timestamps[slot] = entry.last_timestamp_ns
+            new_ring.write_pos = pos + n
+        new_ring.head = len(entries)
+        return new_ring
+
+    def stats(self):
+        """返回缓冲区占用和淘汰统计"""
+        ring = self._ring
+        return {
+            "lines": ring.head - ring.tail,
+            "bytes": self._bytes,
+            "max_lines": self._line_cap,
+            "line_limit": self.line_limit,
+            "slots": ring.max_lines,
+            "arena_bytes": len(ring.arena),
+            "byte_budget": self.byte_budget,
+            "max_age": self.max_age,
+            "evicted_lines": self.evicted_lines,
+            "evicted_bytes": self.evicted_bytes,
+            "search_index": self.index is not None,
+            "index_trigrams": self.index.trigram_count if self.index is not None else 0,
+        }
+
+    def _reserve(self, n):
+        """
+        在 arena 中为 n 字节找到写入位置。空间被有效条目占用时，按字节预算保留则淘汰最旧的条目，
+        只按行数保留则扩大 arena（可能整体替换 ring，调用方须重新读取 self._ring）。
+        """
+        ring = self._ring
+        pos = ring.write_pos
+        if pos + n > len(ring.arena):
+            # 回绕到 arena 起始处: 位于尾段的条目都比开头的条目旧，需要先淘汰
+            while ring.tail < ring.head and ring.offsets[ring.tail % ring.max_lines] >= pos:
+                if self._grow_arena(n):
+                    return self._ring.write_pos
+                self._evict_oldest()
+            pos = 0
+        end = pos + n
+        while ring.tail < ring.head:
+            slot = ring.tail % ring.max_lines
+            offset = ring.offsets[slot]
+            if offset < end and offset + max(ring.lengths[slot], 1) > pos:
+                if self._grow_arena(n):
+                    return self._ring.write_pos
+                self._evict_oldest()
+            else:
+                break
+        return pos
+
+    def _grow_arena(self, n):
+        """
+        只按行数保留时成倍扩大 arena，使现有条目紧凑排布后末尾还能写入 n 字节，返回是否已扩大；
+        按字节预算保留时 arena 大小即为预算，不扩大。
+        """
+        if self.byte_budget is not None:
+            return False
+        ring = self._ring
+        self._ring = self._relayout(self._entries(), ring.max_lines, max(len(ring.arena) * 2, self._bytes + n))
+        return True
+
+    def _evict_oldest(self, spill=True):
+        ring = self._ring
+        n = ring.lengths[ring.tail % ring.max_lines]
+        if spill and self.evict_sink is not None:
+            self.evict_sink(ring.entry_at(ring.tail))
+        else:
+            self.evicted_lines += 1
+            self.evicted_bytes += n
+        self._bytes -= n
+        ring.tail += 1
+        # 在 tail 推进之后才从索引中移除: 索引认为已失效的行一定已经不在热层中
+        if self.index is not None:
+            self.index.evict()
+
+    def snapshot(self, start=None, end=None):
+        """
+        无锁读取序号位于 [start, end) 内的条目（从旧到新），返回一段序号连续的一致快照。
+        复制期间被写入方淘汰的最旧条目不包含在结果中。
+        """
+        while True:
+            ring = self._ring
+            head = ring.head
+            tail = ring.tail
+            first = tail if start is None else ring.index_of(start, tail, head)
+            last = head if end is None else ring.index_of(end, first, head)
+            entries = [ring.entry_at(i) for i in range(first, last)]
+            valid_from = ring.tail
+            if first >= valid_from:
+                return entries
+            if last < valid_from:
+                # 二分查找读到了已被覆盖的槽位（其序号只会偏大），重新定位
+                continue
+            del entries[:valid_from - first]
+            if start is not None:
+                skip = 0
+                while skip < len(entries) and entries[skip].seq < start:
+                    skip += 1
+                del entries[:skip]
+            return entries
+
+    def candidate_entries(self, plan, end=None):
+        """
+        返回序号小于 end、可能匹配查询计划的条目（从旧到新，是实际匹配集合的超集）。
+        没有索引或计划为 None 时返回全部条目。
+        """
+        index = self.index
+        if index is None or plan is None:
+            return self.snapshot(None, end)
+        entries = []
+        for start, stop in index.lookup(plan):
+            if end is not None:
+                if start >= end:
+                    break
+                stop = end if stop is None else min(stop, end)
+            entries.extend(self.snapshot(start, stop))
+        return entries
+
+    def entry(self, seq):
+        """返回指定序号的条目"""
+        entries = self.snapshot(seq, seq + 1)
+        if not entries or entries[0].seq != seq:
+            raise IndexError(f"条目 {seq} 不在缓冲区中")
+        return entries[0]
+
+    def raw(self, seq):
+        """返回条目的原始字节"""
+        return self.entry(seq).data
+
+    def text(self, seq):
+        """返回条目解码后的文本（二进制行以 [HEX] 表示）"""
+        return entry_text(self.entry(seq))
+
+    def format(self, seq, show_timestamp=True):
+        """按显示设置格式化条目"""
+        return format_entry(self.entry(seq), show_timestamp)
+
+    def seqs(self, start=None, end=None):
+        """返回 [start, end) 内有效条目的序号列表"""
+        return [entry.seq for entry in self.snapshot(start, end)]
+
+    def iter_entries(self, start=None, end=None):
+        """按序号从旧到新遍历 [start, end) 内的条目（遍历的是开始时的快照）"""
+        return iter(self.snapshot(start, end))
+
+    def seq_at_time(self, timestamp_ns):
+        """返回第一条时间戳不早于 timestamp_ns 的条目序号，没有时返回 None（二分查找时间戳数组）"""
+        while True:
+            ring = self._ring
+            head = ring.head
+            tail = ring.tail
+            timestamps, m = ring.timestamps, ring.max_lines
+            lo, hi = tail, head
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if timestamps[mid % m] < timestamp_ns:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            if lo == head:
+                return None
+            seq = ring.seqs[lo % m]
+            # 被覆盖的槽位时间戳只会偏大，结果落在已失效的部分时重新查找
+            if lo >= ring.tail:
+                return seq
+
+    def head(self, count):
+        """返回最旧的 count 条条目（从旧到新）"""
+        if count <= 0:
+            return []
+        ring = self._ring
+        first = ring.tail
+        last = min(ring.head, first + count)
+        entries = [ring.entry_at(i) for i in range(first, last)]
+        valid_from = ring.tail
+        if first < valid_from:
+            del entries[:valid_from - first]
+        return entries
+
+    def tail(self, count):
+        """返回最新的 count 条条目（从旧到新）"""
+        if count <= 0:
+            return []
+        ring = self._ring
+        head = ring.head
+        first = max(ring.tail, head - count)
+        entries = [ring.entry_at(i) for i in range(first, head)]
+        valid_from = ring.tail
+        if first < valid_from:
+            del entries[:valid_from - first]
+        return entries
+
+
+class LogChunk:
+    """
+    温层中一个已封存的压缩块，记录首尾序号和时间戳以便查询时跳过。
+    负载为序号、时间戳（均为差分编码）、长度、标志位、重复次数、最后重复时间（相对首次）
+    六个数组与拼接后的行数据，整体压缩。
+    """
+
+    __slots__ = ('first_seq', 'last_seq', 'first_ts', 'last_ts', 'count',
+                 'raw_bytes', 'payload', 'codec', 'bloom')
+
+    _HEADER = struct.Struct('<I')
+
+    def __init__(self, entries, codec='zlib'):
+        seqs = array('q', (e.seq for e in entries))
+        timestamps = array('q', (e.timestamp_ns for e in entries))
+        seq_deltas = array('q', [seqs[0]])
+        seq_deltas.extend(b - a for a, b in zip(seqs, seqs[1:]))
+        ts_deltas = array('q', [timestamps[0]])
+        ts_deltas.extend(b - a for a, b in zip(timestamps, timestamps[1:]))
+        lengths = array('I', (len(e.data) for e in entries))
+        flags = array('B', (e.flags for e in entries))
+        counts = array('I', (e.count for e in entries))
+        repeat_spans = array('q', (e.last_timestamp_ns - e.timestamp_ns for e in entries))
+        data = b''.join(e.data for e in entries)
+        raw = b''.join((self._HEADER.pack(len(entries)), seq_deltas.tobytes(), ts_deltas.tobytes(),
+                        lengths.tobytes(), flags.tobytes(), counts.tobytes(),
+                        repeat_spans.tobytes(), data))
+        self.first_seq = seqs[0]
+        self.last_seq = seqs[-1]
+        self.first_ts = timestamps[0]
+        self.last_ts = timestamps[-1]
+        self.count = len(entries)
+        self.raw_bytes = len(data)
+        self.codec = codec
+        self.payload = lzma.compress(raw) if codec == 'lzma' else zlib.compress(raw, 6)
+        self.bloom = None  # 可选的 TrigramBloom，用于搜索时跳过不可能匹配的块
+
+    def decompress(self):
+        """解压为条目列表"""
+        raw = lzma.decompress(self.payload) if self.codec == 'lzma' else zlib.decompress(self.payload)
+        (count,) = self._HEADER.unpack_from(raw)
+        pos = self._HEADER.size
+        seqs = array('q')
+        seqs.frombytes(raw[pos:pos + 8 * count])
+        pos += 8 * count
+        timestamps = array('q')
+        timestamps.frombytes(raw[pos:pos + 8 * count])
+        pos += 8 * count
+        lengths = array('I')
+        lengths.frombytes(raw[pos:pos + 4 * count])
+        pos += 4 * count
+        flags = raw[pos:pos + count]
+        pos += count
+        counts = array('I')
+        counts.frombytes(raw[pos:pos + 4 * count])
+        pos += 4 * count
+        repeat_spans = array('q')
+        repeat_spans.frombytes(raw[pos:pos + 8 * count])
+        pos += 8 * count
+        entries = []
+        seq = timestamp_ns = 0
+        for i in range(count):
+            seq += seqs[i]
+            timestamp_ns += timestamps[i]
+            n = lengths[i]
+            entries.append(LogEntry(seq, timestamp_ns, flags[i], raw[pos:pos + n],
+                                    counts[i], timestamp_ns + repeat_spans[i]))
+            pos += n
+        return entries
+
+
+class TieredLogStore:
+    """
+    两级日志缓冲区。
+    最新的行保存在未压缩的热层 LogStore 中；被热层挤出的行先进入暂存区，
+    每满 chunk_lines 行（或 chunk_bytes 字节）封存成一个用 zlib/lzma 压缩的 LogChunk 进入温层。
+    温层按压缩后的字节数受 warm_budget 限制，超出时整块淘汰最旧的块。
+    读取时透明地跨两级遍历，只解压需要的块，并用一个小的 LRU 缓存最近解压的块。
+    warm_budget 为 None 时不启用温层，行为与单独的 LogStore 相同。
+
+    并发与 LogStore 相同（单写多读，读取不加锁）: 写入方只整体替换块元组和暂存区列表，
+    暂存区在替换前只追加；热层先把挤出的条目交给温层再推进 tail。
+    读取方先取热层快照，再读取温层中序号早于该快照的条目，两级之间不会出现空缺。
+    """
+
+    def __init__(self, hot, warm_budget=None, chunk_lines=1024, chunk_bytes=256 * 1024,
+                 codec='zlib', cache_chunks=4):
+        if codec not in ('zlib', 'lzma'):
+            raise ValueError(f"不支持的压缩算法: {codec}")
+        self.hot = hot
+        self.chunk_lines = chunk_lines
+        self.chunk_bytes = chunk_bytes
+        self.codec = codec
+        self.cache_chunks = cache_chunks
+        self._chunks = ()          # 已封存的块，从旧到新（只整体替换）
+        self._staging = []         # 尚未封存的条目（只追加，封存或清空时整体替换）
+        self._staging_bytes = 0
+        self._warm_bytes = 0       # 已封存块压缩后的字节数
+        self._warm_raw_bytes = 0   # 温层（含暂存区）的原始字节数
+        self._warm_lines = 0       # 温层（含暂存区）的行数
+        self._floor_seq = 0        # 小于该序号的温层条目已超龄
+        self._cache = OrderedDict()
+        self.evicted_lines = 0
+        self.evicted_bytes = 0
+        self.warm_budget = None
+        self._set_warm_budget(warm_budget)
+
+    def _set_warm_budget(self, warm_budget):
+        if warm_budget is not None and warm_budget < 0:
+            raise ValueError("warm_budget 不能为负数")
+        self.warm_budget = warm_budget or None
+        self.hot.evict_sink = self._spill if self.warm_budget else None
+        if not self.warm_budget:
+            self._drop_warm(count_evicted=True)
+        else:
+            self._trim_warm()
+
+    @property
+    def max_lines(self):
+        return self.hot.max_lines
+
+    @property
+    def first_seq(self):
+        """最旧的有效条目序号"""
+        staging = self._staging
+        chunks = self._chunks
+        floor = self._floor_seq
+        if chunks:
+            return max(chunks[0].first_seq, floor)
+        for e in staging:
+            if e.seq >= floor:
+                return e.seq
+        return self.hot.first_seq
+
+    @property
+    def next_seq(self):
+        return self.hot.next_seq
+
+    def __len__(self):
+        return self._warm_lines + len(self.hot)
+
+    def append(self, data, timestamp_ns=None, flags=0, seq=None):
+        """追加一行原始字节到热层，返回序号"""
+        return self.hot.append(data, timestamp_ns, flags, seq)
+
+    def repeat_last(self, seq, timestamp_ns, variant=False):
+        """将一次重复计入热层中最新的条目"""
+        return self.hot.repeat_last(seq, timestamp_ns, variant)
+
+    def _spill(self, entry):
+        """热层挤出的条目进入暂存区，满一块后压缩封存"""
+        self._staging.append(entry)
+        self._staging_bytes += len(entry.data)
+        self._warm_lines += 1
+        self._warm_raw_bytes += len(entry.data)
+        if len(self._staging) >= self.chunk_lines or self._staging_bytes >= self.chunk_bytes:
+            self._seal()
+
+    def _seal(self):
+        chunk = LogChunk(self._staging, self.codec)
+        if self.hot.index is not None:
+            chunk.bloom = TrigramBloom(
+                (line_trigrams(e.data) for e in self._staging if not e.flags & FLAG_BINARY),
+                has_binary=any(e.flags & FLAG_BINARY for e in self._staging))
+        # 先发布新块再替换暂存区: 读取方先取暂存区再取块元组，最多看到重复而不会漏掉
+        self._chunks = self._chunks + (chunk,)
+        self._staging = []
+        self._staging_bytes = 0
+        self._warm_bytes += len(chunk.payload)
+        self._trim_warm()
+
+    def _trim_warm(self):
+        while self._chunks and self._warm_bytes > self.warm_budget:
+            self._drop_first_chunk()
+
+    def _drop_first_chunk(self):
+        """淘汰最旧的块，只扣除其中尚未因超龄被移除（序号不低于下限）的行和字节"""
+        chunk = self._chunks[0]
+        if self._floor_seq > chunk.first_seq:
+            sizes = [len(e.data) for e in self._chunk_entries(chunk) if e.seq >= self._floor_seq]
+            live, size = len(sizes), sum(sizes)
+        else:
+            live, size = chunk.count, chunk.raw_bytes
+        self._chunks = self._chunks[1:]
+        self._warm_bytes -= len(chunk.payload)
+        self._warm_lines -= live
+        self._warm_raw_bytes -= size
+        self.evicted_lines += live
+        self.evicted_bytes += size
+        return live
+
+    def _raise_floor(self, entry):
+        """通过抬高下限序号移除超龄的温层条目（块不重新压缩，暂存区只追加）"""
+        self._floor_seq = entry.seq + 1
+        self._warm_lines -= 1
+        self._warm_raw_bytes -= len(entry.data)
+        self.evicted_lines += 1
+        self.evicted_bytes += len(entry.data)
+
+    def _drop_warm(self, count_evicted):
+        if count_evicted:
+            self.evicted_lines += self._warm_lines
+            self.evicted_bytes += self._warm_raw_bytes
+        self._chunks = ()
+        self._cache = OrderedDict()
+        self._staging = []
+        self._staging_bytes = 0
+        self._warm_bytes = 0
+        self._warm_raw_bytes = 0
+        self._warm_lines = 0
+
+    def _chunk_entries(self, chunk):
+        """
+        取得块解压后的条目，使用 LRU 缓存。
+        缓存以块对象本身为键（不会因 id 复用而串块），多个读取方并发访问时只可能多解压一次。
+        """
+        cache = self._cache
+        entries = cache.get(chunk)
+        if entries is not None:
+            try:
+                cache.move_to_end(chunk)
+            except KeyError:
+                pass
+            return entries
+        entries = chunk.decompress()
+        cache[chunk] = entries
+        while len(cache) > self.cache_chunks:
+            try:
+                cache.popitem(last=False)
+            except KeyError:
+                break
+        return entries
+
+    def expire(self, now_ns=None):
+        """淘汰两级中超龄的条目，返回淘汰的行数"""
+        count = self.hot.expire(now_ns)
+        max_age = self.hot.max_age
+        if max_age is None or not self._warm_lines:
+            return count
+        cutoff = (time.monotonic_ns() if now_ns is None else now_ns) - int(max_age * 1e9)
+        while self._chunks and self._chunks[0].last_ts < cutoff:
+            count += self._drop_first_chunk()
+        if self._chunks and self._chunks[0].first_ts >= cutoff:
+            return count
+        # 首块部分超龄时只抬高下限序号；没有块时检查暂存区
+        for e in (self._chunk_entries(self._chunks[0]) if self._chunks else self._staging):
+            if e.timestamp_ns >= cutoff:
+                break
+            if e.seq >= self._floor_seq:
+                self._raise_floor(e)
+                count += 1
+        return count
+
+    def clear(self):
+        """清空两级缓冲区"""
+        self._drop_warm(count_evicted=False)
+        self.hot.clear()
+
+    def set_retention(self, max_lines=None, byte_budget=None, max_age=None, warm_budget=...):
+        """运行时修改热层保留策略以及温层预算（warm_budget 省略时保持不变）"""
+        if warm_budget is not ...:
+            self._set_warm_budget(warm_budget)
+        self.hot.set_retention(max_lines, byte_budget, max_age)
+        self.expire()
+
+    def stats(self):
+        """返回两级缓冲区的占用和淘汰统计"""
+        stats = self.hot.stats()
+        stats.update({
+            "lines": len(self),
+            "bytes": self.hot.total_bytes + self._warm_raw_bytes,
+            "hot_lines": len(self.hot),
+            "hot_bytes": self.hot.total_bytes,
+            "warm_budget": self.warm_budget,
+            "warm_lines": self._warm_lines,
+            "warm_chunks": len(self._chunks),
+            "warm_raw_bytes": self._warm_raw_bytes,
+            "warm_compressed_bytes": self._warm_bytes,
+            "warm_memory_bytes": self._warm_bytes + self._staging_bytes,
+            "evicted_lines": self.hot.evicted_lines + self.evicted_lines,
+            "evicted_bytes": self.hot.evicted_bytes + self.evicted_bytes,
+        })
+        return stats
+
+    def _warm_view(self):
+        """
+        取温层的一致视图: (块元组, 暂存区中尚未封存的条目, 下限序号)。
+        先取暂存区再取块元组，期间若发生封存，暂存区中已进入新块的条目会被去掉。
+        """
+        staging = self._staging
+        staged = staging[:]
+        chunks = self._chunks
+        floor = self._floor_seq
+        if chunks and staged and staged[0].seq <= chunks[-1].last_seq:
+            last = chunks[-1].last_seq
+            staged = [e for e in staged if e.seq > last]
+        return chunks, staged, floor
+
+    def entry(self, seq):
+        """返回指定序号的条目"""
+        try:
+            return self.hot.entry(seq)
+        except IndexError:
+            pass
+        chunks, staged, floor = self._warm_view()
+        if seq >= floor:
+            if staged and seq >= staged[0].seq:
+                for e in staged:
+                    if e.seq == seq:
+                        return e
+            else:
+                i = bisect_right(chunks, seq, key=_chunk_start) - 1
+                if i >= 0 and seq <= chunks[i].last_seq:
+                    for e in self._chunk_entries(chunks[i]):
+                        if e.seq == seq:
+                            return e
+        raise IndexError(f"条目 {seq} 不在缓冲区中")
+
+    def raw(self, seq):
+        return self.entry(seq).data
+
+    def text(self, seq):
+        return entry_text(self.entry(seq))
+
+    def format(self, seq, show_timestamp=True):
+        return format_entry(self.entry(seq), show_timestamp)
+
+    def iter_entries(self, start=None, end=None):
+        """按序号从旧到新遍历 [start, end) 内的条目，跳过范围之外的块"""
+        hot = self.hot.snapshot(start, end)
+        if hot:
+            # 热层快照之前的部分在取快照时已经进入温层
+            if start is not None and hot[0].seq <= start:
+                return iter(hot)
+            end = hot[0].seq
+        if not self.warm_budget:
+            return iter(hot)
+        return self._iter_warm(start, end, hot)
+
+    def _iter_warm(self, start, end, hot):
+        chunks, staged, floor = self._warm_view()
+        start = floor if start is None else max(start, floor)
+        first = max(bisect_right(chunks, start, key=_chunk_start) - 1, 0)
+        for chunk in chunks[first:]:
+            if end is not None and chunk.first_seq >= end:
+                break
+            if chunk.last_seq < start:
+                continue
+            for e in self._chunk_entries(chunk):
+                if e.seq >= start and (end is None or e.seq < end):
+                    yield e
+        else:
+            for e in staged:
+                if e.seq >= start and (end is None or e.seq < end):
+                    yield e
+        yield from hot
+
+    def candidate_entries(self, plan, end=None):
+        """
+        返回序号小于 end、可能匹配查询计划的条目（从旧到新）。
+        热层用倒排索引缩小范围，温层跳过 Bloom 过滤器判定不可能匹配的块。
+        """
+        hot = self.hot.candidate_entries(plan, end)
+        if not self.warm_budget:
+            return hot
+        # 取完热层候选之后再读热层首序号: 在此之前被挤出热层的条目都已进入温层
+        hot_first = self.hot.first_seq
+        skip = 0
+        while skip < len(hot) and hot[skip].seq < hot_first:
+            skip += 1
+        warm_end = hot_first if end is None else min(end, hot_first)
+        return self._warm_candidates(plan, warm_end) + hot[skip:]
+
+    def _warm_candidates(self, plan, end):
+        chunks, staged, floor = self._warm_view()
+        entries = []
+        for chunk in chunks:
+            if chunk.first_seq >= end:
+                break
+            if chunk.last_seq < floor:
+                continue
+            if plan is not None and chunk.bloom is not None and not chunk.bloom.may_match(plan):
+                continue
+            entries.extend(e for e in self._chunk_entries(chunk) if floor <= e.seq < end)
+        entries.extend(e for e in staged if floor <= e.seq < end)
+        return entries
+
+    def seq_at_time(self, timestamp_ns):
+        """返回两级中第一条时间戳不早于 timestamp_ns 的条目序号，没有时返回 None"""
+        seq = self.hot.seq_at_time(timestamp_ns)
+        if seq is None or not self.warm_budget or seq > self.hot.first_seq:
+            return seq
+        # 热层最旧的条目已不早于该时间: 结果可能在温层（先查热层，之后被挤出的条目都已进入温层）
+        chunks, staged, floor = self._warm_view()
+        first = bisect_left(chunks, timestamp_ns, key=_chunk_end_ts)
+        for chunk in chunks[first:]:
+            if chunk.last_seq < floor:
+                continue
+            for e in self._chunk_entries(chunk):
+                if e.seq >= floor and e.timestamp_ns >= timestamp_ns:
+                    return min(e.seq, seq)
+        for e in staged:
+            if e.seq >= floor and e.timestamp_ns >= timestamp_ns:
+                return min(e.seq, seq)
+        return seq
+
+    def head(self, count):
+        """返回最旧的 count 条条目（从旧到新），只解压需要的块"""
+        if count <= 0:
+            return []
+        hot = self.hot.head(count)
+        if not self.warm_budget:
+            return hot
+        # 先取热层: 之后被挤出热层的条目都已进入温层
+        return list(islice(self._iter_warm(None, hot[0].seq if hot else None, hot), count))
+
+    def tail(self, count):
+        """返回最新的 count 条条目（从旧到新），只解压需要的块"""
+        if count <= 0:
+            return []
+        result = self.hot.tail(count)
+        need = count - len(result)
+        if need <= 0 or not self.warm_budget:
+            return result
+        chunks, staged, floor = self._warm_view()
+        below = result[0].seq if result else None
+        older = [e for e in staged if e.seq >= floor and (below is None or e.seq < below)][-need:]
+        need -= len(older)
+        for chunk in reversed(chunks):
+            if need <= 0:
+                break
+            entries = [e for e in self._chunk_entries(chunk)
+                       if e.seq >= floor and (below is None or e.seq < below)][-need:]
+            older = entries + older
+            need -= len(entries)
+        return older + result
+
+
+def _chunk_end_ts(chunk):
+    return chunk.last_ts
+
+
+def _chunk_start(chunk):
+    return chunk.first_seq
@@ -1,12 +1,12 @@
 import sys
 import asyncio
 import threading
-from datetime import datetime
 
 from PyQt6.QtWidgets import QApplication, QMainWindow, QWidget, QHBoxLayout, QVBoxLayout, QTextEdit, QPushButton, QComboBox, QCheckBox, QLabel, QLineEdit, QSplitter, QMessageBox, QDialog, QTabWidget, QTextBrowser, QTableWidget, QTableWidgetItem, QHeaderView
 from PyQt6.QtCore import Qt, pyqtSlot
 
 import config
+from log_store import format_timestamp, wall_time_ns
 from service import SerialService
 from mcp_server import McpService
 
@@ -323,8 +323,7 @@ class UartMcpApp(QMainWindow):
         self.settings_button.clicked.connect(self.show_settings_dialog)
 
         # SerialService signals
-        self.serial_service.data_received.connect(self.handle_data_received)
-        self.serial_service.text_data_received.connect(self.handle_text_data_received)
+        self.serial_service.lines_received.connect(self.handle_lines_received)
         self.serial_service.connection_status_changed.connect(self.handle_connection_status)
         self.serial_service.error_occurred.connect(self.handle_serial_error)
 
@@ -388,34 +387,27 @@ class UartMcpApp(QMainWindow):
         self.config["show_timestamp"] = checked
         config.save_config(self.config)
 
-    @pyqtSlot(str)
-    def handle_text_data_received(self, text_data):
-        """处理来自服务层的文本数据（仅在文本显示模式下使用）"""
-        # 只在非HEX显示模式下处理文本数据
-        if not self.hex_receive_checkbox.isChecked():
-            display_text = text_data
-            
-            # 根据时间戳设置决定是否添加时间戳
-            if self.show_timestamp_checkbox.isChecked():
-                timestamp = datetime.now().strftime('%H:%M:%S.%f')[:-3]
-                display_text = f"[{timestamp}] {text_data}"
-            
-            self.append_to_log(display_text)
+    @pyqtSlot(list)
+    def handle_lines_received(self, records):
+        """处理来自服务层的一批接收数据，按HEX显示设置显示文本或HEX，一次性追加到接收区"""
+        hex_mode = self.hex_receive_checkbox.isChecked()
+        show_timestamp = self.show_timestamp_checkbox.isChecked()
+        lines = []
+        for record in records:
+            if hex_mode:
+                # HEX 只在HEX显示模式下才计算
+                hex_data = record.hex
+                display_text = ' '.join(hex_data[i:i+2] for i in range(0, len(hex_data), 2)).upper()
+            else:
+                display_text = record.text
 
-    @pyqtSlot(str)
-    def handle_data_received(self, hex_data):
-        """处理来自服务层的原始HEX数据（仅在HEX显示模式下使用）"""
-        # 只在HEX显示模式下处理HEX数据
-        if self.hex_receive_checkbox.isChecked():
-            # Format hex data with spaces
-            display_text = ' '.join(hex_data[i:i+2] for i in range(0, len(hex_data), 2)).upper()
-            
-            # 根据时间戳设置决定是否添加时间戳
-            if self.show_timestamp_checkbox.isChecked():
-                timestamp = datetime.now().strftime('%H:%M:%S.%f')[:-3]
+            # 根据时间戳设置决定是否添加时间戳（使用接收时刻而非显示时刻）
+            if show_timestamp:
+                timestamp = format_timestamp(wall_time_ns(record.timestamp_ns))
                 display_text = f"[{timestamp}] {display_text}"
-            
-            self.append_to_log(display_text)
+            lines.append(display_text)
+
+        self.append_to_log("\n".join(lines))
 
     @pyqtSlot(str)
     def handle_serial_error(self, error_message):
@@ -474,7 +466,7 @@ class UartMcpApp(QMainWindow):
         
         # 同时清空串口服务的日志缓冲区
         if self.serial_service:
-            buffer_size = len(self.serial_service.get_log_buffer())
+            buffer_size = self.serial_service.log_size()
             self.serial_service.clear_log_buffer()
             self.append_to_log(f"--- 已清空显示和日志缓冲区 (原有 {buffer_size} 条记录) ---")
 
@@ -997,7 +989,7 @@ if __name__ == '__main__':
     app_config = config.load_config()
 
     # Create the shared service instance
-    serial_service = SerialService()
+    serial_service = SerialService.from_config(app_config)
     
     # Create the GUI window
     window = UartMcpApp(serial_service, app_config)
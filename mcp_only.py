@@ -9,13 +9,16 @@ import sys
 
 from service import SerialService
 from mcp_server import McpService
+import config
 
 def main():
     """启动 MCP 服务器（同步版本，更简单）"""
     print("正在启动 UART MCP 服务器...")
     
-    # 创建共享的串口服务实例
-    serial_service = SerialService()
+    app_config = config.load_config()
+
+    # 创建共享的串口服务实例（无界面模式下使用与 MCP 共享事件循环的 asyncio 后端）
+    serial_service = SerialService.from_config(app_config, backend="asyncio")
     
     # 创建 MCP 服务
     mcp_service = McpService(serial_service)
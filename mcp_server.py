@@ -1,5 +1,8 @@
 import asyncio
 from mcp.server.fastmcp import FastMCP
+from latency_profiler import profile_command
+from serial_script import find_script, run_script, validate_steps
+from log_response import decode_page_token, encode_page_token, make_budget, shape_entries
 from service import SerialService
 import config
 
@@ -21,8 +24,9 @@ def get_serial_status() -> dict:
             "bytesize": port_info.bytesize,
             "parity": port_info.parity,
             "stopbits": port_info.stopbits,
-            # TODO: Add buffer statistics as per requirements
-            "buffer_stats": "Not implemented yet"
+            "backend": serial_service.active_backend(),
+            "buffer_stats": _buffer_stats(),
+            "writer_stats": serial_service.get_writer_stats()
         }
     else:
         status = {
@@ -30,18 +34,47 @@ def get_serial_status() -> dict:
             "port": None,
             "baudrate": None
         }
+        if serial_service:
+            status["buffer_stats"] = _buffer_stats()
     return status
 
+def _buffer_stats():
+    """日志缓冲区占用、淘汰和搜索缓存命中统计的摘要"""
+    stats = serial_service.get_log_stats()
+    return {
+        "lines": stats["lines"],
+        "bytes": stats["bytes"],
+        "evicted_lines": stats["evicted_lines"],
+        "warm_lines": stats["warm_lines"],
+        "search_cache": stats["search_cache"]
+    }
+
 @mcp.tool()
-def query_serial_logs(pattern: str, max_results: int = 100) -> dict:
+async def query_serial_logs(pattern: str, max_results: int = 100, expand_repeats: bool = False,
+                            timeout: float = None, time_range: str = None, before: int = 0,
+                            after: int = 0, max_bytes: int = None, max_tokens: int = None,
+                            max_line_chars: int = None, compact: bool = False, page_token: str = None) -> dict:
     """在串口日志缓冲区中搜索匹配正则表达式的行
     
     Args:
         pattern: 正则表达式模式，例如 "^.*reminder.*$"
         max_results: 最大返回结果数量，默认100
+        expand_repeats: 是否将折叠的连续重复行展开为多行，默认False（显示为"[重复 N 次...]"）
+        timeout: 本次搜索的时间预算（秒），为空时使用配置的 search_time_budget；超时返回部分结果
+        time_range: 只搜索该时间窗口内的日志，如 "last_5min"、"last_30s"、"10:00/10:05"、
+            "2026-10-17T10:00:00/2026-10-17T10:05:00"；为空表示整个缓冲区
+        before: 每个匹配之前附带的上下文条数，默认0
+        after: 每个匹配之后附带的上下文条数，默认0
+        max_bytes: 匹配行及其上下文部分的近似字节上限，超出时截断并返回 next_page_token
+        max_tokens: 匹配行及其上下文部分的近似 token 上限（约 4 字节/token），与 max_bytes 取较小者
+        max_line_chars: 单行文本的最大字符数，超出部分替换为 "…[截断 N 字符]"
+        compact: 为 True 时以列的形式返回 columns {"seq", "timestamp", "text"}，并省略回显的请求参数
+        page_token: 上次返回的 next_page_token，从上一页之后继续（不包含首次搜索之后到达的行）
     
     Returns:
-        包含匹配行和统计信息的字典
+        包含匹配行和统计信息的字典；timed_out 为 True 表示只搜索了部分缓冲区，
+        truncated 为 True 表示还有未返回的匹配，可用 next_page_token 继续。请求上下文时 context 为合并后的分组，
+        行前的 "序号:" 表示匹配行、"序号-" 表示上下文行；context_truncated 表示部分上下文已被淘汰
     """
     if not serial_service:
         return {
@@ -53,16 +86,237 @@ def query_serial_logs(pattern: str, max_results: int = 100) -> dict:
         }
     
     try:
-        # 搜索日志
-        matches = serial_service.search_logs(pattern, max_results)
-        buffer_size = len(serial_service.get_log_buffer())
+        # 在工作线程中搜索，不阻塞事件循环和串口读取
+        time_budget = ... if timeout is None else timeout
+        if before < 0 or after < 0:
+            raise ValueError("上下文行数不能为负数")
+        budget = make_budget(max_bytes, max_tokens, max_line_chars, compact)
+        start = end = None
+        if page_token:
+            state = decode_page_token(page_token, "search")
+            if state.get("pattern") != pattern:
+                raise ValueError("分页令牌与本次搜索的 pattern 不一致")
+            start, end = state["start"], state["end"]
+        result = await serial_service.search_logs_async(pattern, max_results, expand=expand_repeats,
+                                                        time_budget=time_budget, time_range=time_range,
+                                                        before=before, after=after, start=start, end=end,
+                                                        budget=budget)
+        shaped = result.shaped
+        truncated = result.truncated
+        message = f"找到 {len(shaped.seqs)} 条匹配记录"
+        if result.timed_out:
+            message += "（搜索超时，仅为部分结果）"
         
+        response = {
+            "status": "success",
+            "message": message,
+            "total_matches": len(shaped.seqs),
+            "truncated": truncated,
+            "timed_out": result.timed_out,
+            "next_page_token": None
+        }
+        _put_logs(response, "matches", shaped)
+        if truncated and not result.cancelled:
+            resume = shaped.entries[-1].seq + 1 if shaped.entries else start or 0
+            response["next_page_token"] = encode_page_token("search", pattern=pattern, start=resume,
+                                                            end=result.end)
+        if not compact:
+            response.update({
+                "buffer_size": serial_service.log_size(),
+                "pattern": pattern,
+                "max_results": max_results,
+                "time_range": time_range
+            })
+        if result.context is not None:
+            response["context"] = result.context
+            response["context_truncated"] = any(group["evicted_lines"] for group in result.context)
+        return response
+    except ValueError as e:
+        return {
+            "status": "error",
+            "message": str(e),
+            "matches": [],
+            "total_matches": 0,
+            "buffer_size": serial_service.log_size() if serial_service else 0
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"搜索过程中发生错误: {str(e)}",
+            "matches": [],
+            "total_matches": 0,
+            "buffer_size": serial_service.log_size() if serial_service else 0
+        }
+
+@mcp.tool()
+async def query_serial_logs_multi(patterns: list[dict], max_results: int = 100, expand_repeats: bool = False,
+                                  timeout: float = None, time_range: str = None, max_bytes: int = None,
+                                  max_tokens: int = None, max_line_chars: int = None, compact: bool = False,
+                                  page_token: str = None) -> dict:
+    """一次遍历日志缓冲区同时搜索多个正则表达式，返回每个模式的匹配行和匹配总数
+    
+    Args:
+        patterns: 模式列表，每项为 {"name": "panic", "pattern": "panic|abort", "max_results": 20}，
+            name 缺省为正则本身，max_results 缺省为参数 max_results
+        max_results: 每个模式默认最多返回的匹配行数，默认100
+        expand_repeats: 是否将折叠的连续重复行展开为多行，默认False
+        timeout: 本次搜索的时间预算（秒），为空时使用配置的 search_time_budget；超时返回部分结果
+        time_range: 只搜索该时间窗口内的日志，如 "last_5min"、"10:00/10:05"；为空表示整个缓冲区
+        max_bytes: 所有模式的匹配行合计的近似字节上限，按模式顺序分配，超出时截断并返回 next_page_token
+        max_tokens: 所有模式的匹配行合计的近似 token 上限（约 4 字节/token），与 max_bytes 取较小者
+        max_line_chars: 单行文本的最大字符数，超出部分替换为 "…[截断 N 字符]"
+        compact: 为 True 时每个模式以列的形式返回 columns {"seq", "timestamp", "text"}
+        page_token: 上次返回的 next_page_token，只继续还有未返回匹配的模式（patterns 须与上次相同）
+    
+    Returns:
+        results 为 {名称: {"pattern", "matches", "count", "truncated"}}，count 为不受上限限制的匹配总数
+        （翻页时为该模式剩余部分的匹配数）
+    """
+    if not serial_service:
+        return {
+            "status": "error",
+            "message": "串口服务未初始化",
+            "results": {}
+        }
+    
+    try:
+        time_budget = ... if timeout is None else timeout
+        budget = make_budget(max_bytes, max_tokens, max_line_chars, compact)
+        starts = end = None
+        if page_token:
+            state = decode_page_token(page_token, "multi")
+            names = [item.get("name") or item.get("pattern") if isinstance(item, dict) else item for item in patterns]
+            if not set(state["starts"]) <= set(names):
+                raise ValueError("分页令牌与本次搜索的 patterns 不一致")
+            patterns = [item for item, name in zip(patterns, names) if name in state["starts"]]
+            starts, end = state["starts"], state["end"]
+        result = await serial_service.multi_search_async(patterns, max_results, expand=expand_repeats,
+                                                         time_budget=time_budget, time_range=time_range,
+                                                         budget=budget, starts=starts, end=end)
+        summary = "，".join(f"{name}: {item['count']}" for name, item in result.results.items())
+        message = f"匹配条数 {summary}"
+        if result.timed_out:
+            message += "（搜索超时，仅为部分结果）"
+        next_page_token = None
+        if result.resume and not result.cancelled:
+            next_page_token = encode_page_token("multi", starts=result.resume, end=result.end)
+        response = {
+            "status": "success",
+            "message": message,
+            "results": result.results,
+            "timed_out": result.timed_out,
+            "next_page_token": next_page_token
+        }
+        if not compact:
+            response.update({
+                "buffer_size": serial_service.log_size(),
+                "time_range": time_range
+            })
+        return response
+    except ValueError as e:
+        return {
+            "status": "error",
+            "message": str(e),
+            "results": {}
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"搜索过程中发生错误: {str(e)}",
+            "results": {}
+        }
+
+@mcp.tool()
+async def aggregate_serial_logs(pattern: str, bucket_seconds: float = 60, group: str = None, top_n: int = 10,
+                                timeout: float = None, time_range: str = None, max_line_chars: int = None) -> dict:
+    """统计匹配正则表达式的日志: 匹配总数、首次/最后一次出现、频率、时间直方图和捕获组取值排行
+    
+    只返回统计结果而不返回匹配行，适合回答"重启了多少次"、"错误集中在什么时间"、"哪个错误码最多"。
+    
+    Args:
+        pattern: 正则表达式模式
+        bucket_seconds: 时间直方图每个桶的宽度（秒），默认60；桶数过多时自动加宽
+        group: 捕获组的名称或编号（如 "code" 或 "1"），给出时统计该组出现最多的取值
+        top_n: 返回的捕获组取值个数，默认10
+        timeout: 本次统计的时间预算（秒），为空时使用配置的 search_time_budget；超时返回部分统计
+        time_range: 只统计该时间窗口内的日志，如 "last_5min"、"10:00/10:05"；为空表示整个缓冲区
+        max_line_chars: first/last 中行文本的最大字符数，超出部分替换为 "…[截断 N 字符]"
+    
+    Returns:
+        count（折叠的重复行按重复次数计）、first/last、rate_per_minute、bucket_seconds、histogram，
+        指定 group 时还有 top_values、distinct_values 和 unknown_values（template 去重折叠后取值未知的重复次数）
+    """
+    if not serial_service:
+        return {
+            "status": "error",
+            "message": "串口服务未初始化"
+        }
+    
+    try:
+        time_budget = ... if timeout is None else timeout
+        result = await serial_service.aggregate_async(pattern, bucket_seconds=bucket_seconds, group=group,
+                                                      top_n=top_n, time_budget=time_budget, time_range=time_range,
+                                                      budget=make_budget(max_line_chars=max_line_chars))
+        message = f"共匹配 {result.stats['count']} 次"
+        if result.timed_out:
+            message += "（统计超时，仅为部分结果）"
         return {
             "status": "success",
-            "message": f"找到 {len(matches)} 条匹配记录",
+            "message": message,
+            "pattern": pattern,
+            **result.stats,
+            "timed_out": result.timed_out,
+            "buffer_size": serial_service.log_size(),
+            "time_range": time_range
+        }
+    except ValueError as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"统计过程中发生错误: {str(e)}"
+        }
+
+@mcp.tool()
+async def search_serial_bytes(pattern: str, max_results: int = 100, timeout: float = None) -> dict:
+    """在串口日志缓冲区的原始字节中搜索字节模式（适用于二进制协议设备）
+
+    搜索的是分帧后保存的行: 0x0A 是行分隔符、不保存，行尾的 0x0D 被去掉，能按 UTF-8 解码的行还去掉了首尾空白
+    （空格、\t 等）；因此包含 0x0A、跨越两行或位于文本行首尾空白上的模式找不到。二进制行的其余字节原样保留。
+
+    Args:
+        pattern: 十六进制字节模式，?? 表示任意一个字节，例如 "AA 55 ?? 01"
+        max_results: 最大返回结果数量，默认100
+        timeout: 本次搜索的时间预算（秒），为空时使用配置的 search_time_budget；超时返回部分结果
+
+    Returns:
+        包含匹配位置（条目序号、行内偏移、时间戳、匹配字节）的字典；timed_out 为 True 表示只搜索了部分缓冲区
+    """
+    if not serial_service:
+        return {
+            "status": "error",
+            "message": "串口服务未初始化",
+            "matches": [],
+            "total_matches": 0
+        }
+
+    try:
+        time_budget = ... if timeout is None else timeout
+        result = await serial_service.search_bytes_async(pattern, max_results, time_budget=time_budget)
+        matches = result.matches
+        message = f"找到 {len(matches)} 处匹配"
+        if result.timed_out:
+            message += "（搜索超时，仅为部分结果）"
+        return {
+            "status": "success",
+            "message": message,
             "matches": matches,
             "total_matches": len(matches),
-            "buffer_size": buffer_size,
+            "timed_out": result.timed_out,
+            "buffer_size": serial_service.get_log_stats()["lines"],
             "pattern": pattern,
             "max_results": max_results
         }
@@ -71,16 +325,14 @@ def query_serial_logs(pattern: str, max_results: int = 100) -> dict:
             "status": "error",
             "message": str(e),
             "matches": [],
-            "total_matches": 0,
-            "buffer_size": len(serial_service.get_log_buffer()) if serial_service else 0
+            "total_matches": 0
         }
     except Exception as e:
         return {
             "status": "error",
             "message": f"搜索过程中发生错误: {str(e)}",
             "matches": [],
-            "total_matches": 0,
-            "buffer_size": len(serial_service.get_log_buffer()) if serial_service else 0
+            "total_matches": 0
         }
 
 @mcp.tool()
@@ -94,15 +346,78 @@ def get_log_buffer_info() -> dict:
             "max_buffer_size": 0
         }
     
-    buffer = serial_service.get_log_buffer()
+    stats = serial_service.get_log_stats()
+    oldest = serial_service.get_log_head(1)
+    newest = serial_service.get_recent_logs(1)
     return {
         "status": "success",
-        "buffer_size": len(buffer),
-        "max_buffer_size": serial_service.max_log_lines,
-        "oldest_entry": buffer[0] if buffer else None,
-        "newest_entry": buffer[-1] if buffer else None
+        "buffer_size": stats["lines"],
+        "max_buffer_size": stats["max_lines"],
+        "buffer_bytes": stats["bytes"],
+        "byte_budget": stats["byte_budget"],
+        "max_age": stats["max_age"],
+        "evicted_lines": stats["evicted_lines"],
+        "evicted_bytes": stats["evicted_bytes"],
+        "warm_lines": stats["warm_lines"],
+        "warm_chunks": stats["warm_chunks"],
+        "warm_compressed_bytes": stats["warm_compressed_bytes"],
+        "retention_classes": stats["classes"],
+        "dedup": stats["dedup"],
+        "deduplicated_lines": stats["deduplicated_lines"],
+        "search_index": stats["search_index"],
+        "search_cache": stats["search_cache"],
+        "oldest_entry": oldest[0] if oldest else None,
+        "newest_entry": newest[0] if newest else None
     }
 
+@mcp.tool()
+def set_log_retention(byte_budget: int = None, max_age: float = None, max_lines: int = None,
+                      warm_budget: int = None) -> dict:
+    """修改日志缓冲区的保留策略，不会清空现有日志；省略（为空）的参数保持不变
+    
+    Args:
+        byte_budget: 日志缓冲区的字节预算，超出时按行从最旧开始淘汰；0 表示改为按行数保留
+        max_age: 日志最长保留时间（秒），0 表示不限制
+        max_lines: 行数上限；按字节预算保留时为可选的后备上限，0 表示使用按预算推算的宽松上限
+        warm_budget: 压缩温层的字节预算，0 表示关闭温层
+    
+    Returns:
+        包含新的保留策略和缓冲区统计的字典
+    """
+    if not serial_service:
+        return {
+            "status": "error",
+            "message": "串口服务未初始化"
+        }
+    
+    try:
+        changes = {}
+        for name, value in (("byte_budget", byte_budget), ("max_age", max_age), ("max_lines", max_lines),
+                            ("warm_budget", warm_budget)):
+            if value is not None:
+                if value < 0:
+                    raise ValueError(f"{name} 不能为负数")
+                changes[name] = value or None
+        serial_service.set_log_retention(**changes)
+        stats = serial_service.get_log_stats()
+        return {
+            "status": "success",
+            "message": "日志保留策略已更新",
+            "buffer_size": stats["lines"],
+            "max_buffer_size": stats["max_lines"],
+            "buffer_bytes": stats["bytes"],
+            "byte_budget": stats["byte_budget"],
+            "max_age": stats["max_age"],
+            "warm_budget": stats["warm_budget"],
+            "evicted_lines": stats["evicted_lines"],
+            "evicted_bytes": stats["evicted_bytes"]
+        }
+    except ValueError as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
 @mcp.tool()
 def clear_log_buffer() -> dict:
     """清空串口日志缓冲区"""
@@ -125,14 +440,23 @@ def clear_log_buffer() -> dict:
         }
 
 @mcp.tool()
-def get_recent_logs(lines: int = 500) -> dict:
+def get_recent_logs(lines: int = 500, expand_repeats: bool = False, time_range: str = None,
+                    max_bytes: int = None, max_tokens: int = None, max_line_chars: int = None,
+                    compact: bool = False, page_token: str = None) -> dict:
     """获取最近N行串口日志（最新接收到的N行）
     
     Args:
         lines: 要获取的日志行数，默认500行
+        expand_repeats: 是否将折叠的连续重复行展开为多行，默认False
+        time_range: 只取该时间窗口内的日志，如 "last_5min"、"10:00/10:05"；为空表示不限
+        max_bytes: 日志部分的近似字节上限，超出时优先保留最新的行
+        max_tokens: 日志部分的近似 token 上限（约 4 字节/token），与 max_bytes 取较小者
+        max_line_chars: 单行文本的最大字符数，超出部分替换为 "…[截断 N 字符]"
+        compact: 为 True 时以列的形式返回 columns {"seq", "timestamp", "text"}，并省略回显的请求参数
+        page_token: 上次返回的 next_page_token，继续获取更早的日志
     
     Returns:
-        包含最近N行日志和统计信息的字典
+        包含最近N行日志和统计信息的字典；next_page_token 不为空表示还有更早的日志
     """
     if not serial_service:
         return {
@@ -156,26 +480,41 @@ def get_recent_logs(lines: int = 500) -> dict:
                 "buffer_size": 0
             }
         
-        buffer = serial_service.get_log_buffer()
-        buffer_size = len(buffer)
+        budget = make_budget(max_bytes, max_tokens, max_line_chars, compact)
+        start = end = None
+        if page_token:
+            state = decode_page_token(page_token, "recent")
+            start, end = state["start"], state["end"]
+        buffer_size = serial_service.log_size()
+        # 先取游标再读取: 期间到达的行可能被再次返回，但不会遗漏
+        next_cursor = serial_service.log_cursor()
         
-        # 获取最近N行（最新的N行）
-        if lines == 0:
-            recent_logs = []
-        elif lines >= buffer_size:
-            # 如果请求的行数大于等于缓冲区大小，返回所有日志
-            recent_logs = buffer
-        else:
-            # 取最后N行（最新的N行）
-            recent_logs = buffer[-lines:]
+        # 获取最近N行（最新的N行），只读取需要的部分
+        entries, first = serial_service.recent_entries(lines, time_range, start, end)
+        shaped = shape_entries(entries, serial_service.show_timestamp, expand_repeats, budget,
+                               max_lines=lines, from_end=True)
         
-        return {
+        response = {
             "status": "success",
-            "message": f"成功获取最近 {len(recent_logs)} 行日志",
-            "logs": recent_logs,
+            "message": f"成功获取最近 {len(shaped.seqs)} 行日志",
+            "actual_lines": len(shaped.seqs),
+            "next_cursor": next_cursor,
+            "next_page_token": None
+        }
+        _put_logs(response, "logs", shaped)
+        if shaped.entries and shaped.entries[0].seq > first:
+            response["next_page_token"] = encode_page_token("recent", start=first, end=shaped.entries[0].seq)
+        if not compact:
+            response.update({"requested_lines": lines, "buffer_size": buffer_size})
+        return response
+    except ValueError as e:
+        return {
+            "status": "error",
+            "message": str(e),
+            "logs": [],
             "requested_lines": lines,
-            "actual_lines": len(recent_logs),
-            "buffer_size": buffer_size
+            "actual_lines": 0,
+            "buffer_size": serial_service.log_size()
         }
     except Exception as e:
         return {
@@ -184,20 +523,153 @@ def get_recent_logs(lines: int = 500) -> dict:
             "logs": [],
             "requested_lines": lines,
             "actual_lines": 0,
-            "buffer_size": len(serial_service.get_log_buffer()) if serial_service else 0
+            "buffer_size": serial_service.log_size() if serial_service else 0
         }
 
 @mcp.tool()
-def send_serial_command(command: str, is_hex: bool = False, add_newline: bool = True) -> dict:
-    """发送命令到串口设备
+def get_logs_since(cursor: int = None, max_lines: int = 500, expand_repeats: bool = False,
+                   max_bytes: int = None, max_tokens: int = None, max_line_chars: int = None,
+                   compact: bool = False) -> dict:
+    """增量读取串口日志: 只返回序号不小于 cursor 的新日志和下一次使用的游标
+    
+    Args:
+        cursor: 上次返回的 next_cursor；为空时从缓冲区中最旧的日志开始
+        max_lines: 最多返回的日志条数，默认500
+        expand_repeats: 是否将折叠的连续重复行展开为多行，默认False
+        max_bytes: 日志部分的近似字节上限，超出时截断（next_cursor 指向第一条未返回的日志）
+        max_tokens: 日志部分的近似 token 上限（约 4 字节/token），与 max_bytes 取较小者
+        max_line_chars: 单行文本的最大字符数，超出部分替换为 "…[截断 N 字符]"
+        compact: 为 True 时以列的形式返回 columns {"seq", "timestamp", "text"}
+    
+    Returns:
+        包含新日志、序号、next_cursor 的字典；missed_lines 为读取前已被淘汰的日志条数，
+        has_more 为 True 表示还有更新的日志，可用 next_cursor 继续读取
+    """
+    if not serial_service:
+        return {
+            "status": "error",
+            "message": "串口服务未初始化",
+            "logs": [],
+            "seqs": [],
+            "next_cursor": cursor
+        }
+    
+    if max_lines < 0:
+        return {
+            "status": "error",
+            "message": "请求的日志行数不能为负数",
+            "logs": [],
+            "seqs": [],
+            "next_cursor": cursor
+        }
+    
+    try:
+        budget = make_budget(max_bytes, max_tokens, max_line_chars, compact)
+        result = serial_service.get_logs_since(cursor, max_lines, expand=expand_repeats)
+        shaped = shape_entries(result.entries, serial_service.show_timestamp, expand_repeats, budget)
+        next_cursor, has_more = result.next_cursor, result.has_more
+        if shaped.truncated:
+            next_cursor, has_more = shaped.entries[-1].seq + 1, True
+        message = f"返回 {len(shaped.seqs)} 行新日志"
+        if result.reset:
+            message += "（游标超出当前序号，服务可能已重启，已从最旧的日志开始）"
+        if result.missed:
+            message += f"（有 {result.missed} 条日志在读取前已被淘汰）"
+        response = {
+            "status": "success",
+            "message": message,
+            "next_cursor": next_cursor,
+            "has_more": has_more,
+            "missed_lines": result.missed,
+            "cursor_reset": result.reset
+        }
+        _put_logs(response, "logs", shaped)
+        if not compact:
+            response["seqs"] = shaped.seqs
+        return response
+    except ValueError as e:
+        return {
+            "status": "error",
+            "message": str(e),
+            "logs": [],
+            "seqs": [],
+            "next_cursor": cursor
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"获取日志时发生错误: {str(e)}",
+            "logs": [],
+            "seqs": [],
+            "next_cursor": cursor
+        }
+
+@mcp.tool()
+async def wait_for_pattern(pattern: str, timeout: float = 30, since_cursor: int = None) -> dict:
+    """在服务端等待匹配正则表达式的日志出现（长轮询），代替反复调用 get_recent_logs / query_serial_logs
+    
+    Args:
+        pattern: 正则表达式模式，例如 "boot ok|ready"
+        timeout: 最长等待时间（秒），默认30
+        since_cursor: 从该游标开始检查（如 get_logs_since / get_recent_logs 返回的 next_cursor），
+            可以避免漏掉调用之前刚到达的行；为空时只等待调用之后到达的行
+    
+    Returns:
+        matched 为 True 时 line / seq 为第一条匹配的日志；next_cursor 用于继续等待下一次匹配；
+        elapsed 为等待的秒数
+    """
+    if not serial_service:
+        return {
+            "status": "error",
+            "message": "串口服务未初始化",
+            "matched": False
+        }
+    
+    try:
+        if timeout is not None and timeout < 0:
+            raise ValueError("等待时间不能为负数")
+        result = await serial_service.wait_for_pattern(pattern, timeout, since_cursor)
+        return {
+            "status": "success",
+            "message": f"匹配到: {result.line}" if result.matched else f"等待 {timeout} 秒内未出现匹配的日志",
+            "matched": result.matched,
+            "line": result.line,
+            "seq": result.seq,
+            "next_cursor": result.next_cursor,
+            "elapsed": round(result.elapsed, 3)
+        }
+    except ValueError as e:
+        return {
+            "status": "error",
+            "message": str(e),
+            "matched": False
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"等待过程中发生错误: {str(e)}",
+            "matched": False
+        }
+
+@mcp.tool()
+async def send_serial_command(command: str, is_hex: bool = False, add_newline: bool = True,
+                              wait_response: bool = False, timeout: float = 3.0, end_pattern: str = None,
+                              idle_gap: float = None, max_lines: int = 200) -> dict:
+    """发送命令到串口设备，可选地在同一次调用中收集设备的响应
     
     Args:
         command: 要发送的命令字符串，例如 "dbg reboot"
         is_hex: 是否为十六进制数据，默认False（文本模式）
         add_newline: 是否自动添加换行符(\r\n)，默认True
+        wait_response: 是否等待并返回响应（发送之后到达的日志行），默认False
+        timeout: 等待响应的最长时间（秒），默认3.0
+        end_pattern: 响应结束的正则表达式，例如 "^(OK|ERROR)$"；匹配的行是响应的最后一行
+        idle_gap: 收到首行后超过该秒数没有新行即认为响应结束；未给出 end_pattern 时默认0.5
+        max_lines: 最多返回的响应行数，默认200
     
     Returns:
-        包含发送结果的字典
+        包含发送结果的字典；等待响应时还有 response（响应行）、ttfb_ms / completion_ms
+        （首行 / 最后一行距写入的毫秒数）、completed_by（"end_pattern"、"idle" 或 "timeout"）和 next_cursor
     """
     if not serial_service:
         return {
@@ -217,7 +689,15 @@ def send_serial_command(command: str, is_hex: bool = False, add_newline: bool =
     
     try:
         # 发送命令到串口
-        success = serial_service.send(command, is_hex=is_hex, add_newline=add_newline)
+        response = None
+        if wait_response:
+            if timeout is None or timeout < 0:
+                raise ValueError("等待响应的时间必须为非负数")
+            response = await serial_service.send_and_collect(command, is_hex, add_newline, timeout,
+                                                             end_pattern, idle_gap, max_lines)
+            success = response.sent
+        else:
+            success = serial_service.send(command, is_hex=is_hex, add_newline=add_newline)
         
         if success:
             # 构建实际发送的数据描述
@@ -226,7 +706,7 @@ def send_serial_command(command: str, is_hex: bool = False, add_newline: bool =
             else:
                 actual_data = f'"{command}"' + (" + \\r\\n" if add_newline else "")
             
-            return {
+            result = {
                 "status": "success",
                 "message": f"命令发送成功: {actual_data}",
                 "command": command,
@@ -234,6 +714,17 @@ def send_serial_command(command: str, is_hex: bool = False, add_newline: bool =
                 "is_hex": is_hex,
                 "add_newline": add_newline
             }
+            if response is not None:
+                result["message"] += f"，收到 {len(response.lines)} 行响应"
+                result.update({
+                    "response": response.lines,
+                    "response_truncated": response.truncated,
+                    "ttfb_ms": None if response.ttfb is None else round(response.ttfb * 1000, 3),
+                    "completion_ms": None if response.completion is None else round(response.completion * 1000, 3),
+                    "completed_by": response.completed_by,
+                    "next_cursor": response.next_cursor
+                })
+            return result
         else:
             return {
                 "status": "error",
@@ -242,6 +733,13 @@ def send_serial_command(command: str, is_hex: bool = False, add_newline: bool =
                 "sent": False
             }
     
+    except ValueError as e:
+        return {
+            "status": "error",
+            "message": str(e),
+            "command": command,
+            "sent": False
+        }
     except Exception as e:
         return {
             "status": "error",
@@ -250,8 +748,175 @@ def send_serial_command(command: str, is_hex: bool = False, add_newline: bool =
             "sent": False
         }
 
+@mcp.tool()
+async def profile_command_latency(command: str, count: int = 10, interval: float = 0.2,
+                                  response_pattern: str = None, timeout: float = 2.0, is_hex: bool = False,
+                                  add_newline: bool = True) -> dict:
+    """多次发送同一条命令并统计往返延迟分布（如 AT+GMR、dbg remind all 的响应时间）
+    
+    Args:
+        command: 要发送的命令，例如 "AT+GMR"
+        count: 发送次数，默认10，最多1000
+        interval: 相邻两次发送的间隔（秒），默认0.2
+        response_pattern: 响应完成的正则表达式，例如 "^OK$"；为空时以首行到达计
+        timeout: 每次等待响应的超时时间（秒），默认2.0
+        is_hex: 是否为十六进制数据，默认False
+        add_newline: 是否自动添加换行符(\r\n)，默认True
+    
+    Returns:
+        latency_ms 为延迟分布（min/p50/p90/p99/max/mean/stdev/jitter，毫秒），samples_ms 为每次的延迟，
+        timeouts / send_failures 为超时和发送失败的次数；结果可直接保存为 JSON 与其他版本比较
+    """
+    if not serial_service:
+        return {
+            "status": "error",
+            "message": "串口服务未初始化"
+        }
+    
+    if not serial_service.is_connected():
+        return {
+            "status": "error",
+            "message": "串口未连接，无法发送命令"
+        }
+    
+    try:
+        result = await profile_command(serial_service, command, count, interval, response_pattern, timeout,
+                                       is_hex, add_newline)
+        stats = result["latency_ms"]
+        message = f"响应 {result['responses']}/{count} 次"
+        if stats["p50"] is not None:
+            message += f"，p50 {stats['p50']} ms，p99 {stats['p99']} ms"
+        return {
+            "status": "success",
+            "message": message,
+            **result
+        }
+    except ValueError as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"延迟分析过程中发生错误: {str(e)}"
+        }
+
+@mcp.tool()
+async def run_serial_script(steps: list[dict] = None, name: str = None, variables: dict = None,
+                            default_timeout: float = 5.0) -> dict:
+    """在服务端一次执行一组串口命令步骤（发送、等待匹配、捕获变量、延时），返回每步的简要记录
+    
+    一次调用即可完成"重启 → 等待 boot ok → 发送 AT → 等待 OK"这类流程，不需要多轮调用和轮询。
+    
+    Args:
+        steps: 步骤列表，每步为以下之一:
+            {"send": "AT", "hex": false, "newline": true} 发送命令（可用 ${变量} 引用已捕获的值）；
+            {"expect": "^OK$", "timeout": 2, "optional": false} 等待匹配的日志行，超时则脚本失败；
+            {"capture": "version:(\\S+)", "var": "version", "group": 1, "timeout": 2} 等待匹配并保存捕获组；
+            {"sleep": 0.5} 等待若干秒
+        name: 已保存脚本的名称（保存在 scripts.json 中，与 steps 二选一）
+        variables: 初始变量，例如 {"ssid": "lab"}
+        default_timeout: expect / capture 未指定 timeout 时的超时时间（秒），默认5.0
+    
+    Returns:
+        ok 表示所有步骤都成功；failed_step 为失败的步骤序号；variables 为最终的变量；
+        steps 为每步的记录（发送的命令、匹配的行、捕获的值、耗时 elapsed_ms）
+    """
+    if not serial_service:
+        return {
+            "status": "error",
+            "message": "串口服务未初始化",
+            "ok": False
+        }
+    
+    if not serial_service.is_connected():
+        return {
+            "status": "error",
+            "message": "串口未连接，无法执行脚本",
+            "ok": False
+        }
+    
+    try:
+        if (steps is None) == (name is None):
+            raise ValueError("需要且只能提供 steps 或 name 之一")
+        if name is not None:
+            steps = find_script(config.load_scripts(), name)
+        result = await run_script(serial_service, steps, variables, default_timeout)
+        if result["ok"]:
+            message = f"脚本执行完成，共 {len(result['steps'])} 步，耗时 {result['elapsed_ms']} ms"
+        else:
+            failed = result["steps"][-1]
+            message = f"脚本在第 {result['failed_step']} 步（{failed['type']}）失败: {failed.get('error')}"
+        return {
+            "status": "success" if result["ok"] else "error",
+            "message": message,
+            "name": name,
+            **result
+        }
+    except ValueError as e:
+        return {
+            "status": "error",
+            "message": str(e),
+            "ok": False
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"执行脚本时发生错误: {str(e)}",
+            "ok": False
+        }
+
+@mcp.tool()
+def save_serial_script(name: str, steps: list[dict], description: str = None) -> dict:
+    """保存命令脚本到 scripts.json（同名脚本会被覆盖），之后可用 run_serial_script(name=...) 执行
+    
+    Args:
+        name: 脚本名称
+        steps: 步骤列表，格式同 run_serial_script
+        description: 脚本说明
+    
+    Returns:
+        保存结果
+    """
+    try:
+        validate_steps(steps)
+        scripts = [script for script in config.load_scripts() if script.get("name") != name]
+        script = {"name": name, "steps": steps}
+        if description:
+            script["description"] = description
+        scripts.append(script)
+        config.save_scripts(scripts)
+        return {
+            "status": "success",
+            "message": f"脚本 {name!r} 已保存（{len(steps)} 步）",
+            "name": name
+        }
+    except ValueError as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+@mcp.tool()
+def list_serial_scripts() -> dict:
+    """列出 scripts.json 中已保存的命令脚本"""
+    scripts = config.load_scripts()
+    return {
+        "status": "success",
+        "message": f"共有 {len(scripts)} 个脚本",
+        "scripts": scripts
+    }
+
 # TODO: 添加更多工具
 
+def _put_logs(response, key, shaped):
+    """将 shape_entries 的结果放入响应: 普通模式为 key 下的行列表，紧凑模式为 columns"""
+    if shaped.columns is not None:
+        response["columns"] = shaped.columns
+    else:
+        response[key] = shaped.lines
+
 def set_serial_service(service: SerialService):
     """设置全局串口服务实例"""
     global serial_service
@@ -264,12 +929,21 @@ class McpService:
     """
     def __init__(self, serial_service: SerialService):
         # 设置全局串口服务
+        self.serial_service = serial_service
         set_serial_service(serial_service)
 
     def start(self):
         """启动MCP服务器（STDIO 模式）"""
         print("MCP Server starting (STDIO mode)")
-        mcp.run(transport="stdio")
+        if self.serial_service.backend == "asyncio":
+            # asyncio 串口后端与 MCP 服务共享同一个事件循环
+            asyncio.run(self._run_stdio_with_serial())
+        else:
+            mcp.run(transport="stdio")
+
+    async def _run_stdio_with_serial(self):
+        self.serial_service.attach_loop(asyncio.get_running_loop())
+        await mcp.run_stdio_async()
 
     def stop(self):
         """停止MCP服务器"""
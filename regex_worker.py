@@ -0,0 +1,138 @@
+import multiprocessing
+import re
+import threading
+import time
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+# 等待子进程结果时检查取消和截止时间的间隔（秒）
+POLL_INTERVAL = 0.05
+
+_REPEATS = tuple(getattr(sre_constants, name) for name in
+                 ('MAX_REPEAT', 'MIN_REPEAT') if hasattr(sre_constants, name))
+_NESTED = tuple(getattr(sre_constants, name) for name in
+                ('SUBPATTERN', 'ASSERT', 'ASSERT_NOT') if hasattr(sre_constants, name))
+
+
+def is_risky(regex):
+    """
+    判断正则是否可能发生灾难性回溯: 可重复多次的量词内部还有量词或分支（如 (a+)+、(a|aa)*），
+    或使用了反向引用。Python 的 re 在匹配期间不释放 GIL，这类模式应放到子进程中执行。
+    """
+    try:
+        parsed = sre_parse.parse(regex.pattern, regex.flags)
+    except Exception:
+        return True
+    return _risky(parsed.data, False)
+
+
+def _risky(items, repeated):
+    for op, av in items:
+        if op in _REPEATS:
+            _low, high, sub = av
+            if repeated:
+                return True
+            if _risky(sub.data, high > 1):
+                return True
+        elif op is sre_constants.BRANCH:
+            if repeated:
+                return True
+            if any(_risky(sub.data, repeated) for sub in av[1]):
+                return True
+        elif op in (sre_constants.GROUPREF, getattr(sre_constants, 'GROUPREF_EXISTS', None)):
+            return True
+        elif op in _NESTED:
+            if _risky(av[-1].data, repeated):
+                return True
+    return False
+
+
+def _worker_main(conn):
+    """子进程: 逐批接收 (pattern, flags, texts)，每找到一个匹配发送其下标，整批完成后发送 None"""
+    compiled = {}
+    while True:
+        try:
+            pattern, flags, texts = conn.recv()
+        except (EOFError, OSError):
+            return
+        regex = compiled.get((pattern, flags))
+        if regex is None:
+            regex = compiled[(pattern, flags)] = re.compile(pattern, flags)
+        for i, text in enumerate(texts):
+            if regex.search(text):
+                conn.send(i)
+        conn.send(None)
+
+
+class RegexWorker:
+    """
+    在子进程中执行有回溯风险的正则。子进程按需启动并复用，
+    超过截止时间或被取消时直接终止子进程（下次使用时重新启动），不会阻塞调用方所在的进程。
+    """
+
+    def __init__(self):
+        self._context = multiprocessing.get_context("spawn")
+        self._process = None
+        self._conn = None
+        self._lock = threading.Lock()
+        self.restarts = 0
+
+    def match(self, regex, texts, deadline=None, cancel=None):
+        """
+        返回 (匹配的下标列表, 是否完成)。
+        到达 deadline（time.monotonic() 时间）或 cancel 被设置时终止子进程，返回此前已找到的匹配和 False。
+        """
+        timeout = -1 if deadline is None else max(0.0, deadline - time.monotonic())
+        if not self._lock.acquire(timeout=timeout):
+            return [], False
+        hits = []
+        try:
+            if self._process is None or not self._process.is_alive():
+                self._start()
+            self._conn.send((regex.pattern, regex.flags, texts))
+            while True:
+                wait = POLL_INTERVAL
+                if deadline is not None:
+                    wait = max(0.0, min(wait, deadline - time.monotonic()))
+                while self._conn.poll(wait):
+                    index = self._conn.recv()
+                    if index is None:
+                        return hits, True
+                    hits.append(index)
+                    wait = 0
+                if (cancel is not None and cancel.is_set()) or \
+                        (deadline is not None and time.monotonic() >= deadline):
+                    self._stop()
+                    return hits, False
+        except (EOFError, OSError) as e:
+            self._stop()
+            raise RuntimeError(f"正则工作进程异常退出: {e}")
+        finally:
+            self._lock.release()
+
+    def _start(self):
+        parent, child = self._context.Pipe()
+        process = self._context.Process(target=_worker_main, args=(child,), daemon=True,
+                                        name="regex-worker")
+        process.start()
+        child.close()
+        if self._process is not None:
+            self.restarts += 1
+        self._process, self._conn = process, parent
+
+    def _stop(self):
+        if self._process is not None:
+            self._process.kill()
+            self._process.join(1)
+        if self._conn is not None:
+            self._conn.close()
+        self._conn = None
+
+    def close(self):
+        with self._lock:
+            self._stop()
+            self._process = None
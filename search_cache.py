@@ -0,0 +1,316 @@
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, namedtuple
+from itertools import islice
+
+from log_index import plan_query
+from log_store import entry_text
+from regex_worker import RegexWorker, is_risky
+
+# 按序号取回匹配条目时每批的数量；一批序号足够密集时整段读取快照，否则逐条读取
+FETCH_BATCH = 256
+# 线程内扫描时每隔多少行检查一次截止时间和取消标志
+CHECK_INTERVAL = 64
+# 有回溯风险的正则每批发送给子进程的行数
+WORKER_BATCH = 2048
+# 增量扫描的行数超过该值且有查询计划时，改用索引筛选候选行
+INDEX_MIN_LINES = 4096
+
+# 搜索结果: seqs 为匹配条目的序号（从旧到新）；stopped 为 None 表示扫描完整，
+# 否则为 "timed_out" / "cancelled"，此时 seqs 只包含已扫描部分的匹配
+SearchResult = namedtuple('SearchResult', 'seqs stopped')
+
+
+def _slice(seqs, start, end):
+    """截取递增序号数组中位于 [start, end) 内的部分"""
+    lo = 0 if start is None else bisect_left(seqs, start)
+    hi = len(seqs) if end is None else bisect_left(seqs, end)
+    return seqs[lo:hi]
+
+
+_GLOBAL_FLAGS_RE = re.compile(r'^\(\?([ims]+)\)')
+_SCOPED_FLAGS = {re.IGNORECASE: 'i', re.MULTILINE: 'm', re.DOTALL: 's'}
+
+
+def _combined(regexes):
+    """
+    把多个正则组合为一个分支正则，用作“是否可能有模式匹配”的预筛选；
+    开头的全局标志改写为局部标志组，无法安全组合时（如 ASCII/VERBOSE 标志、重名的分组）返回 None。
+    """
+    branches = []
+    for regex in regexes:
+        if regex.flags & (re.ASCII | re.LOCALE | re.VERBOSE):
+            return None
+        body = _GLOBAL_FLAGS_RE.sub('', regex.pattern, count=1)
+        flags = ''.join(letter for flag, letter in _SCOPED_FLAGS.items() if regex.flags & flag)
+        branches.append(f"(?{flags}:{body})" if flags else f"(?:{body})")
+    try:
+        return re.compile('|'.join(branches))
+    except re.error:
+        return None
+
+
+class _CachedResult:
+    """一个模式的增量搜索结果: 已扫描到的序号（不含）以及此前所有匹配条目的序号"""
+
+    __slots__ = ('scanned_to', 'seqs')
+
+    def __init__(self, scanned_to, seqs):
+        self.scanned_to = scanned_to
+        self.seqs = seqs
+
+
+def fetch_entries(store, seqs):
+    """按序号（递增）从旧到新取回条目，跳过已被淘汰的"""
+    for pos in range(0, len(seqs), FETCH_BATCH):
+        batch = seqs[pos:pos + FETCH_BATCH]
+        if batch[-1] - batch[0] < 4 * len(batch):
+            wanted = set(batch)
+            yield from (e for e in store.iter_entries(batch[0], batch[-1] + 1) if e.seq in wanted)
+            continue
+        for seq in batch:
+            try:
+                yield store.entry(seq)
+            except IndexError:
+                continue
+
+
+class SearchCache:
+    """
+    日志搜索缓存。
+    - 编译缓存: 按 LRU 保存最近使用的正则表达式及其索引查询计划，避免重复编译和解析；
+    - 结果缓存: 按模式记录上次扫描到的序号和全部匹配的序号。重复查询时只扫描之后新到达的行，
+      并丢弃已被淘汰的匹配，因此反复轮询同一模式的开销只与新数据量有关。
+    缓存只被读取方使用，内部的小锁只保护缓存字典本身，扫描在锁外进行，不影响日志写入。
+
+    搜索可以指定截止时间和取消标志，到时停止并返回已找到的部分匹配；已扫描的进度仍会缓存，
+    下次查询从中断处继续。有灾难性回溯风险的正则（见 regex_worker.is_risky）在子进程中匹配，
+    超时即终止子进程，不会长时间占用 GIL 而阻塞日志写入。
+    """
+
+    def __init__(self, max_patterns=64, max_results=32, use_index=True):
+        self.max_patterns = max_patterns
+        self.max_results = max_results
+        self.use_index = use_index
+        self._compiled = OrderedDict()  # pattern -> (regex, plan, risky)
+        self._results = OrderedDict()   # pattern -> _CachedResult
+        self._lock = threading.Lock()
+        self.compile_hits = 0
+        self.compile_misses = 0
+        self.result_hits = 0
+        self.result_misses = 0
+        self.incremental_lines = 0      # 命中结果缓存时增量扫描的行数
+        self.timeouts = 0
+        self.cancellations = 0
+        self.worker_queries = 0         # 在子进程中执行的查询数
+        self._worker = RegexWorker()
+
+    def compile(self, pattern):
+        """返回 (已编译的正则, 查询计划, 是否有回溯风险)，无效的正则抛出 ValueError"""
+        with self._lock:
+            compiled = self._compiled.get(pattern)
+            if compiled is not None:
+                self._compiled.move_to_end(pattern)
+                self.compile_hits += 1
+                return compiled
+            self.compile_misses += 1
+        try:
+            regex = re.compile(pattern)
+        except re.error as e:
+            raise ValueError(f"无效的正则表达式: {e}")
+        compiled = (regex, plan_query(regex) if self.use_index else None, is_risky(regex))
+        with self._lock:
+            self._compiled[pattern] = compiled
+            while len(self._compiled) > self.max_patterns:
+                self._compiled.popitem(last=False)
+        return compiled
+
+    def search(self, store, pattern, deadline=None, cancel=None, start=None, end=None):
+        """
+        搜索 store 中匹配 pattern 的条目，尽量只扫描新到达的行，返回 SearchResult。
+        deadline 为 time.monotonic() 截止时间，cancel 为 threading.Event，任一触发即停止扫描。
+        指定序号窗口 [start, end) 时只返回窗口内的匹配: 已有缓存结果时直接截取，
+        否则只扫描窗口内的行（结果不写入缓存）。
+        """
+        regex, plan, risky = self.compile(pattern)
+        with self._lock:
+            cached = self._results.get(pattern)
+            if cached is not None:
+                self._results.move_to_end(pattern)
+        windowed = start is not None or end is not None
+        if windowed and cached is None:
+            stop = store.next_seq if end is None else min(end, store.next_seq)
+            seqs = array('q')
+            _scanned_to, _scanned, stopped = self._match(
+                self._window(store, plan, start, stop), regex, risky, seqs, stop, deadline, cancel)
+            self._count(False, stopped, risky)
+            return SearchResult(seqs, stopped)
+        if windowed and end is not None and cached.scanned_to >= end:
+            # 窗口已被缓存结果完全覆盖，无需扫描
+            self._count(True, None, False)
+            return SearchResult(_slice(cached.seqs, start, end), None)
+
+        # 先确定本次扫描的上界，之后到达的行留给下一次查询
+        stop = store.next_seq
+        floor = store.first_seq
+        if cached is None:
+            seqs = array('q')
+            scan_from = None
+        else:
+            seqs = cached.seqs[bisect_left(cached.seqs, floor):]
+            scan_from = max(cached.scanned_to, floor)
+        scanned_to, scanned, stopped = self._match(
+            self._window(store, plan, scan_from, stop), regex, risky, seqs, stop, deadline, cancel)
+        self._count(cached is not None, stopped, risky, scanned)
+        with self._lock:
+            self._results[pattern] = _CachedResult(scanned_to, seqs)
+            self._results.move_to_end(pattern)
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+        if windowed:
+            seqs = _slice(seqs, start, end)
+        return SearchResult(seqs, stopped)
+
+    def search_many(self, store, patterns, limits=None, deadline=None, cancel=None, start=None, end=None,
+                    starts=None):
+        """
+        一次遍历同时搜索多个模式。patterns 为 {名称: 正则}，limits 为 {名称: 最多保留的匹配数}，
+        starts 为 {名称: 序号}，该模式只匹配不早于此序号的条目（用于各模式分别分页，缺省为 start）。
+        返回 ({名称: (匹配序号列表, 匹配总数)}, 停止原因)，匹配总数不受 limits 限制。
+        能用索引缩小范围的模式和有回溯风险的模式各自经 search() 执行（走索引和结果缓存，或在子进程中匹配）；
+        其余模式共用一次遍历: 组合分支对每行先做一次预筛选，只有命中的行才逐个模式检查。
+        """
+        limits = limits or {}
+        firsts = {name: max(starts.get(name, 0), start or 0) for name in patterns} if starts else {}
+        if firsts:
+            start = min(firsts.values())
+        compiled = {name: self.compile(pattern) for name, pattern in patterns.items()}
+        results = {}
+        stopped = None
+        shared = []
+        for name, (regex, plan, risky) in compiled.items():
+            if plan is None and not risky:
+                shared.append((name, regex))
+                continue
+            result = self.search(store, patterns[name], deadline, cancel, firsts.get(name, start), end)
+            results[name] = (list(result.seqs[:limits.get(name, len(result.seqs))]), len(result.seqs))
+            stopped = stopped or result.stopped
+        if not shared:
+            return results, stopped
+        prefilter = _combined(regex for _name, regex in shared)
+        stop = store.next_seq if end is None else min(end, store.next_seq)
+        seqs = {name: [] for name, _regex in shared}
+        counts = dict.fromkeys(seqs, 0)
+        caps = {name: limits.get(name) for name in seqs}
+        check = deadline is not None or cancel is not None
+        for scanned, entry in enumerate(store.iter_entries(start, stop)):
+            if check and scanned % CHECK_INTERVAL == 0:
+                stopped = stopped or self._stop_reason(deadline, cancel)
+                if stopped:
+                    break
+            text = entry_text(entry)
+            if prefilter is not None and not prefilter.search(text):
+                continue
+            for name, regex in shared:
+                if entry.seq >= firsts.get(name, 0) and regex.search(text):
+                    counts[name] += 1
+                    if caps[name] is None or len(seqs[name]) < caps[name]:
+                        seqs[name].append(entry.seq)
+        self._count(False, stopped, False)
+        for name in seqs:
+            results[name] = (seqs[name], counts[name])
+        return results, stopped
+
+    @staticmethod
+    def _window(store, plan, start, end):
+        """[start, end) 内需要检查的条目: 范围较大且有查询计划时用索引筛选候选行"""
+        if plan is not None and (start is None or end - start > INDEX_MIN_LINES):
+            return (e for e in store.candidate_entries(plan, end)
+                    if (start is None or e.seq >= start) and e.seq < end)
+        return store.iter_entries(start, end)
+
+    def _match(self, entries, regex, risky, seqs, end, deadline, cancel):
+        if risky:
+            return self._scan_in_worker(entries, regex, seqs, end, deadline, cancel)
+        return self._scan(entries, regex, seqs, end, deadline, cancel)
+
+    def _count(self, hit, stopped, risky, scanned=0):
+        with self._lock:
+            if hit:
+                self.result_hits += 1
+                self.incremental_lines += scanned
+            else:
+                self.result_misses += 1
+            if stopped == "timed_out":
+                self.timeouts += 1
+            elif stopped == "cancelled":
+                self.cancellations += 1
+            if risky:
+                self.worker_queries += 1
+
+    @staticmethod
+    def _stop_reason(deadline, cancel):
+        if cancel is not None and cancel.is_set():
+            return "cancelled"
+        if deadline is not None and time.monotonic() >= deadline:
+            return "timed_out"
+        return None
+
+    def _scan(self, entries, regex, seqs, end, deadline, cancel):
+        """在当前线程中扫描，返回 (下一个未扫描的序号, 扫描行数, 停止原因)"""
+        check = deadline is not None or cancel is not None
+        scanned = 0
+        for entry in entries:
+            if check and scanned % CHECK_INTERVAL == 0:
+                stopped = self._stop_reason(deadline, cancel)
+                if stopped:
+                    return entry.seq, scanned, stopped
+            scanned += 1
+            if regex.search(entry_text(entry)):
+                seqs.append(entry.seq)
+        return end, scanned, None
+
+    def _scan_in_worker(self, entries, regex, seqs, end, deadline, cancel):
+        """分批交给子进程匹配，返回值同 _scan"""
+        entries = iter(entries)
+        scanned = 0
+        while True:
+            batch = list(islice(entries, WORKER_BATCH))
+            if not batch:
+                return end, scanned, None
+            hits, done = self._worker.match(regex, [entry_text(e) for e in batch], deadline, cancel)
+            seqs.extend(batch[i].seq for i in hits)
+            if not done:
+                # 最后一个匹配之后的行是否已检查无从得知，下次从它之后重新扫描
+                resume = hits[-1] + 1 if hits else 0
+                next_seq = batch[resume].seq if resume < len(batch) else batch[-1].seq + 1
+                return next_seq, scanned + resume, self._stop_reason(deadline, cancel) or "timed_out"
+            scanned += len(batch)
+
+    def clear(self):
+        """清空结果缓存（编译缓存保留）"""
+        with self._lock:
+            self._results.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "compiled_patterns": len(self._compiled),
+                "cached_results": len(self._results),
+                "compile_hits": self.compile_hits,
+                "compile_misses": self.compile_misses,
+                "result_hits": self.result_hits,
+                "result_misses": self.result_misses,
+                "incremental_lines": self.incremental_lines,
+                "timeouts": self.timeouts,
+                "cancellations": self.cancellations,
+                "worker_queries": self.worker_queries,
+                "worker_restarts": self._worker.restarts,
+            }
+
+    def close(self):
+        """终止正则工作子进程"""
+        self._worker.close()
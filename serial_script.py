@@ -0,0 +1,130 @@
+import asyncio
+import re
+
+# 步骤类型: send 发送命令，expect 等待匹配的行，capture 等待匹配的行并把捕获组保存为变量，sleep 等待若干秒
+STEP_TYPES = ("send", "expect", "capture", "sleep")
+# 单个脚本最多的步骤数
+MAX_STEPS = 200
+# 步骤中引用变量的写法: ${name}
+_VARIABLE_RE = re.compile(r'\$\{(\w+)\}')
+
+
+def validate_steps(steps):
+    """
+    检查脚本步骤，返回 [(类型, 步骤), ...]；格式错误时抛出 ValueError。
+    每个步骤是只含一种类型键的字典，例如:
+    {"send": "AT", "hex": false, "newline": true}
+    {"expect": "^OK$", "timeout": 2, "optional": false}
+    {"capture": "version:(\\S+)", "var": "version", "group": 1, "timeout": 2}
+    {"sleep": 0.5}
+    """
+    if not isinstance(steps, list) or not steps:
+        raise ValueError("脚本至少需要一个步骤")
+    if len(steps) > MAX_STEPS:
+        raise ValueError(f"脚本步骤过多（最多 {MAX_STEPS} 步）")
+    plan = []
+    for index, step in enumerate(steps, 1):
+        kinds = [kind for kind in STEP_TYPES if isinstance(step, dict) and kind in step]
+        if len(kinds) != 1:
+            raise ValueError(f"第 {index} 步必须且只能包含 {'/'.join(STEP_TYPES)} 之一: {step!r}")
+        kind = kinds[0]
+        value = step[kind]
+        if kind == "sleep":
+            if not isinstance(value, (int, float)) or value < 0:
+                raise ValueError(f"第 {index} 步的等待时间无效: {value!r}")
+        elif not isinstance(value, str):
+            raise ValueError(f"第 {index} 步的 {kind} 必须是字符串: {value!r}")
+        timeout = step.get("timeout")
+        if timeout is not None and (not isinstance(timeout, (int, float)) or timeout <= 0):
+            raise ValueError(f"第 {index} 步的超时时间无效: {timeout!r}")
+        if kind == "capture" and not step.get("var"):
+            raise ValueError(f"第 {index} 步缺少保存捕获结果的变量名 var")
+        if kind in ("expect", "capture") and not _VARIABLE_RE.search(value):
+            try:
+                regex = re.compile(value)
+            except re.error as e:
+                raise ValueError(f"第 {index} 步的正则表达式无效: {e}")
+            group = step.get("group", 1)
+            if kind == "capture" and not (group in regex.groupindex or
+                                          isinstance(group, int) and 0 <= group <= regex.groups):
+                raise ValueError(f"第 {index} 步的正则表达式中没有捕获组 {group!r}")
+        plan.append((kind, step))
+    return plan
+
+
+def substitute(text, variables):
+    """将 ${name} 替换为变量的值，引用未定义的变量时抛出 ValueError"""
+    def replace(match):
+        name = match.group(1)
+        if name not in variables:
+            raise ValueError(f"未定义的变量: {name}")
+        return str(variables[name])
+    return _VARIABLE_RE.sub(replace, text)
+
+
+async def run_script(service, steps, variables=None, default_timeout=5.0):
+    """
+    在服务端依次执行脚本步骤，返回结果字典（ok、failed_step、variables、每步的记录 steps 和总耗时）。
+    expect / capture 从上一次匹配之后（首次为脚本开始时）的日志开始查找，匹配后游标移到匹配行之后；
+    超时的步骤使脚本失败并停止，除非该步骤设置了 "optional": true。
+    发送以交互优先级排队，并等待写出完成后再执行下一步。
+    """
+    plan = validate_steps(steps)
+    variables = dict(variables or {})
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    cursor = service.log_cursor()
+    transcript = []
+    failed_step = None
+    for index, (kind, step) in enumerate(plan, 1):
+        step_started = loop.time()
+        record = {"step": index, "type": kind}
+        ok = True
+        try:
+            if kind == "send":
+                command = substitute(step["send"], variables)
+                await asyncio.wrap_future(service.send_async(command, step.get("hex", False),
+                                                             step.get("newline", True), "interactive"))
+                record["sent"] = command
+            elif kind == "sleep":
+                await asyncio.sleep(step["sleep"])
+            else:
+                pattern = substitute(step[kind], variables)
+                timeout = step.get("timeout", default_timeout)
+                result = await service.wait_for_pattern(pattern, timeout, since_cursor=cursor)
+                if result.matched:
+                    cursor = result.next_cursor
+                    record["line"] = result.line
+                    if kind == "capture":
+                        value = re.search(pattern, result.text).group(step.get("group", 1))
+                        variables[step["var"]] = value
+                        record["value"] = value
+                else:
+                    ok = bool(step.get("optional"))
+                    record["error"] = f"{timeout} 秒内未出现匹配 {pattern!r} 的日志"
+        except (RuntimeError, ValueError, OSError, IndexError, re.error) as e:
+            ok = False
+            record["error"] = str(e)
+        record["ok"] = ok
+        record["elapsed_ms"] = round((loop.time() - step_started) * 1000, 3)
+        transcript.append(record)
+        if not ok:
+            failed_step = index
+            break
+    return {
+        "ok": failed_step is None,
+        "failed_step": failed_step,
+        "variables": variables,
+        "steps": transcript,
+        "elapsed_ms": round((loop.time() - started) * 1000, 3),
+        "next_cursor": cursor,
+    }
+
+
+def find_script(scripts, name):
+    """在 config.load_scripts() 的脚本列表中按名称查找，返回其步骤；不存在时抛出 ValueError"""
+    for script in scripts:
+        if script.get("name") == name:
+            return script.get("steps", [])
+    names = "、".join(script.get("name", "?") for script in scripts) or "无"
+    raise ValueError(f"未找到脚本 {name!r}（已保存的脚本: {names}）")
@@ -0,0 +1,157 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future, InvalidStateError
+
+# 发送优先级: 数值越小越先发送，同一优先级内按提交顺序发送
+PRIORITIES = {"interactive": 0, "normal": 1, "bulk": 2}
+
+# 一次发送的结果: started_ns / finished_ns 为开始和完成写入的单调时钟时间（纳秒），size 为字节数
+WriteReceipt = namedtuple('WriteReceipt', 'started_ns finished_ns size')
+
+
+class SerialWriter:
+    """
+    串口专用写线程。发送请求进入有界的优先级队列，由写线程按优先级依次写出，
+    调用方立即得到 concurrent.futures.Future，不会因为慢速或有流控的写入而阻塞。
+    byte_delay 为字节之间的间隔、line_delay 为两次发送之间的间隔（秒），用于接收 FIFO 很小的设备。
+    write 也可以返回 Future（如交给事件循环线程写入），写线程不等待它，而是在它完成时结束这次发送。
+    """
+
+    def __init__(self, write, max_queue=256, byte_delay=0.0, line_delay=0.0, on_error=None,
+                 name="serial-writer"):
+        self._write = write
+        self.max_queue = max_queue
+        self.byte_delay = byte_delay
+        self.line_delay = line_delay
+        self._on_error = on_error
+        self._queue = []
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._writes = 0
+        self._bytes = 0
+        self._failures = 0
+        self._rejected = 0
+        self._busy_ns = 0
+        self._inflight = set()
+        self._thread = threading.Thread(target=self._run, daemon=True, name=name)
+        self._thread.start()
+
+    def submit(self, data, priority="normal"):
+        """
+        提交一次发送，返回结果为 WriteReceipt 的 Future。
+        队列已满或写线程已关闭时返回已设置 RuntimeError 的 Future；优先级无效时抛出 ValueError。
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"无效的发送优先级: {priority!r}（可选 {'、'.join(PRIORITIES)}）")
+        future = Future()
+        with self._cond:
+            if self._closed:
+                future.set_exception(RuntimeError("串口已断开，发送队列已关闭"))
+            elif len(self._queue) >= self.max_queue:
+                self._rejected += 1
+                future.set_exception(RuntimeError(f"发送队列已满（{self.max_queue} 条）"))
+            else:
+                heapq.heappush(self._queue, (PRIORITIES[priority], next(self._order), data, future))
+                self._cond.notify()
+        return future
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                _priority, _order, data, future = heapq.heappop(self._queue)
+            if not future.set_running_or_notify_cancel():
+                continue
+            started = time.monotonic_ns()
+            try:
+                pending = self._write_paced(data)
+            except Exception as e:
+                self._finish(future, data, started, e)
+                continue
+            if isinstance(pending, Future):
+                with self._cond:
+                    self._inflight.add(future)
+                pending.add_done_callback(
+                    lambda done, future=future, data=data, started=started:
+                    self._finish(future, data, started, done.exception()))
+            else:
+                self._finish(future, data, started, None)
+            if self.line_delay > 0:
+                time.sleep(self.line_delay)
+
+    def _finish(self, future, data, started, error):
+        finished = time.monotonic_ns()
+        with self._cond:
+            self._inflight.discard(future)
+            if error is None:
+                self._writes += 1
+                self._bytes += len(data)
+                self._busy_ns += finished - started
+            else:
+                self._failures += 1
+        try:
+            if error is None:
+                future.set_result(WriteReceipt(started, finished, len(data)))
+            else:
+                future.set_exception(error)
+        except InvalidStateError:
+            return  # 已由 close() 结束
+        if error is not None and self._on_error is not None:
+            self._on_error(error)
+
+    def _write_paced(self, data):
+        """写出一次发送，返回最后一次写入的返回值（按顺序写入，最后一次完成即全部完成）"""
+        if self.byte_delay <= 0:
+            return self._write(data)
+        result = None
+        for i in range(len(data)):
+            if i:
+                time.sleep(self.byte_delay)
+            result = self._write(data[i:i + 1])
+        return result
+
+    def stats(self):
+        """队列深度（按优先级）和写入吞吐量统计"""
+        with self._cond:
+            depth = dict.fromkeys(PRIORITIES, 0)
+            names = {value: name for name, value in PRIORITIES.items()}
+            for priority, _order, _data, _future in self._queue:
+                depth[names[priority]] += 1
+            return {
+                "queue_depth": len(self._queue),
+                "queue_by_priority": depth,
+                "max_queue": self.max_queue,
+                "writes": self._writes,
+                "bytes_written": self._bytes,
+                "failed_writes": self._failures,
+                "rejected_sends": self._rejected,
+                "bytes_per_second": round(self._bytes * 1e9 / self._busy_ns, 1) if self._busy_ns else None,
+            }
+
+    def close(self):
+        """
+        关闭写线程，尚未写出的发送以 RuntimeError 结束（正在写出的一次会写完）；
+        已交出但写入尚未完成的异步发送同样以 RuntimeError 结束，不再等待。
+        """
+        with self._cond:
+            self._closed = True
+            pending, self._queue = self._queue, []
+            inflight, self._inflight = self._inflight, set()
+            self._cond.notify_all()
+        for _priority, _order, _data, future in pending:
+            if future.set_running_or_notify_cancel():
+                future.set_exception(RuntimeError("串口已断开，发送已取消"))
+        for future in inflight:
+            try:
+                future.set_exception(RuntimeError("串口已断开，发送已取消"))
+            except InvalidStateError:
+                pass
+        if threading.current_thread() is not self._thread:
+            self._thread.join(1)
@@ -1,77 +1,245 @@
+import asyncio
 import serial
 import serial.tools.list_ports
+import sys
 import threading
-from datetime import datetime
-from collections import deque
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+from contextlib import contextmanager
 from PyQt6.QtCore import QObject, pyqtSignal
 
+from async_transport import AsyncSerialTransport
+from byte_pattern import BytePattern
+from line_framer import LineFramer
+from log_retention import ClassifiedLogStore, RetentionClass
+from log_aggregate import aggregate_entries
+from log_response import ResponseBudget, line_cost, shape_entries, shape_line
+from log_store import (FLAG_BINARY, LogStore, TieredLogStore, entry_text, expand_entry, format_entry,
+                       format_timestamp, wall_time_ns)
+from search_cache import CHECK_INTERVAL, INDEX_MIN_LINES, SearchCache, fetch_entries
+from serial_writer import PRIORITIES, SerialWriter
+from time_range import parse_time_range
+
+# send_and_collect 未给出结束模式时判定响应结束的默认空闲间隔（秒）
+DEFAULT_IDLE_GAP = 0.5
+
+
 class SerialService(QObject):
     """
     封装了所有串口通信逻辑的服务层。
     这个类是线程安全的，可以在GUI和MCP服务之间共享。
     """
     # Signals for GUI to connect to
-    data_received = pyqtSignal(str)  # 原始hex数据
-    text_data_received = pyqtSignal(str)  # 解码后的文本数据（不带时间戳）
+    lines_received = pyqtSignal(list)  # 批量接收的行，LineRecord 列表（按时间片或行数合并发送）
+    data_received = pyqtSignal(str)  # 原始hex数据（逐行，仅在有连接时发送）
+    text_data_received = pyqtSignal(str)  # 解码后的文本数据（逐行，不带时间戳，仅在有连接时发送）
     connection_status_changed = pyqtSignal(bool, str) # is_connected, message
     error_occurred = pyqtSignal(str)
 
-    def __init__(self, max_log_lines=1000):
+    def __init__(self, max_log_lines=1000, line_idle_timeout=0.2, backend="thread", log_arena_bytes=None,
+                 log_byte_budget=None, log_max_age=None, log_warm_budget=None, log_warm_codec="zlib",
+                 log_retention_classes=(), log_dedup="off", log_search_index=False,
+                 signal_batch_interval=0.05, signal_batch_lines=256, search_time_budget=5.0,
+                 send_queue_size=256, write_byte_delay=0.0, write_line_delay=0.0):
         super().__init__()
         self.serial_port = None
         self._is_running = False
         self._reader_thread = None
         self._lock = threading.Lock()
+
+        # 读写后端: "thread" 使用独立读取线程; "asyncio" 将串口注册到 attach_loop() 绑定的事件循环
+        self.backend = backend
+        self._loop = None
+        self._transport = None
+        self._idle_flush_handle = None
+
+        # 发送: 连接期间由专用写线程从有界优先级队列中依次写出（见 serial_writer.SerialWriter），
+        # write_byte_delay / write_line_delay 为字节间和两次发送之间的间隔（秒）
+        self.send_queue_size = send_queue_size
+        self.write_byte_delay = write_byte_delay
+        self.write_line_delay = write_line_delay
+        self._writer = None
+
+        # 等待新数据的协程（由 wait_for_data 注册）
+        self._data_waiters = []
+        self._waiters_lock = threading.Lock()
         
-        # 日志缓冲区 - 使用 deque 实现固定大小的环形缓冲区
+        # 日志缓冲区 - 列式环形缓冲区，保存原始字节和单调时间戳，读取时才解码和格式化
+        # 指定 log_byte_budget 时按字节预算保留（行数上限由预算推算），否则按 max_log_lines 行保留
+        # 指定 log_warm_budget 时，被挤出的旧日志压缩后保存在温层中继续可查
+        # 配置了保留类别时，匹配的行（如错误）进入各自独立配额的缓冲区，不会被大量噪声挤出
+        # log_dedup 为 "exact"/"template" 时，连续重复的行折叠为一条并记录重复次数
+        # log_search_index 为 True 时维护三元组倒排索引，正则搜索只检查可能匹配的行
+        self.log_search_index = log_search_index
+        hot_store = LogStore(None if log_byte_budget else max_log_lines, log_arena_bytes,
+                             byte_budget=log_byte_budget, max_age=log_max_age, indexed=log_search_index)
+        classes = [RetentionClass.from_config(item, log_warm_codec, log_search_index)
+                   for item in log_retention_classes]
+        self._log_store = ClassifiedLogStore(
+            TieredLogStore(hot_store, warm_budget=log_warm_budget, codec=log_warm_codec), classes,
+            dedup=log_dedup)
+        # 按行数保留时的行数（按字节预算保留时用于切换回按行数保留）
         self.max_log_lines = max_log_lines
-        self._log_buffer = deque(maxlen=max_log_lines)
+        # 日志缓冲区单写多读: 只有写入（追加、清空、修改保留策略、淘汰超龄条目）之间需要加锁，
+        # 读取和搜索不加锁，取一致快照后在锁外进行，不会阻塞读取线程写入
         self._log_lock = threading.Lock()
+        # 搜索缓存: 已编译的正则（LRU）和每个模式的增量匹配结果
+        self._search_cache = SearchCache(use_index=log_search_index)
+        # 单次搜索的默认时间预算（秒），超时返回部分结果；None 表示不限制
+        self.search_time_budget = search_time_budget
         
-        # 时间戳显示设置
+        # 时间戳显示设置（仅影响读取时的格式化）
         self.show_timestamp = True
 
+        # 增量分帧器：跨读取保留不完整的行，空闲超时后冲刷无换行的数据（如提示符）
+        self.line_idle_timeout = line_idle_timeout
+        self._framer = LineFramer(idle_timeout=line_idle_timeout)
+
+        # 界面通知批量发送: 距上次发送超过 signal_batch_interval 秒或累计 signal_batch_lines 行时
+        # 发送一次 lines_received；没有连接任何槽时不构造也不发送
+        self.signal_batch_interval = signal_batch_interval
+        self.signal_batch_lines = signal_batch_lines
+        self._line_batch = []
+        self._last_batch_emit = 0.0
+        self._batch_flush_handle = None
+
+    @classmethod
+    def from_config(cls, app_config, **kwargs):
+        """根据 config.json 中的配置创建服务实例，kwargs 可覆盖其中的参数"""
+        options = {
+            "max_log_lines": app_config.get("max_log_lines", 1000),
+            "line_idle_timeout": app_config.get("line_idle_timeout", 0.2),
+            "log_byte_budget": app_config.get("log_byte_budget"),
+            "log_max_age": app_config.get("log_max_age"),
+            "log_warm_budget": app_config.get("log_warm_budget"),
+            "log_warm_codec": app_config.get("log_warm_codec", "zlib"),
+            "log_retention_classes": app_config.get("log_retention_classes") or (),
+            "log_dedup": app_config.get("log_dedup", "off"),
+            "log_search_index": app_config.get("log_search_index", False),
+            "search_time_budget": app_config.get("search_time_budget", 5.0),
+            "send_queue_size": app_config.get("send_queue_size", 256),
+            "write_byte_delay": app_config.get("write_byte_delay", 0.0),
+            "write_line_delay": app_config.get("write_line_delay", 0.0),
+        }
+        options.update(kwargs)
+        return cls(**options)
+
     def get_available_ports(self):
         """获取系统上所有可用的串口列表"""
         return serial.tools.list_ports.comports()
 
+    def attach_loop(self, loop):
+        """绑定 asyncio 事件循环，asyncio 后端将在该循环上读写串口"""
+        self._loop = loop
+
+    def active_backend(self):
+        """返回当前连接实际使用的后端名称"""
+        return "asyncio" if self._use_async_backend() else "thread"
+
+    def _use_async_backend(self):
+        """asyncio 后端需要已绑定的事件循环以及支持 fileno()/add_reader 的平台"""
+        return (self.backend == "asyncio"
+                and self._loop is not None
+                and not self._loop.is_closed()
+                and sys.platform != "win32"
+                and hasattr(serial.Serial, "fileno"))
+
+    def _in_loop_thread(self):
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _call_in_loop(self, callback, *args):
+        """在事件循环线程中执行回调（已在循环线程中则直接执行）"""
+        if self._in_loop_thread():
+            return callback(*args)
+        self._loop.call_soon_threadsafe(callback, *args)
+        return None
+
     def connect(self, port, baudrate):
         """连接到指定的串口"""
-        with self._lock:
-            if self.serial_port and self.serial_port.is_open:
-                if self.serial_port.port == port and self.serial_port.baudrate == baudrate:
-                    return # Already connected to the same port
-                self.disconnect() # Disconnect if connecting to a new port
+        replaced = None
+        try:
+            with self._lock:
+                if self.serial_port and self.serial_port.is_open:
+                    if self.serial_port.port == port and self.serial_port.baudrate == baudrate:
+                        return # Already connected to the same port
+                    replaced = self._disconnect_locked() # Disconnect if connecting to a new port
 
-            try:
-                self.serial_port = serial.Serial(port, baudrate, timeout=0.1)
-                self._is_running = True
-                self._reader_thread = threading.Thread(target=self._read_data, daemon=True)
-                self._reader_thread.start()
-                self.connection_status_changed.emit(True, f"已连接到 {port} @ {baudrate} bps")
-                return True
-            except serial.SerialException as e:
-                self.error_occurred.emit(f"无法打开串口 {port}: {e}")
-                self.serial_port = None
-                return False
+                try:
+                    self._framer = LineFramer(idle_timeout=self.line_idle_timeout)
+                    if self._use_async_backend():
+                        self.serial_port = serial.Serial(port, baudrate, timeout=0)
+                        self._transport = AsyncSerialTransport(
+                            self.serial_port, self._loop, self._on_async_data, self._on_async_error)
+                        self._call_in_loop(self._transport.start)
+                        write = self._loop_writer(self._transport)
+                    else:
+                        self.serial_port = serial.Serial(port, baudrate, timeout=0.1)
+                        self._is_running = True
+                        self._reader_thread = threading.Thread(target=self._read_data, daemon=True)
+                        self._reader_thread.start()
+                        write = self.serial_port.write
+                    self._writer = SerialWriter(write, self.send_queue_size, self.write_byte_delay,
+                                                self.write_line_delay, on_error=self._on_write_error)
+                    self.connection_status_changed.emit(True, f"已连接到 {port} @ {baudrate} bps")
+                    return True
+                except serial.SerialException as e:
+                    self.error_occurred.emit(f"无法打开串口 {port}: {e}")
+                    self.serial_port = None
+                    return False
+        finally:
+            # 旧连接的写线程在释放锁后关闭，见 disconnect()
+            if replaced is not None:
+                replaced.close()
 
     def disconnect(self):
         """断开当前串口连接"""
         with self._lock:
-            if self.serial_port and self.serial_port.is_open:
-                self._is_running = False
+            writer = self._disconnect_locked()
+        # 释放锁后再等待写线程退出，正在写入的一次不会拖住其他需要 _lock 的调用
+        if writer is not None:
+            writer.close()
+
+    def _disconnect_locked(self):
+        """关闭串口并返回已摘下的写线程，由调用方在释放 _lock 后关闭"""
+        writer, self._writer = self._writer, None
+        if self.serial_port and self.serial_port.is_open:
+            self._is_running = False
+            if self._transport:
+                # asyncio 后端: 先从事件循环注销文件描述符再关闭串口
+                self._call_in_loop(self._close_async_transport, self._transport, self.serial_port)
+                self._transport = None
+            else:
                 # The thread will exit on its own
                 self.serial_port.close()
-                self.serial_port = None
-                self.connection_status_changed.emit(False, "连接已断开")
+            self.serial_port = None
+            self.connection_status_changed.emit(False, "连接已断开")
+        return writer
 
-    def send(self, data, is_hex=False, add_newline=True):
-        """发送数据到串口"""
-        with self._lock:
-            if not self.is_connected():
-                self.error_occurred.emit("发送失败: 串口未连接。")
-                return False
-            
+    def send(self, data, is_hex=False, add_newline=True, priority="normal"):
+        """
+        发送数据到串口: 放入发送队列后立即返回，不等待写入完成。
+        返回 False 表示未连接、数据无效或队列已满（同时发出 error_occurred）；写入失败经 error_occurred 报告。
+        需要写入结果或时间时使用 send_async。
+        """
+        future = self.send_async(data, is_hex, add_newline, priority)
+        return not future.done() or future.exception() is None
+
+    def send_async(self, data, is_hex=False, add_newline=True, priority="normal"):
+        """
+        将数据放入发送队列，返回结果为 serial_writer.WriteReceipt 的 concurrent.futures.Future。
+        priority 为 "interactive"、"normal" 或 "bulk"，交互命令可以越过排队中的批量发送。
+        """
+        future = Future()
+        writer = self._writer
+        if not self.is_connected() or writer is None:
+            future.set_exception(RuntimeError("串口未连接"))
+        elif priority not in PRIORITIES:
+            future.set_exception(ValueError(f"无效的发送优先级: {priority!r}"))
+        else:
             try:
                 if is_hex:
                     byte_data = bytes.fromhex(data.replace(" ", ""))
@@ -79,98 +247,854 @@ class SerialService(QObject):
                     if add_newline:
                         data += '\r\n'
                     byte_data = data.encode('utf-8')
-                
-                self.serial_port.write(byte_data)
-                return True
-            except (ValueError, serial.SerialException) as e:
-                self.error_occurred.emit(f"发送失败: {e}")
-                return False
+                future = writer.submit(byte_data, priority)
+            except ValueError as e:
+                future.set_exception(e)
+        if future.done() and future.exception() is not None:
+            self.error_occurred.emit(f"发送失败: {future.exception()}")
+        return future
+
+    def get_writer_stats(self):
+        """发送队列深度和写入吞吐量；未连接时返回 None"""
+        writer = self._writer
+        return writer.stats() if writer is not None else None
+
+    def _loop_writer(self, transport):
+        """
+        asyncio 后端的写函数: 把写入交给事件循环线程，返回传输接受数据后完成的 Future。
+        写线程不等待事件循环（断开连接时事件循环线程可能正等待 _lock），由 SerialWriter 在 Future 完成时结束发送。
+        """
+        def write(data):
+            done = Future()
+
+            def on_loop():
+                if transport.write(data) is False:
+                    done.set_exception(serial.SerialException("串口传输已关闭"))
+                else:
+                    done.set_result(None)
+            self._loop.call_soon_threadsafe(on_loop)
+            return done
+        return write
+
+    def _on_write_error(self, exc):
+        self.error_occurred.emit(f"发送失败: {exc}")
 
     def is_connected(self):
         """检查串口是否连接"""
         return self.serial_port is not None and self.serial_port.is_open
 
     def add_log_entry(self, log_line: str):
-        """添加日志条目到缓冲区"""
+        """添加日志条目到缓冲区，并唤醒等待新数据的协程"""
+        self._append_log(log_line.encode('utf-8'))
+        self._notify_data_waiters()
+
+    def _append_log(self, data: bytes, flags=0, timestamp_ns=None):
+        """以原始字节形式追加一行日志，记录单调时钟时间戳"""
         with self._log_lock:
-            if self.show_timestamp:
-                timestamp = datetime.now().strftime('%H:%M:%S.%f')[:-3]
-                timestamped_line = f"[{timestamp}] {log_line}"
-                self._log_buffer.append(timestamped_line)
-            else:
-                self._log_buffer.append(log_line)
+            return self._log_store.append(data, timestamp_ns, flags)
+
+    def _expire_logs(self):
+        """
+        读取前淘汰超龄条目。淘汰属于写入操作，写锁被占用时直接跳过
+        （写入方追加时本身也会淘汰），读取方从不等待写锁。
+        """
+        if self._log_lock.acquire(blocking=False):
+            try:
+                self._log_store.expire()
+            finally:
+                self._log_lock.release()
+
+    def get_log_buffer(self, expand=False):
+        """
+        获取当前日志缓冲区的所有内容，expand 为 True 时将折叠的重复行展开为多行。
+        会格式化整个缓冲区；只需要条数或部分内容时使用 log_size / get_log_head / get_recent_logs / get_log_range。
+        """
+        self._expire_logs()
+        return _format_entries(self._log_store.iter_entries(), self.show_timestamp, expand)
 
-    def get_log_buffer(self):
-        """获取当前日志缓冲区的所有内容"""
+    def get_recent_logs(self, count, expand=False, time_range=None):
+        """
+        获取最近 count 条日志（从旧到新），只读取需要的部分。
+        指定 time_range（如 "last_5min"，见 time_range.parse_time_range）时只取该时间窗口内最新的 count 条。
+        """
+        entries, _start = self.recent_entries(count, time_range)
+        lines = _format_entries(entries, self.show_timestamp, expand)
+        return lines[len(lines) - count:] if expand and count > 0 else lines
+
+    def recent_entries(self, count, time_range=None, start=None, end=None):
+        """
+        返回 (最近 count 个条目（从旧到新，不格式化）, 窗口起始序号)。
+        start/end 为序号窗口 [start, end)（用于向前翻页），与 time_range 的窗口取交集；
+        窗口起始序号不早于最旧的保留条目，用于判断更早的条目是否还有剩余。
+        """
+        self._expire_logs()
+        store = self._log_store
+        if time_range:
+            start, end = _intersect((start, end), self._time_window(time_range))
+        first = max(store.first_seq, start or 0)
+        if start is None and end is None:
+            return store.tail(count), first
+        return _tail_before(store, count, first, end), first
+
+    def _time_window(self, time_range):
+        """将时间范围解析为序号窗口 [start, end)，在时间戳数组上二分查找，不扫描窗口之外的行"""
+        start_ns, end_ns = parse_time_range(time_range)
+        store = self._log_store
+        start = end = None
+        if start_ns is not None:
+            start = store.seq_at_time(start_ns)
+            if start is None:
+                start = store.next_seq
+        if end_ns is not None:
+            end = store.seq_at_time(end_ns)
+            if end is None:
+                end = store.next_seq
+        return start, end
+
+    def log_size(self):
+        """当前保留的日志条目数（不复制缓冲区）"""
+        return len(self._log_store)
+
+    def get_log_head(self, count, expand=False):
+        """获取最旧的 count 条日志（从旧到新），只读取需要的部分"""
+        self._expire_logs()
+        lines = _format_entries(self._log_store.head(count), self.show_timestamp, expand)
+        return lines[:count] if expand else lines
+
+    def get_log_range(self, start, end, expand=False):
+        """获取序号位于 [start, end) 内的日志，只读取该范围"""
+        self._expire_logs()
+        return _format_entries(self._log_store.iter_entries(start, end), self.show_timestamp, expand)
+
+    def log_cursor(self):
+        """
+        当前日志游标: 下一条写入的条目将获得的序号。
+        取游标时结束连续重复行的折叠，之后到达的行即使与上一行相同也获得新的序号，
+        持有游标的读取方（增量读取、等待匹配、收集响应）不会因为重复行被折叠进旧条目而漏掉它。
+        """
         with self._log_lock:
-            return list(self._log_buffer)
+            self._log_store.end_repeat_run()
+            return self._log_store.next_seq
+
+    def get_logs_since(self, cursor=None, max_lines=500, expand=False):
+        """
+        增量读取序号不小于 cursor 的日志，最多 max_lines 条条目，返回 LogsSince。
+        cursor 为 None 时从最旧的条目开始；cursor 超过当前序号（服务已重启）时也从最旧的条目开始并置 reset。
+        读取前已被淘汰的条目数记入 missed，只读取请求窗口内的条目。
+        """
+        self._expire_logs()
+        store = self._log_store
+        end = self.log_cursor()
+        reset = cursor is not None and cursor > end
+        if cursor is None or reset:
+            cursor = store.first_seq
+        cursor = max(cursor, 0)
+        start = max(cursor, store.first_seq)
+        stop = min(end, start + max(max_lines, 0))
+        entries = list(store.iter_entries(start, stop))
+        lines = []
+        for entry in entries:
+            if expand:
+                lines.extend((e.seq, format_entry(e, self.show_timestamp)) for e in expand_entry(entry))
+            else:
+                lines.append((entry.seq, format_entry(entry, self.show_timestamp)))
+        return LogsSince(lines, stop, stop - cursor - len(entries), stop < end, reset, entries)
 
     def clear_log_buffer(self):
         """清空日志缓冲区"""
         with self._log_lock:
-            self._log_buffer.clear()
+            self._log_store.clear()
+        self._search_cache.clear()
     
+    def set_log_retention(self, byte_budget=..., max_age=..., max_lines=..., warm_budget=...):
+        """
+        运行时修改日志保留策略（字节预算、最长保留秒数、行数上限、温层压缩预算），不清空现有日志。
+        省略的参数保持不变。byte_budget 为 None 时按行数保留，max_age 为 None 时不按时间淘汰，
+        warm_budget 为 None 时关闭温层；按字节预算保留时 max_lines 为 None 表示使用宽松的后备上限。
+        """
+        with self._log_lock:
+            current = self._log_store.stats()
+            if byte_budget is ...:
+                byte_budget = current["byte_budget"]
+            if max_age is ...:
+                max_age = current["max_age"]
+            if max_lines is ...:
+                # 切换保留方式时不沿用原方式的行数: 按行数保留的行数不应成为字节预算下的上限
+                same_mode = (current["byte_budget"] is None) == (byte_budget is None)
+                max_lines = current["line_limit"] if same_mode else None
+            if byte_budget is None and max_lines is None:
+                max_lines = self.max_log_lines
+            self._log_store.set_retention(max_lines, byte_budget, max_age, warm_budget)
+            if byte_budget is None:
+                self.max_log_lines = max_lines
+
+    def get_log_stats(self):
+        """获取日志缓冲区的占用、淘汰和搜索缓存统计"""
+        self._expire_logs()
+        stats = self._log_store.stats()
+        stats["search_cache"] = self._search_cache.stats()
+        return stats
+
     def set_show_timestamp(self, show: bool):
         """设置是否显示时间戳"""
         self.show_timestamp = show
 
-    def search_logs(self, pattern: str, max_results: int = 100):
-        """在日志缓冲区中搜索匹配正则表达式的行"""
-        import re
+    def set_line_idle_timeout(self, seconds):
+        """设置无换行数据的空闲冲刷超时（秒），None 表示从不冲刷"""
+        self.line_idle_timeout = seconds
+        self._framer.idle_timeout = seconds
+
+    def search_logs(self, pattern: str, max_results: int = 100, expand=False, time_range=None):
+        """
+        在日志缓冲区中搜索匹配正则表达式的行，expand 为 True 时将折叠的重复行展开。
+        编译结果和每个模式的匹配序号会被缓存，重复查询只扫描上次之后新到达的行。
+        使用默认的时间预算，超时只返回已找到的部分；需要超时标志时使用 run_search。
+        """
+        return self.run_search(pattern, max_results, expand, time_range=time_range).matches
+
+    def run_search(self, pattern: str, max_results: int = 100, expand=False, time_budget=..., cancel=None,
+                   time_range=None, before=0, after=0, start=None, end=None, budget=None):
+        """
+        搜索日志并返回 LogSearchResult。
+        time_budget 为本次搜索的时间预算（秒），省略时使用 search_time_budget，None 表示不限制；
+        cancel 为 threading.Event，被设置时尽快停止。超时或取消时返回已找到的部分匹配。
+        time_range 限定搜索的时间窗口（如 "last_5min" 或 "10:00/10:05"）。
+        before/after 大于 0 时附带每个匹配之前/之后的若干条上下文（见 _context_piece），
+        上下文只为实际返回的匹配生成，并与匹配行一起计入 budget（ResponseBudget）的大小上限。
+        start/end 为序号窗口 [start, end)（用于分页继续搜索），与 time_range 的窗口取交集。
+        """
+        if time_budget is ...:
+            time_budget = self.search_time_budget
+        deadline = None if time_budget is None else time.monotonic() + time_budget
+        self._expire_logs()
+        if time_range:
+            start, end = _intersect((start, end), self._time_window(time_range))
+        store = self._log_store
+        result = self._search_cache.search(store, pattern, deadline, cancel, start, end)
+        if end is None:
+            end = store.next_seq
+        matched = []
+        lines = 0
+        more = False
+        for entry in fetch_entries(store, result.seqs):
+            if lines >= max_results:
+                more = True
+                break
+            matched.append(entry)
+            lines += len(expand_entry(entry)) if expand else 1
+        extra_cost = pieces = None
+        if before > 0 or after > 0:
+            pieces = []
+            match_seqs = {entry.seq for entry in matched}
+            newest = store.next_seq
+
+            def extra_cost(entry):
+                covered = pieces[-1][1] if pieces else 0
+                pieces.append(self._context_piece(entry.seq, covered, before, after, newest, match_seqs,
+                                                  expand, budget))
+                return sum(line_cost(line) for line in pieces[-1][2])
+        shaped = shape_entries(matched, self.show_timestamp, expand, budget, max_lines=max_results,
+                               extra_cost=extra_cost)
+        context = None if pieces is None else _merge_context(pieces[:len(shaped.entries)])
+        matches = shaped.lines if shaped.lines is not None else shaped.columns["text"]
+        return LogSearchResult(matches, more or shaped.truncated or result.stopped is not None,
+                               result.stopped == "timed_out", result.stopped == "cancelled", context, shaped, end)
+
+    def _context_piece(self, seq, covered, before, after, newest, match_seqs, expand=False, budget=None):
+        """
+        匹配条目 seq 的上下文窗口中尚未被前一个匹配覆盖的部分 [lo, hi)（按条目序号，covered 之前的已覆盖），
+        返回 (lo, hi, 行, 已淘汰的条目数)。行以 "序号: " 标记匹配行、"序号- " 标记上下文行（同 grep -n），
+        相邻或重叠的窗口由 _merge_context 合并为一组。
+        """
+        lo = max(seq - before, covered, 0)
+        hi = max(min(seq + after + 1, newest), lo)
+        entries = list(self._log_store.iter_entries(lo, hi)) if hi > lo else []
+        lines = []
+        for entry in entries:
+            marker = ":" if entry.seq in match_seqs else "-"
+            for e in (expand_entry(entry) if expand else (entry,)):
+                lines.append(f"{entry.seq}{marker} {shape_line(e, self.show_timestamp, budget)}")
+        return lo, hi, lines, (hi - lo) - len(entries)
+
+    def run_multi_search(self, patterns, max_results=100, expand=False, time_budget=..., cancel=None,
+                         time_range=None, budget=None, starts=None, end=None):
+        """
+        一次遍历搜索多个模式，返回 MultiSearchResult。
+        patterns 为 {名称: 正则} 或 [{"name": ..., "pattern": ..., "max_results": ...}, ...]
+        （name 缺省为正则本身，max_results 缺省为参数 max_results）。
+        每个模式的结果为 {"pattern", "matches", "count", "truncated"}，count 为不受上限限制的匹配条目总数；
+        matches 按 budget（ResponseBudget）格式化，各模式依次共用 budget 的大小上限，紧凑模式下为 columns。
+        starts 为 {名称: 序号}、end 为序号窗口上界（用于分页继续搜索，见 MultiSearchResult.resume）。
+        """
+        specs = _pattern_specs(patterns, max_results)
+        if time_budget is ...:
+            time_budget = self.search_time_budget
+        deadline = None if time_budget is None else time.monotonic() + time_budget
+        self._expire_logs()
+        start = None
+        if time_range:
+            start, end = _intersect((None, end), self._time_window(time_range))
+        store = self._log_store
+        if end is None:
+            end = store.next_seq
+        found, stopped = self._search_cache.search_many(
+            store, {name: pattern for name, pattern, _limit in specs},
+            {name: limit for name, _pattern, limit in specs}, deadline, cancel, start, end, starts)
+        budget = budget or ResponseBudget()
+        remaining = budget.max_bytes
+        results = {}
+        resume = {}
+        for name, pattern, limit in specs:
+            seqs, count = found[name]
+            entries = list(fetch_entries(store, seqs))
+            if remaining is not None and remaining <= 0:
+                # 前面的模式已用完大小上限，本模式的匹配全部留到下一页
+                entries = []
+            shaped = shape_entries(entries, self.show_timestamp, expand, budget._replace(max_bytes=remaining),
+                                   max_lines=limit)
+            truncated = shaped.truncated or count > len(shaped.entries) or stopped is not None
+            if remaining is not None:
+                remaining -= shaped.size
+            item = {"pattern": pattern, "count": count, "truncated": truncated}
+            if shaped.columns is not None:
+                item["columns"] = shaped.columns
+            else:
+                item["matches"] = shaped.lines
+            results[name] = item
+            if truncated:
+                resume[name] = shaped.entries[-1].seq + 1 if shaped.entries else (starts or {}).get(name, start or 0)
+        return MultiSearchResult(results, stopped == "timed_out", stopped == "cancelled", resume, end)
+
+    def run_aggregate(self, pattern: str, bucket_seconds=60, group=None, top_n=10, time_budget=..., cancel=None,
+                      time_range=None, budget=None):
+        """
+        统计匹配 pattern 的日志，返回 AggregateResult，不返回匹配行本身。
+        stats 包含不受上限限制的匹配总数、首次/最后一次出现、每分钟次数和按 bucket_seconds 分桶的时间直方图；
+        group 为捕获组的名称或编号时附带该组出现最多的 top_n 个取值；首次/最后一次出现的行按 budget 格式化。
+        匹配序号来自搜索缓存（与 run_search 共用索引、增量结果和时间预算），统计只遍历一次匹配的条目。
+        """
+        if bucket_seconds is None or bucket_seconds <= 0:
+            raise ValueError(f"无效的分桶宽度: {bucket_seconds!r}")
+        regex, _plan, _risky = self._search_cache.compile(pattern)
+        if group is not None:
+            if isinstance(group, str) and group.isdigit():
+                group = int(group)
+            if isinstance(group, int) and not 0 <= group <= regex.groups \
+                    or isinstance(group, str) and group not in regex.groupindex:
+                raise ValueError(f"正则表达式中没有捕获组 {group!r}")
+        if time_budget is ...:
+            time_budget = self.search_time_budget
+        deadline = None if time_budget is None else time.monotonic() + time_budget
+        self._expire_logs()
+        start, end = self._time_window(time_range) if time_range else (None, None)
+        store = self._log_store
+        result = self._search_cache.search(store, pattern, deadline, cancel, start, end)
+        stats = aggregate_entries(fetch_entries(store, result.seqs), regex, bucket_seconds, group, top_n,
+                                  self.show_timestamp, budget)
+        return AggregateResult(stats, result.stopped == "timed_out", result.stopped == "cancelled")
+
+    async def search_logs_async(self, pattern: str, max_results: int = 100, **options):
+        """
+        在线程池中执行 run_search（options 为其关键字参数），不阻塞事件循环（asyncio 后端的串口读取）；
+        协程被取消时通知搜索停止
+        """
+        return await self._run_cancellable(self.run_search, pattern, max_results, **options)
+
+    async def multi_search_async(self, patterns, max_results=100, **options):
+        """在线程池中执行 run_multi_search，取消行为同 search_logs_async"""
+        return await self._run_cancellable(self.run_multi_search, patterns, max_results, **options)
+
+    async def aggregate_async(self, pattern: str, **options):
+        """在线程池中执行 run_aggregate，取消行为同 search_logs_async"""
+        return await self._run_cancellable(self.run_aggregate, pattern, **options)
+
+    async def search_bytes_async(self, pattern: str, max_results: int = 100, **options):
+        """在线程池中执行 run_byte_search，取消行为同 search_logs_async"""
+        return await self._run_cancellable(self.run_byte_search, pattern, max_results, **options)
+
+    async def _run_cancellable(self, func, *args, **kwargs):
+        cancel = threading.Event()
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(None, lambda: func(*args, cancel=cancel, **kwargs))
         try:
-            regex = re.compile(pattern)
-            with self._log_lock:
-                matches = []
-                for line in self._log_buffer:
-                    if regex.search(line):
-                        matches.append(line)
-                        if len(matches) >= max_results:
-                            break
-                return matches
-        except re.error as e:
-            raise ValueError(f"无效的正则表达式: {e}")
+            return await future
+        except asyncio.CancelledError:
+            cancel.set()
+            raise
+
+    def search_bytes(self, pattern: str, max_results: int = 100):
+        """
+        在日志缓冲区的原始字节中搜索字节模式（十六进制，?? 为任意字节），
+        返回每个匹配所在条目的序号、行内偏移、时间戳和匹配到的字节，不把缓冲区转换为十六进制文本。
+        搜索的是分帧后保存的行: 作为行分隔符的 0x0A 和行尾的 0x0D 不保存，能按 UTF-8 解码的行去掉了首尾空白，
+        因此跨行的模式以及文本行首尾的这些字节无法匹配。
+        使用默认的时间预算，超时只返回已找到的部分；需要超时标志时使用 run_byte_search。
+        """
+        return self.run_byte_search(pattern, max_results).matches
+
+    def run_byte_search(self, pattern: str, max_results: int = 100, time_budget=..., cancel=None):
+        """
+        搜索字节模式并返回 ByteSearchResult，匹配内容同 search_bytes。
+        time_budget 和 cancel 同 run_search: 省略时使用 search_time_budget，超时或取消时返回已找到的部分匹配。
+        """
+        byte_pattern = BytePattern(pattern)
+        if time_budget is ...:
+            time_budget = self.search_time_budget
+        deadline = None if time_budget is None else time.monotonic() + time_budget
+        self._expire_logs()
+        matches = []
+        for scanned, entry in enumerate(self._log_store.iter_entries()):
+            if scanned % CHECK_INTERVAL == 0:
+                if cancel is not None and cancel.is_set():
+                    return ByteSearchResult(matches, False, True)
+                if deadline is not None and time.monotonic() >= deadline:
+                    return ByteSearchResult(matches, True, False)
+            data = entry.data
+            for offset in byte_pattern.finditer(data):
+                matches.append({
+                    "seq": entry.seq,
+                    "offset": offset,
+                    "timestamp": format_timestamp(wall_time_ns(entry.timestamp_ns)),
+                    "match": data[offset:offset + byte_pattern.length].hex().upper(),
+                    "line_length": len(data),
+                    "binary": bool(entry.flags & FLAG_BINARY),
+                })
+                if len(matches) >= max_results:
+                    return ByteSearchResult(matches, False, False)
+        return ByteSearchResult(matches, False, False)
 
     def _read_data(self):
         """在后台线程中持续读取串口数据"""
+        port = self.serial_port
+        framer = self._framer
         while self._is_running:
             try:
                 # Check running flag again in case disconnect was called
-                if not self.serial_port or not self.serial_port.is_open:
+                if not port or not port.is_open:
                     break
-                
-                # For now, we will just read lines for simplicity.
-                # A more robust solution might read bytes and use a buffer.
-                if self.serial_port.in_waiting > 0:
-                    line = self.serial_port.readline()
-                    if line:
-                        # 尝试解码为文本
-                        try:
-                            decoded_line = line.decode('utf-8').strip()
-                            # 添加到日志缓冲区（根据show_timestamp设置）
-                            self.add_log_entry(decoded_line)
-                            # 发送解码后的文本数据给GUI（不带时间戳，让GUI处理格式）
-                            self.text_data_received.emit(decoded_line)
-                            # 发送原始hex数据给GUI（用于HEX显示模式）
-                            self.data_received.emit(line.hex())
-                        except UnicodeDecodeError:
-                            # 如果无法解码为文本，仍然添加 hex 表示到日志
-                            hex_repr = line.hex().upper()
-                            self.add_log_entry(f"[HEX] {hex_repr}")
-                            # 发送HEX标记的文本数据给GUI
-                            self.text_data_received.emit(f"[HEX] {hex_repr}")
-                            # 发送原始hex数据给GUI
-                            self.data_received.emit(line.hex())
+
+                # 阻塞等待数据到达（最多 timeout 秒），随后一次性读出所有已缓存的字节，
+                # 避免空闲时忙等以及逐行 readline() 带来的系统调用开销
+                waiting = port.in_waiting
+                data = port.read(waiting or 1)
+                if data and not waiting:
+                    waiting = port.in_waiting
+                    if waiting:
+                        data += port.read(waiting)
+
+                if data:
+                    self._handle_lines(framer.feed(data))
+                else:
+                    line = framer.flush_idle()
+                    if line is not None:
+                        self._handle_lines([line])
+                    # 读取超时（线路空闲），把未发送的批次交给界面
+                    self._flush_line_batch()
             except serial.SerialException as e:
+                if not self._is_running:
+                    break
                 self._is_running = False
                 self.error_occurred.emit(f"串口错误: {e}")
                 self.connection_status_changed.emit(False, "连接因错误而中断")
             except Exception as e:
+                if not self._is_running:
+                    break
                 # Catch unexpected errors to prevent thread crash
                 self._is_running = False
                 self.error_occurred.emit(f"读取线程发生未知错误: {e}")
 
+        # 断开前冲刷残留的不完整行
+        line = framer.flush()
+        if line is not None:
+            self._handle_lines([line])
+        self._flush_line_batch()
+
         # Clean up after loop exits
         with self._lock:
-            if self.serial_port:
-                self.serial_port.close()
-            self.serial_port = None 
\ No newline at end of file
+            if self.serial_port is port:
+                if port:
+                    port.close()
+                self.serial_port = None
+
+    def _on_async_data(self, data):
+        """asyncio 后端: 事件循环线程中的读回调"""
+        framer = self._framer
+        self._handle_lines(framer.feed(data))
+        if framer.pending and self._idle_flush_handle is None and framer.idle_timeout is not None:
+            self._idle_flush_handle = self._loop.call_later(framer.idle_timeout, self._on_async_idle)
+
+    def _on_async_idle(self):
+        """asyncio 后端: 空闲定时器到期，冲刷无换行的数据"""
+        self._idle_flush_handle = None
+        framer = self._framer
+        line = framer.flush_idle()
+        if line is not None:
+            self._handle_lines([line])
+        elif framer.pending and framer.idle_timeout is not None:
+            # 期间又收到了数据，重新计时
+            self._idle_flush_handle = self._loop.call_later(framer.idle_timeout, self._on_async_idle)
+
+    def _on_async_error(self, transport, exc):
+        """asyncio 后端: 读写出错时断开连接"""
+        with self._lock:
+            if self._transport is not transport:
+                return  # 已断开或已切换到新的连接
+            port = self.serial_port
+            self._transport = None
+            self.serial_port = None
+        self._close_async_transport(None, port)
+        self.error_occurred.emit(f"串口错误: {exc}")
+        self.connection_status_changed.emit(False, "连接因错误而中断")
+
+    def _close_async_transport(self, transport, port):
+        if self._idle_flush_handle is not None:
+            self._idle_flush_handle.cancel()
+            self._idle_flush_handle = None
+        if transport:
+            transport.stop()
+        line = self._framer.flush()
+        if line is not None:
+            self._handle_lines([line])
+        self._flush_line_batch()
+        if port:
+            port.close()
+
+    async def wait_for_data(self, timeout=None):
+        """
+        在事件循环中等待新数据行到达，不轮询。
+        返回 True 表示有新数据，False 表示超时。
+        """
+        with self._data_waiter() as future:
+            try:
+                await asyncio.wait_for(future, timeout)
+                return True
+            except asyncio.TimeoutError:
+                return False
+
+    @contextmanager
+    def _data_waiter(self):
+        """注册一个在新数据到达时完成的 future，退出时注销"""
+        loop = asyncio.get_running_loop()
+        waiter = (loop, loop.create_future())
+        with self._waiters_lock:
+            self._data_waiters.append(waiter)
+        try:
+            yield waiter[1]
+        finally:
+            with self._waiters_lock:
+                if waiter in self._data_waiters:
+                    self._data_waiters.remove(waiter)
+
+    async def wait_for_pattern(self, pattern: str, timeout=30.0, since_cursor=None):
+        """
+        等待匹配 pattern 的日志出现，返回 PatternWait。
+        since_cursor 为起始游标（如 get_logs_since 的 next_cursor），None 表示只等待调用之后到达的行。
+        每次被新数据唤醒时只检查上次检查之后的新行；先注册唤醒再检查，检查与等待之间到达的行不会被漏掉。
+        积压较多或有回溯风险的正则经搜索缓存在线程池中检查，不阻塞事件循环。
+        """
+        regex, _plan, risky = self._search_cache.compile(pattern)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = None if timeout is None else started + timeout
+        store = self._log_store
+        cursor = self.log_cursor() if since_cursor is None else max(since_cursor, 0)
+        while True:
+            with self._data_waiter() as future:
+                end = self.log_cursor()
+                entry = text = None
+                if cursor < end:
+                    if risky or end - cursor > INDEX_MIN_LINES:
+                        budget = None if deadline is None else time.monotonic() + max(deadline - loop.time(), 0)
+                        entry, complete = await loop.run_in_executor(None, self._first_match, pattern, cursor,
+                                                                     end, budget)
+                        if not complete and entry is None:
+                            # 超时前没有检查完，游标停在原处，下次等待时重新检查
+                            return PatternWait(False, None, None, cursor, loop.time() - started)
+                    else:
+                        for candidate in store.iter_entries(cursor, end):
+                            text = entry_text(candidate)
+                            if regex.search(text):
+                                entry = candidate
+                                break
+                    cursor = end
+                if entry is not None:
+                    if text is None:
+                        text = entry_text(entry)
+                    return PatternWait(True, entry.seq, format_entry(entry, self.show_timestamp),
+                                       entry.seq + 1, loop.time() - started, text)
+                remaining = None if deadline is None else deadline - loop.time()
+                if remaining is not None and remaining <= 0:
+                    return PatternWait(False, None, None, cursor, loop.time() - started)
+                try:
+                    await asyncio.wait_for(future, remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def send_and_collect(self, data, is_hex=False, add_newline=True, timeout=3.0, end_pattern=None,
+                               idle_gap=None, max_lines=200):
+        """
+        发送数据并收集响应，返回 CommandResponse。
+        写入前记录日志游标，之后到达的行即为响应窗口，收集到以下任一条件为止:
+        某行匹配 end_pattern、收到首行后 idle_gap 秒内没有新行（未给出 end_pattern 时默认 0.5 秒）、超过 timeout。
+        以交互优先级发送，越过排队中的普通和批量发送。
+        ttfb / completion 为从写入到首行 / 最后一行到达的时间（秒），以读取方的单调时钟时间戳计。
+        """
+        regex = self._search_cache.compile(end_pattern)[0] if end_pattern else None
+        if idle_gap is None and regex is None:
+            idle_gap = DEFAULT_IDLE_GAP
+        loop = asyncio.get_running_loop()
+        store = self._log_store
+        start = self.log_cursor()
+        try:
+            receipt = await asyncio.wrap_future(self.send_async(data, is_hex, add_newline, "interactive"))
+        except (RuntimeError, ValueError, OSError):
+            return CommandResponse(False, [], None, None, None, start)
+        # 从写线程开始写出的时刻计时，不包括排队时间
+        sent_ns = receipt.started_ns
+        deadline = loop.time() + timeout
+        cursor = start
+        entries = []
+        reason = "timeout"
+        while True:
+            with self._data_waiter() as future:
+                end = self.log_cursor()
+                for entry in store.iter_entries(cursor, end):
+                    entries.append(entry)
+                    if regex is not None and regex.search(entry_text(entry)):
+                        reason = "end_pattern"
+                        break
+                cursor = entries[-1].seq + 1 if reason == "end_pattern" else end
+                if reason == "end_pattern":
+                    break
+                now = loop.time()
+                wait = deadline - now
+                if entries and idle_gap is not None:
+                    idle_left = idle_gap - (time.monotonic_ns() - entries[-1].timestamp_ns) / 1e9
+                    if idle_left <= 0:
+                        reason = "idle"
+                        break
+                    wait = min(wait, idle_left)
+                if wait <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(future, wait)
+                except asyncio.TimeoutError:
+                    pass
+        ttfb = completion = None
+        if entries:
+            ttfb = (entries[0].timestamp_ns - sent_ns) / 1e9
+            completion = (entries[-1].timestamp_ns - sent_ns) / 1e9
+        lines = _format_entries(entries[:max_lines], self.show_timestamp, False)
+        return CommandResponse(True, lines, ttfb, completion, reason, cursor, len(entries) > max_lines)
+
+    def _first_match(self, pattern, start, end, deadline=None):
+        """经搜索缓存在序号窗口 [start, end) 中查找第一个匹配的条目，返回 (条目或 None, 是否检查完)"""
+        result = self._search_cache.search(self._log_store, pattern, deadline, start=start, end=end)
+        entry = next(iter(fetch_entries(self._log_store, result.seqs[:1])), None)
+        return entry, result.stopped is None
+
+    def _notify_data_waiters(self):
+        """唤醒所有等待新数据的协程（同一事件循环内直接唤醒，跨线程时经 call_soon_threadsafe）"""
+        if not self._data_waiters:
+            return
+        with self._waiters_lock:
+            waiters = self._data_waiters
+            self._data_waiters = []
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        for loop, future in waiters:
+            if loop is running:
+                _resolve_waiter(future)
+            elif not loop.is_closed():
+                loop.call_soon_threadsafe(_resolve_waiter, future)
+
+    def _handle_lines(self, lines):
+        """处理一批分帧得到的行: 写入日志缓冲区、通知界面并唤醒等待者"""
+        if not lines:
+            return
+        timestamp_ns = time.monotonic_ns()
+        # 只为实际连接了槽的信号做准备工作（无界面的 MCP 模式下一个信号都不发）
+        batch = self._line_batch if self.receivers(self.lines_received) else None
+        emit_text = self.receivers(self.text_data_received) > 0
+        emit_hex = self.receivers(self.data_received) > 0
+        for line in lines:
+            record = self._handle_line(line, timestamp_ns)
+            if batch is not None:
+                batch.append(record)
+            if emit_text:
+                self.text_data_received.emit(record.text)
+            if emit_hex:
+                self.data_received.emit(record.hex)
+        self._notify_data_waiters()
+        if batch:
+            self._schedule_line_batch()
+
+    def _handle_line(self, line, timestamp_ns):
+        """处理分帧得到的一行原始字节，返回对应的 LineRecord"""
+        # 尝试解码为文本
+        try:
+            stripped = line.strip()
+            decoded_line = stripped.decode('utf-8')
+        except UnicodeDecodeError:
+            # 如果无法解码为文本，保留原始字节并标记为二进制行（读取时以 hex 表示）
+            self._append_log(line, FLAG_BINARY, timestamp_ns)
+            return LineRecord(line, timestamp_ns)
+        # 以原始字节添加到日志缓冲区（读取时才解码和添加时间戳）
+        self._append_log(stripped, 0, timestamp_ns)
+        return LineRecord(stripped, timestamp_ns, decoded_line)
+
+    def _schedule_line_batch(self):
+        """批次已满或距上次发送已超过时间片时立即发送，否则等待后续数据或定时发送"""
+        now = time.monotonic()
+        if (len(self._line_batch) >= self.signal_batch_lines
+                or now - self._last_batch_emit >= self.signal_batch_interval):
+            self._flush_line_batch()
+        elif self._transport is not None and self._batch_flush_handle is None:
+            # asyncio 后端没有读取超时，用定时器保证批次在一个时间片内发出
+            self._batch_flush_handle = self._loop.call_later(self.signal_batch_interval,
+                                                             self._flush_line_batch)
+
+    def _flush_line_batch(self):
+        """把累积的行作为一个批次发送给界面"""
+        if self._batch_flush_handle is not None:
+            self._batch_flush_handle.cancel()
+            self._batch_flush_handle = None
+        batch = self._line_batch
+        if batch:
+            self._line_batch = []
+            self._last_batch_emit = time.monotonic()
+            self.lines_received.emit(batch)
+
+
+# run_search 的结果: truncated 表示还有未返回的匹配（达到 max_results 或扫描未完成），
+# timed_out / cancelled 表示扫描因时间预算耗尽或被取消而提前停止，matches 只是部分结果；
+# context 为请求上下文时合并后的上下文分组，否则为 None；shaped 为按响应预算格式化的结果（ShapedLogs，
+# 其 entries 为返回的匹配条目），end 为本次搜索的序号窗口上界（分页时沿用，使后续页不包含搜索之后到达的行）
+LogSearchResult = namedtuple('LogSearchResult', 'matches truncated timed_out cancelled context shaped end',
+                             defaults=(None, None, None))
+
+# run_multi_search 的结果: results 为 {名称: 单个模式的结果}，timed_out / cancelled 同 LogSearchResult；
+# resume 为 {名称: 序号}，记录还有未返回匹配的模式下一页的起始序号，end 为本次搜索的序号窗口上界
+MultiSearchResult = namedtuple('MultiSearchResult', 'results timed_out cancelled resume end', defaults=({}, None))
+
+# run_aggregate 的结果: stats 为统计结果字典；timed_out / cancelled 时统计只覆盖已扫描的部分
+AggregateResult = namedtuple('AggregateResult', 'stats timed_out cancelled')
+
+# run_byte_search 的结果: matches 为匹配位置列表；timed_out / cancelled 时只搜索了部分缓冲区
+ByteSearchResult = namedtuple('ByteSearchResult', 'matches timed_out cancelled')
+
+# wait_for_pattern 的结果: matched 为 False 表示超时；seq / line 为第一条匹配的条目（text 为不带时间戳的文本）；
+# next_cursor 为继续等待时使用的游标；elapsed 为等待的秒数
+PatternWait = namedtuple('PatternWait', 'matched seq line next_cursor elapsed text', defaults=(None,))
+
+# send_and_collect 的结果: sent 为 False 表示写入失败；lines 为响应窗口内的行；
+# ttfb / completion 为首行 / 最后一行到达距写入的秒数（没有响应时为 None）；
+# completed_by 为 "end_pattern"、"idle" 或 "timeout"；next_cursor 为响应窗口之后的游标
+CommandResponse = namedtuple('CommandResponse', 'sent lines ttfb completion completed_by next_cursor truncated',
+                             defaults=(False,))
+
+# get_logs_since 的结果: lines 为 (序号, 格式化后的行) 列表；next_cursor 为下次读取的游标；
+# missed 为客户端跟上之前已被淘汰的条目数；has_more 表示还有更新的条目未返回；entries 为读取到的条目
+LogsSince = namedtuple('LogsSince', 'lines next_cursor missed has_more reset entries', defaults=((),))
+
+
+class LineRecord:
+    """
+    批量发送给界面的一行接收数据: 原始字节、单调时钟时间戳（纳秒）和解码后的文本。
+    无法按 UTF-8 解码的行 text 以 [HEX] 表示；hex 只在订阅方读取时才计算。
+    """
+
+    __slots__ = ('data', 'timestamp_ns', '_text', '_hex')
+
+    def __init__(self, data, timestamp_ns, text=None):
+        self.data = data
+        self.timestamp_ns = timestamp_ns
+        self._text = text
+        self._hex = None
+
+    @property
+    def binary(self):
+        return self._text is None
+
+    @property
+    def text(self):
+        if self._text is None:
+            return f"[HEX] {self.hex.upper()}"
+        return self._text
+
+    @property
+    def hex(self):
+        if self._hex is None:
+            self._hex = self.data.hex()
+        return self._hex
+
+
+def _pattern_specs(patterns, max_results):
+    """将多模式搜索的参数规整为 [(名称, 正则, 上限), ...]"""
+    if isinstance(patterns, dict):
+        patterns = [{"name": name, "pattern": pattern} for name, pattern in patterns.items()]
+    specs = []
+    for item in patterns:
+        if isinstance(item, str):
+            item = {"pattern": item}
+        pattern = item.get("pattern")
+        if not pattern:
+            raise ValueError(f"缺少正则表达式: {item!r}")
+        name = item.get("name") or pattern
+        if any(name == existing for existing, _pattern, _limit in specs):
+            raise ValueError(f"模式名称重复: {name}")
+        specs.append((name, pattern, item.get("max_results", max_results)))
+    if not specs:
+        raise ValueError("至少需要一个模式")
+    return specs
+
+
+def _intersect(window, other):
+    """两个序号窗口 [start, end)（None 表示不限）的交集"""
+    starts = [seq for seq in (window[0], other[0]) if seq is not None]
+    ends = [seq for seq in (window[1], other[1]) if seq is not None]
+    return (max(starts) if starts else None), (min(ends) if ends else None)
+
+
+def _tail_before(store, count, floor, end):
+    """
+    从 end 向前读取 [floor, end) 内最新的 count 个条目（从旧到新）。
+    序号连续时一次读取 count 个序号即可；遇到被淘汰或按类别保留造成的空洞时成倍扩大向前读取的范围，
+    只读取需要的部分，不遍历整个窗口。
+    """
+    end = store.next_seq if end is None else min(end, store.next_seq)
+    entries = []
+    span = count
+    while len(entries) < count and end > floor:
+        start = max(floor, end - span)
+        entries[:0] = store.iter_entries(start, end)
+        end = start
+        span *= 2
+    return entries[-count:]
+
+
+def _merge_context(pieces):
+    """将 _context_piece 的结果中相邻或重叠的窗口合并为上下文分组"""
+    groups = []
+    for lo, hi, lines, evicted in pieces:
+        if groups and lo <= groups[-1]["last_seq"] + 1:
+            group = groups[-1]
+            group["last_seq"] = max(group["last_seq"], hi - 1)
+            group["lines"].extend(lines)
+            group["evicted_lines"] += evicted
+        else:
+            groups.append({"first_seq": lo, "last_seq": hi - 1, "lines": lines, "evicted_lines": evicted})
+    return groups
+
+
+def _format_entries(entries, show_timestamp, expand):
+    if not expand:
+        return [format_entry(entry, show_timestamp) for entry in entries]
+    return [format_entry(e, show_timestamp) for entry in entries for e in expand_entry(entry)]
+
+
+def _resolve_waiter(future):
+    if not future.done():
+        future.set_result(True)
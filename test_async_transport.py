@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+测试 asyncio 串口后端（通过 Linux 伪终端模拟设备）
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+from service import SerialService
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="需要 Linux 伪终端")
+
+
+def test_asyncio_backend_reads_and_writes():
+    """asyncio 后端在事件循环中接收行、等待新数据并写出命令"""
+    master, slave = os.openpty()
+    os.set_blocking(master, False)
+    service = SerialService(max_log_lines=100, line_idle_timeout=0.05, backend="asyncio")
+    service.show_timestamp = False
+
+    async def scenario():
+        service.attach_loop(asyncio.get_running_loop())
+        assert service.connect(os.ttyname(slave), 115200)
+        assert service.active_backend() == "asyncio"
+
+        # 没有数据时等待超时
+        assert await service.wait_for_data(timeout=0.05) is False
+
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.01, os.write, master, b"boot ok\r\nAT")
+        assert await service.wait_for_data(timeout=1) is True
+        assert service.get_log_buffer() == ["boot ok"]
+
+        # 无换行的残留数据在空闲超时后冲刷
+        assert await service.wait_for_data(timeout=1) is True
+        assert service.get_log_buffer() == ["boot ok", "AT"]
+
+        assert service.send("dbg remind all")
+        await asyncio.sleep(0.05)
+        assert os.read(master, 1024) == b"dbg remind all\r\n"
+
+        service.disconnect()
+        assert not service.is_connected()
+
+        # 在事件循环线程中断开时，写线程不等待事件循环，断开不会被正在写入的发送拖住
+        assert service.connect(os.ttyname(slave), 115200)
+        pending = service.send_async("late")
+        time.sleep(0.05)  # 阻塞事件循环，让写线程取出这次发送并交给事件循环
+        started = time.monotonic()
+        service.disconnect()
+        assert time.monotonic() - started < 0.5
+        assert isinstance(pending.exception(1), RuntimeError)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        os.close(master)
+        os.close(slave)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
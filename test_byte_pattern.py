@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+测试字节模式搜索
+"""
+
+import asyncio
+import sys
+import threading
+
+import pytest
+
+import mcp_server
+from byte_pattern import BytePattern
+from service import SerialService
+
+
+def test_parse_and_match():
+    """解析多种写法的字节模式，通配符匹配任意字节，匹配可以重叠"""
+    assert BytePattern("AA 55 ?? 01").length == 4
+    assert BytePattern("0xAA,0x55,??,0x01").has_wildcards
+    data = b"\x00\xaa\x55\x10\x01\xaa\x55\x0a\x01"
+    assert list(BytePattern("aa55??01").finditer(data)) == [1, 5]
+    assert list(BytePattern("AA 55").finditer(data)) == [1, 5]
+    assert list(BytePattern("?? ??").finditer(b"abc")) == [0, 1]
+    assert list(BytePattern("AAAA").finditer(b"\xaa\xaa\xaa")) == [0, 1]
+    # 不会像十六进制文本那样跨半字节误匹配: 0x0A 0xA5 的文本 "0AA5" 包含 "AA"
+    assert list(BytePattern("AA").finditer(b"\x0a\xa5")) == []
+    for bad in ["A", "GG", "", "AA 5"]:
+        with pytest.raises(ValueError):
+            BytePattern(bad)
+
+
+def test_service_search_bytes():
+    """在保留的原始字节上搜索，返回序号、偏移和时间戳"""
+    service = SerialService(max_log_lines=10)
+    service._handle_lines([b"\xaa\x55\x03\x01\xff", b"temp 25", b"\x00\xaa\x55\x07\x01"])
+    matches = service.search_bytes("AA 55 ?? 01")
+    assert [(m["seq"], m["offset"], m["match"], m["binary"]) for m in matches] == [
+        (0, 0, "AA550301", True), (2, 1, "AA550701", True)]
+    assert service.search_bytes("74 65 6D 70")[0]["seq"] == 1
+    assert len(service.search_bytes("??", max_results=3)) == 3
+
+
+def test_search_bytes_sees_framed_lines():
+    """搜索的是分帧后的行: 0x0A 是行分隔符、行尾的 0x0D 被去掉，UTF-8 文本行去掉首尾空白，其余字节原样保留"""
+    service = SerialService(max_log_lines=10)
+    service._handle_lines(service._framer.feed(b"\xaa\x55\r\n\xaa\x0d\x55\r\n  temp\t\r\n\xff \xff \n"))
+    assert service.search_bytes("0A") == []
+    assert service.search_bytes("AA 55 0D") == []
+    assert [(m["seq"], m["line_length"]) for m in service.search_bytes("AA 55")] == [(0, 2)]
+    assert [m["seq"] for m in service.search_bytes("AA 0D 55")] == [1]
+    assert service.search_bytes("09") == []
+    assert [(m["seq"], m["offset"]) for m in service.search_bytes("20")] == [(3, 1), (3, 3)]
+
+
+def test_byte_search_budget_and_cancel():
+    """字节搜索遵守时间预算和取消，MCP 工具在线程池中执行并报告 timed_out"""
+    service = SerialService(max_log_lines=1000)
+    service._handle_lines([b"\x41\x00\xff"] * 500)
+    result = service.run_byte_search("41 ?? FF", max_results=1000, time_budget=None)
+    assert (len(result.matches), result.timed_out, result.cancelled) == (500, False, False)
+    result = service.run_byte_search("41 ?? FF", time_budget=0)
+    assert (result.matches, result.timed_out) == ([], True)
+    cancel = threading.Event()
+    cancel.set()
+    assert service.run_byte_search("41", cancel=cancel).cancelled
+
+    mcp_server.set_serial_service(service)
+    try:
+        response = asyncio.run(mcp_server.search_serial_bytes("41 ?? FF", max_results=10))
+        assert (response["total_matches"], response["timed_out"]) == (10, False)
+        response = asyncio.run(mcp_server.search_serial_bytes("41 ?? FF", timeout=0))
+        assert response["timed_out"] and "超时" in response["message"]
+    finally:
+        mcp_server.set_serial_service(None)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+测试命令往返延迟分析
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+from latency_profiler import profile_command, summarize
+from service import SerialService
+
+
+def test_summarize_percentiles_and_jitter():
+    """分位数在相邻样本间插值，抖动为相邻两次延迟之差的平均值"""
+    stats = summarize([10.0, 30.0, 20.0, 40.0, 50.0])
+    assert (stats["min"], stats["p50"], stats["p90"], stats["max"]) == (10.0, 30.0, 46.0, 50.0)
+    assert stats["jitter"] == 15.0
+    assert summarize([])["p99"] is None
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="需要 Linux 伪终端")
+def test_profile_command_against_pty_device():
+    """模拟设备第 3 次不响应: 延迟分布只统计有响应的次数，超时单独计数，结果可序列化为 JSON"""
+    master, slave = os.openpty()
+    os.set_blocking(master, False)
+    service = SerialService(max_log_lines=100, backend="asyncio")
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        service.attach_loop(loop)
+        assert service.connect(os.ttyname(slave), 115200)
+        received = []
+
+        def device():
+            received.append(os.read(master, 1024))
+            if len(received) != 3:
+                loop.call_later(0.02, os.write, master, b"AT version:2.2\r\nOK\r\n")
+        loop.add_reader(master, device)
+        try:
+            return await profile_command(service, "AT+GMR", count=5, interval=0.05, response_pattern="^OK$",
+                                         timeout=0.3)
+        finally:
+            loop.remove_reader(master)
+            service.disconnect()
+
+    try:
+        result = asyncio.run(scenario())
+    finally:
+        os.close(master)
+        os.close(slave)
+    assert (result["responses"], result["timeouts"], result["send_failures"]) == (4, 1, 0)
+    assert all(15 <= sample < 300 for sample in result["samples_ms"])
+    assert result["latency_ms"]["min"] <= result["latency_ms"]["p50"] <= result["latency_ms"]["max"]
+    assert json.loads(json.dumps(result)) == result
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
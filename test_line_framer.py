@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+测试增量行分帧器以及批量读取线程
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+from line_framer import LineFramer
+from service import SerialService
+
+
+def test_framer_keeps_partial_lines():
+    """不完整的行跨多次 feed 保留"""
+    framer = LineFramer(idle_timeout=None)
+    assert framer.feed(b"boot") == []
+    assert framer.feed(b" ok\r\nAT") == [b"boot ok"]
+    assert framer.pending == 2
+    assert framer.feed(b"\r\nOK\n\n") == [b"AT", b"OK", b""]
+    assert framer.pending == 0
+
+
+def test_framer_idle_flush():
+    """无换行的提示符在空闲超时后被冲刷"""
+    framer = LineFramer(idle_timeout=0.2)
+    assert framer.feed(b"shell> ", now=10.0) == []
+    assert framer.flush_idle(now=10.1) is None
+    assert framer.flush_idle(now=10.25) == b"shell> "
+    assert framer.flush_idle(now=11.0) is None
+
+
+def test_framer_splits_overlong_lines():
+    """超长且无换行的数据被强制切分"""
+    framer = LineFramer(idle_timeout=None, max_line_bytes=8)
+    assert framer.feed(b"0123") == []
+    assert framer.feed(b"456789") == [b"0123456789"]
+    assert framer.pending == 0
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="需要 Linux 伪终端")
+def test_bulk_reader_over_pty():
+    """通过伪终端验证读取线程的批量读取、分帧与空闲冲刷"""
+    master, slave = os.openpty()
+    service = SerialService(max_log_lines=100, line_idle_timeout=0.05)
+    service.show_timestamp = False
+    try:
+        assert service.connect(os.ttyname(slave), 115200)
+        os.write(master, b"line 1\r\nline 2\r\nli")
+        os.write(master, b"ne 3\r\nprompt> ")
+        deadline = time.monotonic() + 2
+        while len(service.get_log_buffer()) < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert service.get_log_buffer() == ["line 1", "line 2", "line 3", "prompt>"]
+    finally:
+        service.disconnect()
+        os.close(master)
+        os.close(slave)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
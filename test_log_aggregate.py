@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+测试日志统计: 匹配总数、时间直方图和捕获组取值排行
+"""
+
+import sys
+import time
+
+import pytest
+
+from log_store import monotonic_time_ns
+from service import SerialService
+
+SECOND = 10 ** 9
+
+
+def test_aggregate_counts_histogram_and_top_values():
+    """统计不受上限限制的总数、按分钟分桶的直方图（含空桶）、首末次出现和捕获组取值排行，折叠的重复行按重复次数计入"""
+    service = SerialService(max_log_lines=1000)
+    service.show_timestamp = False
+    base = monotonic_time_ns((time.time_ns() // (60 * SECOND) - 10) * 60 * SECOND)
+    for minute, code in [(0, 12), (0, 7), (2, 12), (3, 12)]:
+        service._append_log(f"E ({code}) failed".encode(), timestamp_ns=base + minute * 60 * SECOND + SECOND)
+        service._append_log(b"ok", timestamp_ns=base + minute * 60 * SECOND + 2 * SECOND)
+    for i in range(3):
+        service._append_log(b"E (9) failed", timestamp_ns=base + 240 * SECOND + i * SECOND)
+
+    stats = service.run_aggregate(r"E \((?P<code>\d+)\)", group="code", top_n=2).stats
+    assert stats["count"] == 7
+    assert [bucket["count"] for bucket in stats["histogram"]] == [2, 0, 1, 1, 3]
+    assert stats["first"]["line"] == "E (12) failed"
+    assert stats["last"]["seq"] == 10 and stats["last"]["line"] == "E (9) failed"
+    assert stats["top_values"] == [{"value": "12", "count": 3}, {"value": "9", "count": 3}]
+    assert stats["distinct_values"] == 3
+    assert stats["rate_per_minute"] == round(7 * 60 / 241, 3)
+
+    stats = service.run_aggregate("failed", bucket_seconds=1).stats
+    assert stats["count"] == 7 and len(stats["histogram"]) <= 242
+    assert service.run_aggregate("missing").stats["count"] == 0
+    with pytest.raises(ValueError):
+        service.run_aggregate(r"E \((\d+)\)", group="2")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
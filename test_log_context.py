@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+测试搜索结果的上下文窗口
+"""
+
+import sys
+
+import pytest
+
+from service import SerialService
+
+
+def test_search_context_windows_merge_and_report_eviction():
+    """匹配前后的上下文按序号取得，重叠的窗口合并，已淘汰的上下文计入 evicted_lines"""
+    service = SerialService(max_log_lines=12)
+    service.show_timestamp = False
+    for i in range(20):
+        service.add_log_entry(f"Error {i}" if i in (9, 11, 17) else f"line {i}")
+    result = service.run_search("Error", before=2, after=1)
+    assert result.matches == ["Error 9", "Error 11", "Error 17"]
+    first, second = result.context
+    assert (first["first_seq"], first["last_seq"], first["evicted_lines"]) == (7, 12, 1)
+    assert first["lines"] == ["8- line 8", "9: Error 9", "10- line 10", "11: Error 11", "12- line 12"]
+    assert second["lines"] == ["15- line 15", "16- line 16", "17: Error 17", "18- line 18"]
+    assert second["evicted_lines"] == 0
+    assert service.run_search("Error").context is None
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
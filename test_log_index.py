@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+测试三元组倒排索引和正则查询计划
+"""
+
+import random
+import re
+import sys
+
+import pytest
+
+from log_index import BLOCK_LINES, plan_query
+from log_retention import ClassifiedLogStore, RetentionClass
+from log_store import FLAG_BINARY, LogStore, TieredLogStore, entry_text
+from search_cache import SearchCache
+from service import SerialService
+
+
+def test_plan_extracts_required_literals():
+    """从正则中提取必须出现的字面量，无法确定时返回 None"""
+    kind, trigrams = plan_query(re.compile("boot"))
+    assert kind == "and" and set(trigrams) == {b"boo", b"oot"}
+    assert plan_query(re.compile(r"\d+")) is None
+    assert plan_query(re.compile("ab|xyz")) is None
+    kind, branches = plan_query(re.compile("(foo|bar)"))
+    assert kind == "or" and branches == [b"foo", b"bar"]
+    # 重复次数可以为 0 的部分不是必需的
+    assert plan_query(re.compile("(?:abc)?de")) is None
+    # 忽略大小写时跳过能匹配非 ASCII 字符的字母（k 可匹配开尔文符号）
+    assert set(plan_query(re.compile("(?i)KerNel"))[1]) == {b"rne", b"ern", b"nel"}
+    assert plan_query(re.compile("(?i)ok")) is None
+
+
+def _scan(store, regex):
+    return [e.seq for e in store.iter_entries() if regex.search(entry_text(e))]
+
+
+def _indexed(store, regex):
+    plan = plan_query(regex)
+    entries = store.iter_entries() if plan is None else store.candidate_entries(plan)
+    return [e.seq for e in entries if regex.search(entry_text(e))]
+
+
+def test_index_matches_full_scan_across_eviction_and_tiers():
+    """淘汰、清理、温层和保留类别下，走索引的搜索结果与全量扫描一致"""
+    rng = random.Random(7)
+    words = ["boot", "wifi", "connect", "failed", "temp", "sensor", "panic", "OK", "Timeout"]
+    errors = RetentionClass("errors", pattern="panic", max_lines=50, indexed=True)
+    store = ClassifiedLogStore(
+        TieredLogStore(LogStore(max_lines=300, indexed=True), warm_budget=1 << 20, chunk_lines=64),
+        [errors])
+    for i in range(20 * BLOCK_LINES * 10):
+        if rng.random() < 0.01:
+            store.append(bytes([0xff, rng.randrange(256)]) + b"connect", flags=FLAG_BINARY)
+        else:
+            line = " ".join(rng.choice(words) for _ in range(rng.randrange(1, 5)))
+            store.append(f"{i} {line}".encode())
+    assert store.stats()["warm_chunks"] > 0
+    patterns = ["connect failed", "(?i)TIMEOUT", "panic|boot", "wifi.*temp", r"^1\d\d sensor",
+                "CONNECT", "HEX", "nothing here"]
+    for pattern in patterns:
+        regex = re.compile(pattern)
+        assert _indexed(store, regex) == _scan(store, regex), pattern
+
+
+def test_index_survives_clear_and_resize():
+    """清空和调整容量后索引仍与缓冲区一致"""
+    store = LogStore(max_lines=100, indexed=True)
+    for i in range(250):
+        store.append(f"line {i} {'alarm' if i % 10 == 0 else 'ok'}".encode())
+    regex = re.compile("alarm")
+    assert _indexed(store, regex) == _scan(store, regex) == list(range(150, 250, 10))
+    store.set_retention(max_lines=35)
+    assert _indexed(store, regex) == list(range(220, 250, 10))
+    store.clear()
+    assert _indexed(store, regex) == []
+    store.append(b"alarm again")
+    assert _indexed(store, regex) == [250]
+
+
+def test_search_cache_scans_only_new_lines():
+    """重复查询只扫描新到达的行，丢弃已淘汰的匹配，结果与全量扫描一致"""
+    store = LogStore(max_lines=100, indexed=True)
+    cache = SearchCache()
+    regex = re.compile("alarm")
+    for i in range(80):
+        store.append(f"line {i} {'alarm' if i % 10 == 0 else 'ok'}".encode())
+    assert list(cache.search(store, "alarm").seqs) == _scan(store, regex)
+    for i in range(80, 150):
+        store.append(f"line {i} {'alarm' if i % 10 == 0 else 'ok'}".encode())
+    assert list(cache.search(store, "alarm").seqs) == _scan(store, regex) == list(range(50, 150, 10))
+    stats = cache.stats()
+    assert (stats["result_misses"], stats["result_hits"]) == (1, 1)
+    assert stats["incremental_lines"] == 70
+    assert (stats["compile_misses"], stats["compile_hits"]) == (1, 1)
+    with pytest.raises(ValueError):
+        cache.compile("[broken")
+
+
+def test_service_search_cache_with_dedup_and_clear():
+    """折叠的重复次数在读取时获取最新值，清空后缓存不返回旧结果"""
+    service = SerialService(max_log_lines=50, log_dedup="exact")
+    service.show_timestamp = False
+    service.add_log_entry("boot ok")
+    service.add_log_entry("warn: low battery")
+    assert service.search_logs("battery") == ["warn: low battery"]
+    service.add_log_entry("warn: low battery")
+    [line] = service.search_logs("battery")
+    assert line.startswith("warn: low battery [重复 2 次")
+    service.clear_log_buffer()
+    service.add_log_entry("battery replaced")
+    assert service.search_logs("battery") == ["battery replaced"]
+    assert service.get_log_stats()["search_cache"]["result_hits"] == 1
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
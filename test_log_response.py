@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+测试日志工具的响应大小限制、分页令牌和紧凑格式
+"""
+
+import asyncio
+import json
+import sys
+
+import pytest
+
+import mcp_server
+from service import SerialService
+
+
+@pytest.fixture
+def service():
+    service = SerialService(max_log_lines=1000)
+    service.show_timestamp = False
+    for i in range(300):
+        service.add_log_entry(f"line {i} " + "x" * (200 if i % 10 == 0 else 10))
+    mcp_server.set_serial_service(service)
+    return service
+
+
+def test_recent_logs_budget_keeps_newest_and_pages_back(service):
+    """超出字节预算时保留最新的行，next_page_token 逐页向前直到窗口起点，各页拼接后与完整结果一致"""
+    everything = mcp_server.get_recent_logs(200)["logs"]
+    pages = []
+    token = None
+    while True:
+        result = mcp_server.get_recent_logs(200, max_bytes=1500, page_token=token)
+        assert len(json.dumps(result["logs"]).encode()) <= 1500 + 300
+        pages.insert(0, result["logs"])
+        token = result["next_page_token"]
+        if token is None:
+            break
+    assert [line for page in pages for line in page] == [f"line {i} " + "x" * (200 if i % 10 == 0 else 10)
+                                                          for i in range(300)]
+    assert pages[-1] == everything[-len(pages[-1]):]
+
+    result = mcp_server.get_recent_logs(5, max_line_chars=8, compact=True)
+    assert result["columns"]["seq"] == [295, 296, 297, 298, 299]
+    assert result["columns"]["text"][0] == "line 295…[截断 11 字符]"
+    assert len(result["columns"]["timestamp"]) == 5
+    assert "logs" not in result and "buffer_size" not in result
+    assert mcp_server.get_recent_logs(5, page_token="bogus")["status"] == "error"
+
+
+def test_search_pages_continue_after_last_match(service):
+    """搜索结果按 max_results 和 max_tokens 分页，后续页不包含首次搜索之后到达的行"""
+    first = asyncio.run(mcp_server.query_serial_logs(r"line \d*0 ", max_results=10, max_tokens=200))
+    assert first["truncated"] and first["next_page_token"]
+    matches = first["matches"]
+    token = first["next_page_token"]
+    service.add_log_entry("line 900 late")
+    while token:
+        page = asyncio.run(mcp_server.query_serial_logs(r"line \d*0 ", max_results=10, max_tokens=200,
+                                                        page_token=token))
+        matches += page["matches"]
+        token = page["next_page_token"]
+    assert [line.split()[1] for line in matches] == [str(i) for i in range(0, 300, 10)]
+
+    mismatch = asyncio.run(mcp_server.query_serial_logs("other", page_token=first["next_page_token"]))
+    assert mismatch["status"] == "error"
+
+    since = mcp_server.get_logs_since(0, max_bytes=100)
+    assert since["has_more"] and since["next_cursor"] == since["seqs"][-1] + 1
+
+
+def test_search_context_counts_against_budget(service):
+    """上下文只为实际返回的匹配生成，并与匹配行一起计入 max_bytes"""
+    result = asyncio.run(mcp_server.query_serial_logs(r"line \d*5 ", before=1, after=1, max_bytes=300))
+    assert result["truncated"] and result["next_page_token"]
+    returned = [int(line.split()[1]) for line in result["matches"]]
+    context_lines = [line for group in result["context"] for line in group["lines"]]
+    assert [int(line.split(":")[0]) for line in context_lines if ": " in line] == returned
+    assert result["context"][-1]["last_seq"] == returned[-1] + 1
+    size = sum(len(line.encode()) + 4 for line in result["matches"] + context_lines)
+    assert size <= 300 or len(returned) == 1
+
+    compact = asyncio.run(mcp_server.query_serial_logs(r"line 10 ", before=1, max_line_chars=10, compact=True))
+    assert compact["columns"]["text"] == ["line 10 xx…[截断 198 字符]"]
+    assert compact["context"][0]["lines"] == ["9- line 9 xxx…[截断 7 字符]", "10: line 10 xx…[截断 198 字符]"]
+
+
+def test_multi_search_budget_and_pages(service):
+    """多模式搜索共用字节上限，截断的模式通过 next_page_token 继续，各页拼接后与完整结果一致"""
+    patterns = [{"name": "tens", "pattern": r"line \d*0 "}, {"name": "sevens", "pattern": r"line \d*7 "}]
+    everything = asyncio.run(mcp_server.query_serial_logs_multi(patterns, max_results=1000))["results"]
+    collected = {"tens": [], "sevens": []}
+    token = None
+    for _page in range(50):
+        result = asyncio.run(mcp_server.query_serial_logs_multi(patterns, max_results=1000, max_bytes=1000,
+                                                                 page_token=token))
+        assert result["status"] == "success"
+        size = 0
+        for name, item in result["results"].items():
+            collected[name] += item["matches"]
+            size += sum(len(line.encode()) + 4 for line in item["matches"])
+        assert size <= 1000 + 220
+        token = result["next_page_token"]
+        if not token:
+            break
+    assert _page > 1 and collected == {name: item["matches"] for name, item in everything.items()}
+
+    compact = asyncio.run(mcp_server.query_serial_logs_multi(patterns, max_results=2, max_line_chars=8,
+                                                             compact=True))
+    assert compact["results"]["sevens"]["columns"]["text"] == ["line 7 x…[截断 9 字符]", "line 17 …[截断 10 字符]"]
+    other = asyncio.run(mcp_server.query_serial_logs_multi([{"pattern": "other"}],
+                                                           page_token=compact["next_page_token"]))
+    assert other["status"] == "error"
+
+
+def test_aggregate_lines_are_shaped(service):
+    """统计结果中的首次/最后一次出现的行也受 max_line_chars 限制"""
+    result = asyncio.run(mcp_server.aggregate_serial_logs(r"line \d*0 ", max_line_chars=9))
+    assert result["first"]["line"] == "line 0 xx…[截断 198 字符]"
+    assert result["last"]["line"] == "line 290 …[截断 200 字符]"
+
+
+def test_recent_log_pages_read_back_from_window_end(monkeypatch):
+    """向前翻页只从窗口末尾向前读取需要的条目，保留类别造成的序号空洞也能补足"""
+    service = SerialService(max_log_lines=50, log_warm_budget=1 << 20,
+                            log_retention_classes=[{"name": "errors", "pattern": "Error", "max_lines": 20}])
+    for i in range(3000):
+        service.add_log_entry(f"Error {i}" if i % 7 == 0 else f"line {i}")
+    store = service._log_store
+    everything = list(store.iter_entries())
+    read = []
+    iter_entries = store.iter_entries
+
+    def counting(start=None, end=None):
+        entries = list(iter_entries(start, end))
+        read.extend(entries)
+        return iter(entries)
+    monkeypatch.setattr(store, "iter_entries", counting)
+    for end in (3000, 2990, 2000, 1000, 10):
+        read.clear()
+        entries, _first = service.recent_entries(10, end=end)
+        assert entries == [e for e in everything if e.seq < end][-10:]
+        assert len(read) < 100
+    entries, _first = service.recent_entries(10, start=2995, end=3000)
+    assert [e.seq for e in entries] == list(range(2995, 3000))
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
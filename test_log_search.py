@@ -3,6 +3,8 @@
 测试日志搜索功能的脚本
 """
 
+import asyncio
+
 from service import SerialService
 from mcp_server import set_serial_service, query_serial_logs, get_log_buffer_info, clear_log_buffer
 
@@ -35,10 +37,13 @@ def test_log_search():
     buffer_info = get_log_buffer_info()
     print(f"   缓冲区大小: {buffer_info['buffer_size']}")
     print(f"   最大缓冲区大小: {buffer_info['max_buffer_size']}")
+    print(f"   缓冲区字节数: {buffer_info['buffer_bytes']}")
+    assert buffer_info['buffer_size'] == len(test_logs)
+    assert buffer_info['evicted_lines'] == 0
     
     # 测试搜索 "reminder" 关键字
     print("\n2. 搜索包含 'reminder' 的日志:")
-    result = query_serial_logs(".*reminder.*", max_results=10)
+    result = asyncio.run(query_serial_logs(".*reminder.*", max_results=10))
     print(f"   状态: {result['status']}")
     print(f"   消息: {result['message']}")
     print(f"   匹配数量: {result['total_matches']}")
@@ -47,7 +52,7 @@ def test_log_search():
     
     # 测试正则表达式搜索
     print("\n3. 使用正则表达式搜索以 'Error' 或 'Warning' 开头的日志:")
-    result = query_serial_logs("^.*(?:Error|Warning):.*$", max_results=10)
+    result = asyncio.run(query_serial_logs("^.*(?:Error|Warning):.*$", max_results=10))
     print(f"   状态: {result['status']}")
     print(f"   消息: {result['message']}")
     print(f"   匹配数量: {result['total_matches']}")
@@ -56,7 +61,7 @@ def test_log_search():
     
     # 测试温度相关的搜索
     print("\n4. 搜索温度相关信息 (包含数字和°C):")
-    result = query_serial_logs(r".*Temperature.*\d+\.\d+°C.*", max_results=10)
+    result = asyncio.run(query_serial_logs(r".*Temperature.*\d+\.\d+°C.*", max_results=10))
     print(f"   状态: {result['status']}")
     print(f"   消息: {result['message']}")
     print(f"   匹配数量: {result['total_matches']}")
@@ -65,7 +70,7 @@ def test_log_search():
     
     # 测试无效正则表达式
     print("\n5. 测试无效正则表达式:")
-    result = query_serial_logs("[invalid regex", max_results=10)
+    result = asyncio.run(query_serial_logs("[invalid regex", max_results=10))
     print(f"   状态: {result['status']}")
     print(f"   消息: {result['message']}")
     
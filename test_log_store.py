@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+测试列式环形日志缓冲区
+"""
+
+import asyncio
+import re
+import sys
+import threading
+import time
+
+import pytest
+
+from log_retention import ClassifiedLogStore, RetentionClass, detect_level
+from log_aggregate import aggregate_entries
+from log_store import FLAG_BINARY, FLAG_VARIANT, LogStore, TieredLogStore, expand_entry, format_entry
+import search_cache as search_cache_module
+from service import SerialService
+
+
+def test_store_evicts_by_line_count():
+    """超过最大行数时淘汰最旧的行，序号持续递增"""
+    store = LogStore(max_lines=3)
+    for i in range(5):
+        assert store.append(f"line {i}".encode()) == i
+    assert len(store) == 3
+    assert store.first_seq == 2
+    assert [store.text(seq) for seq in store.seqs()] == ["line 2", "line 3", "line 4"]
+    with pytest.raises(IndexError):
+        store.text(1)
+
+
+def test_store_evicts_when_arena_full():
+    """按字节预算保留时 arena 即为预算，空间不足时回绕并淘汰被覆盖的旧行"""
+    store = LogStore(max_lines=100, byte_budget=16)
+    for i in range(10):
+        store.append(f"abcde{i}".encode())
+    texts = [store.text(seq) for seq in store.seqs()]
+    assert texts == ["abcde8", "abcde9"]
+    # 空行和超长行
+    store.append(b"")
+    store.append(b"x" * 40)
+    assert store.text(store.next_seq - 1) == "x" * 16
+    assert len(store) == 1
+
+
+def test_store_line_mode_grows_arena_for_long_lines():
+    """只按行数保留时 arena 写不下就扩大: max_lines 条长行全部保留、不截断，只按行数淘汰"""
+    store = LogStore(max_lines=1000)
+    lines = [f"{i:04d}".encode() + b"x" * 501 for i in range(1000)]
+    for line in lines:
+        store.append(line)
+    stats = store.stats()
+    assert (stats["lines"], stats["evicted_lines"], stats["bytes"]) == (1000, 0, 1000 * 505)
+    assert stats["arena_bytes"] >= 1000 * 505
+    assert [store.raw(seq) for seq in store.seqs()] == lines
+
+    store.append(b"y" * 100000)
+    assert store.raw(store.next_seq - 1) == b"y" * 100000
+    assert store.first_seq == 1 and store.stats()["evicted_lines"] == 1
+
+    store.set_retention(max_lines=500)
+    assert [store.raw(seq) for seq in store.seqs()] == lines[501:] + [b"y" * 100000]
+
+
+def test_store_binary_lines_and_lazy_format():
+    """二进制行保留原始字节，读取时才格式化"""
+    store = LogStore(max_lines=10)
+    seq = store.append(b"\xff\x00\x10", flags=FLAG_BINARY)
+    assert store.raw(seq) == b"\xff\x00\x10"
+    assert store.text(seq) == "[HEX] FF0010"
+    assert store.format(seq, show_timestamp=True).startswith("[")
+    assert store.format(seq, show_timestamp=False) == "[HEX] FF0010"
+
+
+def test_store_byte_budget_and_stats():
+    """按字节预算整行淘汰，并统计淘汰的行数和字节数"""
+    store = LogStore(byte_budget=100)
+    assert store.max_lines == 100 // 8
+    store.append(b"a" * 60)
+    store.append(b"b" * 30)
+    store.append(b"c" * 20)
+    stats = store.stats()
+    assert stats["lines"] == 2
+    assert stats["bytes"] == 50
+    assert stats["evicted_lines"] == 1
+    assert stats["evicted_bytes"] == 60
+    assert [store.raw(seq)[:1] for seq in store.seqs()] == [b"b", b"c"]
+
+    # 短行不会先于字节预算被按行数淘汰: 槽位按需成倍增长到后备上限
+    store = LogStore(byte_budget=4096)
+    assert store.stats()["slots"] == 4096 // 128
+    for i in range(400):
+        store.append(f"OK {i}".encode())
+    stats = store.stats()
+    assert (stats["lines"], stats["evicted_lines"]) == (400, 0)
+    assert 400 <= stats["slots"] <= store.max_lines == 512
+    assert [store.text(seq) for seq in store.seqs()][:2] == ["OK 0", "OK 1"]
+
+
+def test_store_max_age():
+    """超过最长保留时间的条目被淘汰"""
+    store = LogStore(max_lines=10, max_age=1.0)
+    store.append(b"old", timestamp_ns=1_000_000_000)
+    store.append(b"new", timestamp_ns=1_500_000_000)
+    assert store.expire(now_ns=2_200_000_000) == 1
+    assert [store.text(seq) for seq in store.seqs()] == ["new"]
+
+
+def test_store_set_retention_keeps_entries():
+    """运行时修改预算时保留能放下的最新条目，序号不变"""
+    store = LogStore(max_lines=10)
+    for i in range(6):
+        store.append(f"line {i}".encode())
+    store.set_retention(max_lines=10, byte_budget=14)
+    assert [store.text(seq) for seq in store.seqs()] == ["line 4", "line 5"]
+    assert store.first_seq == 4
+    assert store.stats()["evicted_lines"] == 4
+    store.append(b"line 6")
+    assert store.text(6) == "line 6"
+    assert store.first_seq == 5
+    store.set_retention(max_lines=50)
+    assert [store.text(seq) for seq in store.seqs()] == ["line 5", "line 6"]
+    assert store.stats()["byte_budget"] is None
+
+
+def test_tiered_store_reads_across_tiers():
+    """热层挤出的行压缩进温层，读取时跨两级按序返回"""
+    store = TieredLogStore(LogStore(max_lines=10), warm_budget=1 << 20, chunk_lines=8)
+    for i in range(50):
+        store.append(f"dbg: poll sensor {i % 3} status ok".encode(), timestamp_ns=i)
+    stats = store.stats()
+    assert stats["lines"] == 50
+    assert stats["hot_lines"] == 10
+    assert stats["warm_chunks"] == 5
+    assert stats["warm_compressed_bytes"] < stats["warm_raw_bytes"]
+    assert [e.seq for e in store.iter_entries()] == list(range(50))
+    assert [e.seq for e in store.iter_entries(5, 20)] == list(range(5, 20))
+    assert [e.seq for e in store.tail(15)] == list(range(35, 50))
+    assert store.text(3) == "dbg: poll sensor 0 status ok"
+    assert store.first_seq == 0
+
+
+def test_tiered_store_warm_budget_and_age():
+    """温层超出预算时整块淘汰最旧的块，超龄条目跨两级淘汰"""
+    store = TieredLogStore(LogStore(max_lines=4, max_age=1.0), warm_budget=1 << 20,
+                           chunk_lines=4, codec="lzma")
+    for i in range(20):
+        store.append(f"line {i}".encode(), timestamp_ns=i * 100_000_000)
+    # now=2.1s: 早于 1.1s 的条目（0..10）超龄
+    store.expire(now_ns=2_100_000_000)
+    assert [e.seq for e in store.iter_entries()] == list(range(11, 20))
+    assert len(store) == 9
+    assert store.first_seq == 11
+
+    store.set_retention(max_lines=4, max_age=None, warm_budget=1)
+    stats = store.stats()
+    assert stats["warm_chunks"] == 0
+    assert len(store) == 4 + stats["warm_lines"]
+    assert store.tail(100)[-1].seq == 19
+
+
+def test_tiered_store_age_expiry_accounting():
+    """暂存区和块中超龄移除的行只扣除一次字节，并计入淘汰统计"""
+    store = TieredLogStore(LogStore(max_lines=4, max_age=1.0), warm_budget=1 << 20, chunk_lines=8)
+    sizes = []
+
+    def append(i):
+        data = f"line {i} ".encode() + b"x" * i
+        sizes.append(len(data))
+        store.append(data, timestamp_ns=i * 100_000_000)
+
+    def check():
+        stats = store.stats()
+        warm = [e for e in store.iter_entries() if e.seq < store.hot.first_seq]
+        assert stats["warm_lines"] == len(warm)
+        assert stats["warm_raw_bytes"] == sum(len(e.data) for e in warm)
+        assert stats["lines"] + stats["evicted_lines"] == len(sizes)
+        assert stats["bytes"] + stats["evicted_bytes"] == sum(sizes)
+
+    for i in range(10):
+        append(i)
+    # 暂存区中的 0..2 超龄，之后随暂存区一起封存进第一个块
+    assert store.expire(now_ns=1_250_000_000) == 3
+    check()
+    for i in range(10, 20):
+        append(i)
+    assert store.stats()["warm_chunks"] == 2
+    check()
+    # 第一个块（0..7）整体超龄，第二个块中 8..9 超龄
+    assert store.expire(now_ns=1_950_000_000) == 7
+    assert store.first_seq == 10
+    check()
+
+
+def test_detect_level():
+    """识别常见格式的日志级别"""
+    assert detect_level(b"E (1234) wifi: connect failed") == "error"
+    assert detect_level(b"[12:00:01] [WARN] low battery") == "warning"
+    assert detect_level(b"Error: Connection timeout") == "error"
+    assert detect_level(b"dbg: poll 42") is None
+
+
+def test_classified_store_keeps_errors_under_flood():
+    """错误行有独立配额，在大量调试输出下仍被保留，查询保持全局顺序"""
+    errors = RetentionClass("errors", pattern="panic", levels=["error"], max_lines=10)
+    store = ClassifiedLogStore(TieredLogStore(LogStore(max_lines=5)), [errors])
+    store.append(b"Error: boot failed")
+    for i in range(100):
+        store.append(f"dbg: poll {i}".encode())
+        if i == 50:
+            store.append(b"core panic at 0x1234")
+    texts = [e.data for e in store.iter_entries()]
+    assert texts[:2] == [b"Error: boot failed", b"core panic at 0x1234"]
+    assert texts[2:] == [f"dbg: poll {i}".encode() for i in range(95, 100)]
+    seqs = [e.seq for e in store.iter_entries()]
+    assert seqs == sorted(seqs)
+    assert [e.data for e in store.tail(2)] == [b"dbg: poll 98", b"dbg: poll 99"]
+    stats = store.stats()
+    assert stats["classes"]["errors"]["lines"] == 2
+    assert stats["classes"]["default"]["lines"] == 5
+    assert stats["classes"]["default"]["evicted_lines"] == 95
+    assert stats["lines"] == 7
+    assert store.entry(0).data == b"Error: boot failed"
+
+
+def test_dedup_collapses_consecutive_repeats():
+    """连续重复行折叠为一条并计数，template 模式忽略数字差异"""
+    store = ClassifiedLogStore(TieredLogStore(LogStore(max_lines=10)), dedup="exact")
+    for i in range(5):
+        store.append(b"wifi: retry", timestamp_ns=i * 1_000_000)
+    store.append(b"wifi: ok", timestamp_ns=9_000_000)
+    store.append(b"wifi: ok", timestamp_ns=9_500_000)
+    entries = list(store.iter_entries())
+    assert [(e.data, e.count) for e in entries] == [(b"wifi: retry", 5), (b"wifi: ok", 2)]
+    assert entries[0].last_timestamp_ns == 4_000_000
+    assert format_entry(entries[0], False).startswith("wifi: retry [重复 5 次，最后一次 ")
+    assert [e.timestamp_ns for e in expand_entry(entries[0])][-1] == 4_000_000
+    assert len(expand_entry(entries[0])) == 5
+    assert store.stats()["deduplicated_lines"] == 5
+
+    store = ClassifiedLogStore(TieredLogStore(LogStore(max_lines=10)), dedup="template")
+    for i in range(3):
+        store.append(f"poll sensor {i} at 0x{i:04x}".encode())
+    store.append(b"done")
+    store.append(b"done")
+    entries = list(store.iter_entries())
+    assert [(e.data, e.count) for e in entries] == [(b"poll sensor 0 at 0x0000", 3), (b"done", 2)]
+    # 文本不同的重复没有保存各次的文本: 不展开，统计捕获组时其余重复的取值记为未知
+    assert entries[0].flags & FLAG_VARIANT and not entries[1].flags & FLAG_VARIANT
+    assert expand_entry(entries[0]) == [entries[0]]
+    assert len(expand_entry(entries[1])) == 2
+    stats = aggregate_entries(entries[:1], re.compile(r"sensor (\d+)"), group=1)
+    assert (stats["count"], stats["top_values"], stats["unknown_values"]) == (3, [{"value": "0", "count": 1}], 2)
+
+
+def test_dedup_counts_survive_warm_tier():
+    """折叠计数在压缩进温层后保持不变"""
+    store = ClassifiedLogStore(
+        TieredLogStore(LogStore(max_lines=2), warm_budget=1 << 20, chunk_lines=2), dedup="exact")
+    for text in [b"a", b"a", b"a", b"b", b"c", b"c", b"d", b"e"]:
+        store.append(text, timestamp_ns=len(store) * 10)
+    assert store.stats()["warm_chunks"] == 1
+    assert [(e.data, e.count) for e in store.iter_entries()] == [
+        (b"a", 3), (b"b", 1), (b"c", 2), (b"d", 1), (b"e", 1)]
+
+
+def test_snapshot_unaffected_by_later_writes():
+    """读取方拿到的快照不受之后的淘汰、清空和容量调整影响"""
+    store = TieredLogStore(LogStore(max_lines=8), warm_budget=1 << 20, chunk_lines=4)
+    for i in range(20):
+        store.append(f"line {i}".encode())
+    snapshot = store.iter_entries()
+    first = next(snapshot)
+    for i in range(20, 40):
+        store.append(f"line {i}".encode())
+    store.set_retention(max_lines=4)
+    store.clear()
+    rest = [e.data for e in snapshot]
+    assert [first.data] + rest == [f"line {i}".encode() for i in range(20)]
+    assert len(store) == 0
+    store.append(b"after clear")
+    assert [e.data for e in store.iter_entries()] == [b"after clear"]
+
+
+def test_ingest_not_blocked_by_parallel_searches(monkeypatch):
+    """多个慢速搜索并行进行时，写入不等待读取，搜索得到的是序号连续的一致快照"""
+    service = SerialService(max_log_lines=200, log_warm_budget=1 << 20)
+    service.show_timestamp = False
+    for i in range(200):
+        service.add_log_entry(f"line {i}")
+
+    entry_text = search_cache_module.entry_text
+
+    def slow_entry_text(entry):
+        time.sleep(0.002)  # 模拟耗时的搜索（sleep 释放 GIL，只剩锁的影响）
+        return entry_text(entry)
+    monkeypatch.setattr(search_cache_module, "entry_text", slow_entry_text)
+
+    results = []
+
+    def search():
+        results.append(service.search_logs("^line", max_results=10000))
+
+    searchers = [threading.Thread(target=search) for _ in range(4)]
+    for thread in searchers:
+        thread.start()
+    time.sleep(0.05)
+
+    start = time.perf_counter()
+    for i in range(200, 5200):
+        service.add_log_entry(f"line {i}")
+    ingest_seconds = time.perf_counter() - start
+    still_searching = sum(thread.is_alive() for thread in searchers)
+    for thread in searchers:
+        thread.join()
+
+    assert still_searching == len(searchers), f"写入耗时 {ingest_seconds:.3f}s，被搜索阻塞"
+    for lines in results:
+        numbers = [int(line.split()[1]) for line in lines]
+        assert numbers == list(range(numbers[0], numbers[0] + len(numbers)))
+        assert len(numbers) >= 200
+    assert service.get_recent_logs(1) == ["line 5199"]
+
+
+def test_logs_since_cursor_reports_gaps():
+    """按游标增量读取: 只返回新条目，分页读取，淘汰造成的缺口计入 missed"""
+    service = SerialService(max_log_lines=10)
+    service.show_timestamp = False
+    for i in range(5):
+        service.add_log_entry(f"line {i}")
+    first = service.get_logs_since(None, max_lines=3)
+    assert first.lines == [(0, "line 0"), (1, "line 1"), (2, "line 2")] and first.has_more
+    rest = service.get_logs_since(first.next_cursor)
+    assert [seq for seq, _ in rest.lines] == [3, 4]
+    assert (rest.next_cursor, rest.missed, rest.has_more) == (5, 0, False)
+    assert service.get_logs_since(rest.next_cursor).lines == []
+
+    for i in range(5, 20):
+        service.add_log_entry(f"line {i}")
+    behind = service.get_logs_since(rest.next_cursor)
+    assert behind.missed == 5
+    assert [line for _, line in behind.lines] == [f"line {i}" for i in range(10, 20)]
+    assert service.get_logs_since(1000).reset
+
+
+def test_repeats_after_a_cursor_get_new_seqs():
+    """开启去重时，取游标之后到达的重复行不会折叠进游标之前的条目，增量读取和等待匹配都能看到它"""
+    service = SerialService(max_log_lines=50, log_dedup="exact")
+    service.show_timestamp = False
+    service.add_log_entry("OK")
+    service.add_log_entry("OK")
+    assert service.log_size() == 1
+    cursor = service.log_cursor()
+    service.add_log_entry("OK")
+    service.add_log_entry("OK")
+    since = service.get_logs_since(cursor)
+    assert [seq for seq, _line in since.lines] == [cursor]
+    assert since.lines[0][1].startswith("OK [重复 2 次")
+
+    async def wait():
+        waited = asyncio.ensure_future(service.wait_for_pattern("^OK$", timeout=1, since_cursor=since.next_cursor))
+        await asyncio.sleep(0.01)
+        service.add_log_entry("OK")
+        return await waited
+    result = asyncio.run(wait())
+    assert result.matched and result.seq == since.next_cursor
+
+
+def test_set_log_retention_keeps_omitted_settings():
+    """set_log_retention 只修改给出的参数，改为按字节预算保留时行数上限为宽松的后备上限"""
+    import mcp_server
+    service = SerialService(max_log_lines=100, log_max_age=3600)
+    mcp_server.set_serial_service(service)
+    result = mcp_server.set_log_retention(byte_budget=4096)
+    assert (result["byte_budget"], result["max_age"], result["max_buffer_size"]) == (4096, 3600, 4096 // 8)
+    result = mcp_server.set_log_retention(warm_budget=1 << 20)
+    assert (result["byte_budget"], result["max_age"], result["warm_budget"]) == (4096, 3600, 1 << 20)
+    result = mcp_server.set_log_retention(max_age=0, max_lines=300)
+    assert (result["byte_budget"], result["max_age"], result["max_buffer_size"]) == (4096, None, 300)
+    result = mcp_server.set_log_retention(byte_budget=0)
+    assert (result["byte_budget"], result["max_buffer_size"], result["warm_budget"]) == (None, 100, 1 << 20)
+    assert mcp_server.set_log_retention(max_lines=-1)["status"] == "error"
+
+
+def test_head_tail_and_range_read_only_what_is_needed(monkeypatch):
+    """head/tail/range 与全量遍历一致（含温层和保留类别），MCP 工具不再复制整个缓冲区"""
+    import mcp_server
+    service = SerialService(max_log_lines=50, log_warm_budget=1 << 20,
+                            log_retention_classes=[{"name": "errors", "pattern": "Error", "max_lines": 20}])
+    service.show_timestamp = False
+    for i in range(300):
+        service.add_log_entry(f"Error {i}" if i % 7 == 0 else f"line {i}")
+    everything = service.get_log_buffer()
+    assert service.log_size() == len(everything)
+    assert service.get_log_head(5) == everything[:5]
+    assert service.get_recent_logs(5) == everything[-5:]
+    # 序号 105 的错误行已被错误类别的配额挤出
+    assert service.get_log_range(100, 110) == [f"line {i}" for i in range(100, 110) if i != 105]
+
+    def copy_everything(*args, **kwargs):
+        raise AssertionError("不应复制整个缓冲区")
+    monkeypatch.setattr(service, "get_log_buffer", copy_everything)
+    mcp_server.set_serial_service(service)
+    info = mcp_server.get_log_buffer_info()
+    assert (info["buffer_size"], info["oldest_entry"], info["newest_entry"]) == (
+        len(everything), everything[0], everything[-1])
+    assert mcp_server.get_recent_logs(3)["buffer_size"] == len(everything)
+
+
+def test_service_formats_on_read():
+    """时间戳显示设置在读取时生效"""
+    service = SerialService(max_log_lines=10)
+    service.add_log_entry("Error: boom")
+    service.set_show_timestamp(False)
+    assert service.get_log_buffer() == ["Error: boom"]
+    service.set_show_timestamp(True)
+    assert service.search_logs("^Error")[0].endswith("] Error: boom")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+测试多模式单次遍历搜索
+"""
+
+import sys
+
+import pytest
+
+import search_cache as search_cache_module
+from service import SerialService
+
+
+def test_multi_pattern_search_single_pass(monkeypatch):
+    """多模式搜索只遍历一次缓冲区，每个模式的计数和结果与单独搜索一致，上限只影响返回的行"""
+    service = SerialService(max_log_lines=500, log_search_index=False)
+    service.show_timestamp = False
+    for i in range(300):
+        service.add_log_entry(["boot ok", "PANIC at 0x40", "wdt reset", "assert failed: x", "tick"][i % 5]
+                              + f" {i}")
+    decoded = []
+    entry_text = search_cache_module.entry_text
+
+    def counting_entry_text(entry):
+        decoded.append(entry.seq)
+        return entry_text(entry)
+    monkeypatch.setattr(search_cache_module, "entry_text", counting_entry_text)
+
+    patterns = [{"name": "panic", "pattern": "(?i)panic"},
+                {"name": "reset", "pattern": r"wdt\s+reset", "max_results": 3},
+                {"name": "assert", "pattern": "assert failed"}]
+    result = service.run_multi_search(patterns, max_results=100, time_budget=None)
+    assert len(decoded) == 300
+    assert result.results["panic"]["count"] == 60
+    assert result.results["panic"]["matches"] == service.search_logs("(?i)panic", 100)
+    reset = result.results["reset"]
+    assert (reset["count"], len(reset["matches"]), reset["truncated"]) == (60, 3, True)
+    assert reset["matches"] == ["wdt reset 2", "wdt reset 7", "wdt reset 12"]
+    with pytest.raises(ValueError):
+        service.run_multi_search([{"name": "a", "pattern": "x"}, {"name": "a", "pattern": "y"}])
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
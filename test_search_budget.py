@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+测试搜索的时间预算、取消和有回溯风险的正则
+"""
+
+import re
+import sys
+import threading
+import time
+
+import pytest
+
+import search_cache as search_cache_module
+from regex_worker import is_risky
+from service import SerialService
+
+
+def test_risky_pattern_detection():
+    """量词嵌套、量词内的分支和反向引用被视为有回溯风险"""
+    for pattern in [r"(a+)+$", r"(a|aa)*b", r"(\w+\s?)*$", r"(x)\1", r"(?:(?:ab)*c)+"]:
+        assert is_risky(re.compile(pattern)), pattern
+    for pattern in [r"^E \(\d+\) wifi", r"(foo|bar) failed", r"a+b+c*", r"(ab){2,}", r"(?i)timeout"]:
+        assert not is_risky(re.compile(pattern)), pattern
+
+
+def test_risky_search_times_out_without_blocking_ingest():
+    """灾难性回溯的正则在子进程中执行，超时返回部分结果，期间写入不受影响"""
+    service = SerialService(max_log_lines=5000)
+    service.show_timestamp = False
+    service.add_log_entry("aaaa")
+    service.add_log_entry("a" * 40 + "!")  # (a+)+$ 在这一行上会回溯约 2^40 次
+    results = []
+    searcher = threading.Thread(
+        target=lambda: results.append(service.run_search(r"(a+)+$", time_budget=2.0)))
+    searcher.start()
+    time.sleep(0.2)
+
+    start = time.perf_counter()
+    for i in range(2000):
+        service.add_log_entry(f"line {i}")
+    ingest_seconds = time.perf_counter() - start
+    assert searcher.is_alive(), f"写入耗时 {ingest_seconds:.3f}s，被搜索阻塞"
+    searcher.join(10)
+
+    [result] = results
+    assert result.timed_out and result.truncated
+    assert result.matches == ["aaaa"]
+    assert service.get_log_stats()["search_cache"]["worker_queries"] == 1
+
+
+def test_worker_stopping_after_the_last_line_of_a_batch(monkeypatch):
+    """子进程报告了批次最后一行的匹配后超时: 返回部分结果，下次从批次之后继续"""
+    service = SerialService(max_log_lines=100)
+    service.show_timestamp = False
+    for i in range(5):
+        service.add_log_entry(f"aaa{i}")
+    worker = service._search_cache._worker
+    calls = []
+
+    def stop_after_last(regex, texts, deadline=None, cancel=None):
+        calls.append(len(texts))
+        return ([len(texts) - 1], False) if len(calls) == 1 else (list(range(len(texts))), True)
+    monkeypatch.setattr(worker, "match", stop_after_last)
+
+    result = service.run_search(r"(a+)+\d", time_budget=1.0)
+    assert result.timed_out and result.matches == ["aaa4"]
+    service.add_log_entry("aaa5")
+    result = service.run_search(r"(a+)+\d", time_budget=1.0)
+    assert calls == [5, 1] and not result.truncated
+    assert result.matches == ["aaa4", "aaa5"]
+
+
+def test_budget_returns_partial_results_and_resumes(monkeypatch):
+    """时间预算耗尽或被取消时返回已扫描部分的匹配，下次查询从中断处继续"""
+    service = SerialService(max_log_lines=1000, log_search_index=False)
+    service.show_timestamp = False
+    for i in range(400):
+        service.add_log_entry(f"line {i}")
+    entry_text = search_cache_module.entry_text
+
+    def slow_entry_text(entry):
+        time.sleep(0.001)
+        return entry_text(entry)
+    monkeypatch.setattr(search_cache_module, "entry_text", slow_entry_text)
+
+    result = service.run_search("^line", max_results=1000, time_budget=0.1)
+    assert result.timed_out and 0 < len(result.matches) < 400
+    assert result.matches == [f"line {i}" for i in range(len(result.matches))]
+
+    cancel = threading.Event()
+    cancel.set()
+    result = service.run_search("^line", max_results=1000, time_budget=None, cancel=cancel)
+    assert result.cancelled and not result.timed_out
+
+    monkeypatch.setattr(search_cache_module, "entry_text", entry_text)
+    result = service.run_search("^line", max_results=1000, time_budget=None)
+    assert not result.truncated
+    assert result.matches == [f"line {i}" for i in range(400)]
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
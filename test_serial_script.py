@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+测试服务端命令脚本
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+import config
+import mcp_server
+from serial_script import run_script, validate_steps
+from service import SerialService
+
+BRING_UP = [
+    {"send": "dbg reboot"},
+    {"expect": "boot ok", "timeout": 2},
+    {"send": "AT+GMR"},
+    {"capture": r"AT version:(?P<ver>\S+)", "var": "version", "group": "ver"},
+    {"expect": "^OK$"},
+    {"sleep": 0.05},
+    {"send": "ECHO ${version}"},
+    {"expect": "^echo 2.2$", "timeout": 1},
+]
+
+
+def test_validate_steps():
+    """步骤格式、正则和捕获组在执行前检查"""
+    assert [kind for kind, _step in validate_steps(BRING_UP)] == [
+        "send", "expect", "send", "capture", "expect", "sleep", "send", "expect"]
+    for bad in [[], [{"send": "AT", "sleep": 1}], [{"wait": 1}], [{"sleep": -1}], [{"expect": "("}],
+                [{"capture": "x"}], [{"capture": "(x)", "var": "v", "group": 2}], [{"expect": "x", "timeout": 0}]]:
+        with pytest.raises(ValueError):
+            validate_steps(bad)
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="需要 Linux 伪终端")
+def test_run_script_against_pty_device(tmp_path, monkeypatch):
+    """整个流程在一次调用中完成: 捕获的变量可在后续发送中引用，超时的步骤使脚本停止"""
+    monkeypatch.setattr(config, "SCRIPTS_FILE", str(tmp_path / "scripts.json"))
+    master, slave = os.openpty()
+    os.set_blocking(master, False)
+    service = SerialService(max_log_lines=100, backend="asyncio")
+    service.show_timestamp = False
+    mcp_server.set_serial_service(service)
+    replies = {
+        b"dbg reboot": b"rebooting...\r\nboot ok\r\n",
+        b"AT+GMR": b"AT version:2.2\r\nOK\r\n",
+        b"ECHO 2.2": b"echo 2.2\r\n",
+    }
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        service.attach_loop(loop)
+        assert service.connect(os.ttyname(slave), 115200)
+
+        def device():
+            for command in os.read(master, 1024).split(b"\r\n"):
+                if command in replies:
+                    loop.call_later(0.01, os.write, master, replies[command])
+        loop.add_reader(master, device)
+        try:
+            result = await run_script(service, BRING_UP)
+            assert result["ok"] and result["variables"] == {"version": "2.2"}
+            assert [step["ok"] for step in result["steps"]] == [True] * len(BRING_UP)
+            assert result["steps"][3]["value"] == "2.2" and result["steps"][6]["sent"] == "ECHO 2.2"
+
+            failed = await run_script(service, [{"send": "AT"}, {"expect": "^OK$", "timeout": 0.1},
+                                                {"send": "never sent"}])
+            assert not failed["ok"] and failed["failed_step"] == 2 and len(failed["steps"]) == 2
+
+            saved = mcp_server.save_serial_script("bring-up", BRING_UP)
+            assert saved["status"] == "success"
+            assert [s["name"] for s in mcp_server.list_serial_scripts()["scripts"]] == ["AT Check", "Version",
+                                                                                          "bring-up"]
+            by_name = await mcp_server.run_serial_script(name="bring-up")
+            assert by_name["ok"] and by_name["variables"]["version"] == "2.2"
+            missing = await mcp_server.run_serial_script(name="nope")
+            assert missing["status"] == "error" and "bring-up" in missing["message"]
+        finally:
+            loop.remove_reader(master)
+            service.disconnect()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        os.close(master)
+        os.close(slave)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
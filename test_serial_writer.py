@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+测试串口写线程: 优先级队列、有界队列、发送间隔和统计
+"""
+
+import sys
+import threading
+import time
+
+from concurrent.futures import Future
+
+import pytest
+
+from serial_writer import SerialWriter
+
+
+def test_priorities_bound_and_close():
+    """写入阻塞时发送立即返回；交互发送越过排队中的批量发送；队列满时拒绝；关闭时取消未写出的发送"""
+    gate = threading.Event()
+    written = []
+
+    def slow_write(data):
+        gate.wait(5)
+        written.append(data)
+    writer = SerialWriter(slow_write, max_queue=3)
+    first = writer.submit(b"bulk 0", "bulk")
+    time.sleep(0.05)  # 写线程已取出第一条并阻塞在写入中
+    start = time.perf_counter()
+    queued = [writer.submit(b"bulk 1", "bulk"), writer.submit(b"bulk 2", "bulk"), writer.submit(b"AT", "interactive")]
+    assert time.perf_counter() - start < 0.05
+    rejected = writer.submit(b"bulk 3", "bulk")
+    assert isinstance(rejected.exception(), RuntimeError)
+    assert writer.stats()["queue_by_priority"] == {"interactive": 1, "normal": 0, "bulk": 2}
+    with pytest.raises(ValueError):
+        writer.submit(b"x", "urgent")
+
+    gate.set()
+    for future in [first] + queued:
+        future.result(1)
+    assert written == [b"bulk 0", b"AT", b"bulk 1", b"bulk 2"]
+    receipt = queued[2].result()
+    assert receipt.size == 2 and receipt.finished_ns >= receipt.started_ns
+    stats = writer.stats()
+    assert (stats["writes"], stats["bytes_written"], stats["rejected_sends"], stats["queue_depth"]) == (4, 20, 1, 0)
+
+    gate.clear()
+    writer.submit(b"stuck")
+    time.sleep(0.05)
+    pending = writer.submit(b"never")
+    gate.set()
+    writer.close()
+    assert isinstance(pending.exception(1), RuntimeError)
+    assert isinstance(writer.submit(b"late").exception(), RuntimeError)
+
+
+def test_byte_and_line_pacing():
+    """字节间隔逐字节写出，两次发送之间至少间隔 line_delay"""
+    chunks = []
+    writer = SerialWriter(lambda data: chunks.append((time.monotonic(), data)), byte_delay=0.01, line_delay=0.05)
+    futures = [writer.submit(b"abc"), writer.submit(b"d")]
+    for future in futures:
+        future.result(1)
+    writer.close()
+    assert [data for _t, data in chunks] == [b"a", b"b", b"c", b"d"]
+    assert chunks[2][0] - chunks[0][0] >= 0.02
+    assert chunks[3][0] - chunks[2][0] >= 0.05
+
+
+def test_future_writes_do_not_block_the_writer():
+    """写函数返回 Future 时写线程不等待它: 后续发送继续写出，Future 完成时才结束发送；关闭时结束未完成的发送"""
+    accepted = []
+
+    def deferred_write(data):
+        done = Future()
+        accepted.append((data, done))
+        return done
+    writer = SerialWriter(deferred_write)
+    futures = [writer.submit(b"one"), writer.submit(b"two"), writer.submit(b"three")]
+    deadline = time.monotonic() + 1
+    while len(accepted) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [data for data, _done in accepted] == [b"one", b"two", b"three"]
+    assert not any(future.done() for future in futures)
+
+    accepted[0][1].set_result(None)
+    accepted[1][1].set_exception(OSError("closed"))
+    assert futures[0].result(1).size == 3
+    assert isinstance(futures[1].exception(1), OSError)
+    stats = writer.stats()
+    assert (stats["writes"], stats["failed_writes"]) == (1, 1)
+
+    writer.close()
+    assert isinstance(futures[2].exception(1), RuntimeError)
+    accepted[2][1].set_result(None)  # 关闭后才完成的写入不再改变结果
+    assert isinstance(futures[2].exception(), RuntimeError)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+测试串口服务的接收处理: 按行批量发出信号、等待匹配新到达的行、发送命令并收集响应
+"""
+
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+import service as service_module
+from service import SerialService
+
+
+def test_line_batches_emitted_only_with_receivers():
+    """接收的行按时间片合并为一个信号发送，没有连接时不发送，hex 按需计算"""
+    service = SerialService(max_log_lines=100, signal_batch_interval=60)
+    service._handle_lines([b"boot"])
+    assert service._line_batch == []
+
+    batches = []
+    service.lines_received.connect(batches.append)
+    service._handle_lines([b"line 1"])
+    service._handle_lines([b"line 2", b"\xff\x01"])
+    assert [[r.text for r in batch] for batch in batches] == [["line 1"]]
+    service._flush_line_batch()
+    assert [r.text for r in batches[1]] == ["line 2", "[HEX] FF01"]
+    record = batches[1][0]
+    assert record._hex is None
+    assert record.hex == "6c696e652032"
+    assert len(service.get_log_buffer()) == 4
+
+
+def test_wait_for_pattern_checks_only_new_lines(monkeypatch):
+    """多个等待者由写入通知唤醒（包括其他线程的写入），每次只检查新到达的行，游标之前的行不会漏掉"""
+    service = SerialService(max_log_lines=1000)
+    service.show_timestamp = False
+    for i in range(500):
+        service.add_log_entry(f"old {i}")
+    service.add_log_entry("ready 0")
+    checked = []
+    entry_text = service_module.entry_text
+
+    def counting_entry_text(entry):
+        checked.append(entry.seq)
+        return entry_text(entry)
+    monkeypatch.setattr(service_module, "entry_text", counting_entry_text)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        waiters = [asyncio.ensure_future(service.wait_for_pattern("ready [12]", timeout=5)) for _ in range(20)]
+        missed = await service.wait_for_pattern("ready", timeout=0.05)
+        assert not missed.matched and missed.next_cursor == 501
+        assert (await service.wait_for_pattern("ready", timeout=1, since_cursor=400)).line == "ready 0"
+
+        def feed():
+            for i in range(100):
+                service.add_log_entry(f"noise {i}")
+            service.add_log_entry("ready 1")
+        loop.call_later(0.02, threading.Thread(target=feed).start)
+        results = await asyncio.gather(*waiters)
+        assert {(r.matched, r.line, r.seq) for r in results} == {(True, "ready 1", 601)}
+        assert checked.count(601) == 20 and max(checked.count(seq) for seq in range(501, 601)) <= 20
+        assert results[0].next_cursor == 602
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="需要 Linux 伪终端")
+def test_send_and_collect_returns_only_the_response_window():
+    """发送后只收集写入之后到达的行，到结束模式或空闲间隔为止，并给出首行和完成时间"""
+    master, slave = os.openpty()
+    os.set_blocking(master, False)
+    service = SerialService(max_log_lines=100, line_idle_timeout=0.05, backend="asyncio")
+    service.show_timestamp = False
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        service.attach_loop(loop)
+        assert service.connect(os.ttyname(slave), 115200)
+        os.write(master, b"old line\r\n")
+        assert await service.wait_for_data(timeout=1)
+
+        def device():
+            command = os.read(master, 1024)
+            if command == b"AT+GMR\r\n":
+                loop.call_later(0.05, os.write, master, b"AT version:2.2\r\nOK\r\nlater\r\n")
+            else:
+                loop.call_later(0.05, os.write, master, b"reminder 1\r\nreminder 2\r\n")
+        loop.add_reader(master, device)
+
+        response = await service.send_and_collect("AT+GMR", end_pattern="^(OK|ERROR)$", timeout=2)
+        assert response.lines == ["AT version:2.2", "OK"] and response.completed_by == "end_pattern"
+        assert 0.04 <= response.ttfb <= response.completion < 1
+
+        response = await service.send_and_collect("dbg remind all", idle_gap=0.2, timeout=2)
+        # 上一条命令之后的 "later" 在本次写入之前到达，不属于本次响应
+        assert response.lines == ["reminder 1", "reminder 2"] and response.completed_by == "idle"
+
+        response = await service.send_and_collect("silent", end_pattern="never", timeout=0.3)
+        assert response.completed_by == "timeout"
+        loop.remove_reader(master)
+        service.disconnect()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        os.close(master)
+        os.close(slave)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+测试按时间范围查询日志
+"""
+
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import search_cache as search_cache_module
+from log_store import monotonic_time_ns
+from service import SerialService
+from time_range import parse_time_range
+
+SECOND = 10 ** 9
+
+
+def test_parse_relative_and_absolute_ranges():
+    """相对时间、当天时刻和 ISO 日期时间都解析为单调时钟窗口"""
+    now = time.monotonic_ns()
+    assert parse_time_range("last_5min", now) == (now - 300 * SECOND, None)
+    assert parse_time_range("last 30s", now) == (now - 30 * SECOND, None)
+    assert parse_time_range("last_1.5h", now) == (now - 5400 * SECOND, None)
+
+    moment = datetime.now().replace(microsecond=0) - timedelta(minutes=1)
+    start, end = parse_time_range(f"{moment:%H:%M:%S}/")
+    assert end is None
+    assert abs(start - monotonic_time_ns(int(moment.timestamp()) * SECOND)) < 1000
+    start, end = parse_time_range(f"/{moment.isoformat()}")
+    assert start is None and end is not None
+
+    # 窗口包含当前时间（如 10:03 时的 "10:00/10:05"）时结束时刻不应被移到前一天
+    opened, closes = moment - timedelta(minutes=2), moment + timedelta(minutes=5)
+    start, end = parse_time_range(f"{opened:%H:%M:%S}/{closes:%H:%M:%S}")
+    assert start < time.monotonic_ns() < end
+    assert end - start == 7 * 60 * SECOND
+    start, end = parse_time_range("23:50/00:10")
+    assert end - start == 20 * 60 * SECOND and start < time.monotonic_ns()
+
+    for bad in ["last_5 parsecs", "yesterday", "/", "25:00/"]:
+        with pytest.raises(ValueError):
+            parse_time_range(bad)
+
+
+def test_time_window_search_scans_only_the_window(monkeypatch):
+    """时间窗口经二分查找换算为序号范围，搜索只检查窗口内的行（含温层），与缓存结果一致"""
+    service = SerialService(max_log_lines=200, log_warm_budget=1 << 20, log_search_index=False)
+    service.show_timestamp = False
+    now = time.monotonic_ns()
+    for i in range(1000):
+        # 每秒一行，与整秒边界错开半秒，避免窗口边界受测试执行耗时影响
+        service._append_log(f"tick {i}".encode(), timestamp_ns=now - (1000 - i) * SECOND + SECOND // 2)
+    assert service.get_log_stats()["warm_lines"] > 0
+
+    checked = []
+    entry_text = search_cache_module.entry_text
+
+    def counting_entry_text(entry):
+        checked.append(entry.seq)
+        return entry_text(entry)
+    monkeypatch.setattr(search_cache_module, "entry_text", counting_entry_text)
+
+    # 窗口落在温层中
+    assert service.search_logs("tick", 1000, time_range="last_950s") == [f"tick {i}" for i in range(50, 1000)]
+    checked.clear()
+    assert service.search_logs("tick", 1000, time_range="last_10s") == [f"tick {i}" for i in range(990, 1000)]
+    assert len(checked) == 10
+    assert service.get_recent_logs(3, time_range="last_10s") == ["tick 997", "tick 998", "tick 999"]
+
+    # 有完整的缓存结果后直接截取
+    service.search_logs("tick", 1)
+    checked.clear()
+    assert service.search_logs("tick", 1000, time_range="last_10s") == [f"tick {i}" for i in range(990, 1000)]
+    assert checked == []
+
+    assert service.search_logs("tick", time_range="last_0.5s") == []
+    with pytest.raises(ValueError):
+        service.search_logs("tick", time_range="soon")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,75 @@
+import re
+import time
+from datetime import datetime, timedelta
+
+from log_store import monotonic_time_ns
+
+_UNITS_NS = {
+    "ms": 10 ** 6,
+    "s": 10 ** 9, "sec": 10 ** 9, "secs": 10 ** 9, "second": 10 ** 9, "seconds": 10 ** 9,
+    "m": 60 * 10 ** 9, "min": 60 * 10 ** 9, "mins": 60 * 10 ** 9, "minute": 60 * 10 ** 9, "minutes": 60 * 10 ** 9,
+    "h": 3600 * 10 ** 9, "hr": 3600 * 10 ** 9, "hour": 3600 * 10 ** 9, "hours": 3600 * 10 ** 9,
+    "d": 86400 * 10 ** 9, "day": 86400 * 10 ** 9, "days": 86400 * 10 ** 9,
+}
+_RELATIVE_RE = re.compile(r'^last[_\s]*(\d+(?:\.\d+)?)\s*([a-z]+)$', re.IGNORECASE)
+_TIME_OF_DAY_RE = re.compile(r'^\d{1,2}:\d{2}(:\d{2}(\.\d{1,6})?)?$')
+
+
+def parse_time_range(text, now_ns=None):
+    """
+    解析时间范围，返回单调时钟纳秒 (start_ns, end_ns)，None 表示该端不限，窗口为 [start, end)。
+    - 相对时间: "last_5min"、"last_30s"、"last_2h"、"last_1d"（单位 ms/s/min/h/d 及其全称）
+    - 绝对时间: "<开始>/<结束>"，两端为 ISO 8601 日期时间（如 2026-10-17T10:00:00）
+      或当天的 HH:MM[:SS[.ffffff]]（开始时刻晚于当前时间时视为前一天，结束时刻取开始之后最近的该时刻，
+      如 "23:50/00:10" 跨越午夜），任一端可以省略，如 "10:00/"；
+      只给出一个时间时表示从该时间到现在。
+    无法解析时抛出 ValueError。
+    """
+    if now_ns is None:
+        now_ns = time.monotonic_ns()
+    text = text.strip()
+    match = _RELATIVE_RE.match(text)
+    if match:
+        unit = _UNITS_NS.get(match.group(2).lower())
+        if unit is None:
+            raise ValueError(f"无效的时间范围: {text!r}（未知的时间单位 {match.group(2)!r}）")
+        return now_ns - int(float(match.group(1)) * unit), None
+    start_text, _sep, end_text = text.partition("/")
+    if not start_text.strip() and not end_text.strip():
+        raise ValueError(f"无效的时间范围: {text!r}")
+    now = datetime.now()
+    start, start_clock = _parse_point(start_text, text, now)
+    end, end_clock = _parse_point(end_text, text, now)
+    if start_clock and start > now:
+        start -= timedelta(days=1)
+    if end_clock:
+        if start is not None:
+            # 结束时刻相对于开始时间确定日期（跨午夜时为次日），不单独按当前时间回退
+            end = datetime.combine(start.date(), end.time())
+            if end <= start:
+                end += timedelta(days=1)
+        elif end > now:
+            end -= timedelta(days=1)
+    return _monotonic_ns(start), _monotonic_ns(end)
+
+
+def _parse_point(text, whole, now):
+    """解析一端的时间，返回 (本地时间的 datetime, 是否为当天时刻)；当天时刻先按今天的日期组合"""
+    text = text.strip()
+    if not text:
+        return None, False
+    try:
+        if _TIME_OF_DAY_RE.match(text):
+            clock = datetime.strptime(text, "%H:%M:%S.%f" if "." in text else
+                                      "%H:%M:%S" if text.count(":") == 2 else "%H:%M").time()
+            return datetime.combine(now.date(), clock), True
+        point = datetime.fromisoformat(text)
+        if point.tzinfo is not None:
+            point = point.astimezone().replace(tzinfo=None)
+        return point, False
+    except ValueError:
+        raise ValueError(f"无效的时间范围: {whole!r}（无法解析时间 {text!r}）")
+
+
+def _monotonic_ns(point):
+    return None if point is None else monotonic_time_ns(int(point.timestamp() * 1e9))